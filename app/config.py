@@ -1,4 +1,5 @@
 from dotenv import load_dotenv
+from pathlib import Path
 import os
 
 load_dotenv()
@@ -8,5 +9,115 @@ class Config:
     CHAT_ID_TRADES = os.getenv('CHAT_IDTELEGRAM')
     CHAT_ID_REPORTS = os.getenv('CHAT_ID_REPORTS')
     DATABASE_URL = os.getenv('DATABASE_URLMYSQL')
+    # Хранилище сигналов (SQLAlchemy URL); по умолчанию SQLite в DATA_DIR
+    SIGNAL_STORE_URL = os.getenv('SIGNAL_STORE_URL')
     ID_TABLES = os.getenv('ID_TABLES')
     COINMARKETCAP_API_KEY = os.getenv('COINMARKETCAP_API_KEY')
+
+    # Каталог локальных данных (планировщик, очереди, кэши)
+    DATA_DIR = Path(os.getenv('DATA_DIR', Path(__file__).parent.parent / 'data'))
+
+    # Общий HTTP-клиент для MEXC, CoinMarketCap и Telegram
+    HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '10'))
+    HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', '50'))
+    HTTP_MAX_KEEPALIVE = int(os.getenv('HTTP_MAX_KEEPALIVE', '20'))
+    HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '60'))
+    HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', '2'))
+    HTTP_BACKOFF = float(os.getenv('HTTP_BACKOFF', '0.5'))
+    HTTP_MAX_RETRY_AFTER = float(os.getenv('HTTP_MAX_RETRY_AFTER', '30'))
+    HTTP_MAX_BACKOFF = float(os.getenv('HTTP_MAX_BACKOFF', '10'))
+
+    # Автоматы защиты внешних сервисов: размыкание после N ошибок подряд, пробный вызов через таймаут
+    BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+    BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', '10'))
+    BREAKER_MAX_RESET_TIMEOUT = float(os.getenv('BREAKER_MAX_RESET_TIMEOUT', '120'))
+    # Бюджет повторов: доля от числа вызовов и запас
+    RETRY_BUDGET_RATIO = float(os.getenv('RETRY_BUDGET_RATIO', '0.2'))
+    RETRY_BUDGET_MAX = float(os.getenv('RETRY_BUDGET_MAX', '10'))
+    # Последняя известная цена MEXC используется при недоступности API, если она не старше, секунд
+    PRICE_STALE_MAX_AGE = float(os.getenv('PRICE_STALE_MAX_AGE', '300'))
+
+    # Окно свежести кэша цен MEXC в секундах
+    PRICE_CACHE_TTL = float(os.getenv('PRICE_CACHE_TTL', '1.0'))
+
+    # Интервальные проверки одного тика читают цены из общего bulk-снимка MEXC
+    PRICE_SNAPSHOT_MODE = os.getenv('PRICE_SNAPSHOT_MODE', 'true').lower() == 'true'
+    PRICE_SNAPSHOT_TTL = float(os.getenv('PRICE_SNAPSHOT_TTL', '5'))
+
+    # Планировщик интервальных проверок
+    SCHEDULER_BATCH_SIZE = int(os.getenv('SCHEDULER_BATCH_SIZE', '500'))
+
+    # Восстановление проверок, пропущенных за время простоя, по минутным свечам MEXC
+    RECOVERY_ENABLED = os.getenv('RECOVERY_ENABLED', 'true').lower() == 'true'
+    # Границы старше этого не восстанавливаются, секунд
+    RECOVERY_MAX_AGE = float(os.getenv('RECOVERY_MAX_AGE', str(7 * 24 * 60 * 60)))
+    RECOVERY_CONCURRENCY = int(os.getenv('RECOVERY_CONCURRENCY', '8'))
+    RECOVERY_LEASE_TTL = float(os.getenv('RECOVERY_LEASE_TTL', '600'))
+
+    # Отложенная пакетная запись в Google Sheets
+    SHEETS_FLUSH_INTERVAL = float(os.getenv('SHEETS_FLUSH_INTERVAL', '2'))
+    SHEETS_MAX_PENDING = int(os.getenv('SHEETS_MAX_PENDING', '5000'))
+    # true - форматировать каждую ячейку (в пакете), false - правила на уровне листа
+    SHEETS_CELL_FORMATS = os.getenv('SHEETS_CELL_FORMATS', 'false').lower() == 'true'
+
+    # Кэш рыночных данных CoinMarketCap (капитализация и объем меняются медленно)
+    CMC_CACHE_TTL = float(os.getenv('CMC_CACHE_TTL', '300'))
+    CMC_CACHE_SIZE = int(os.getenv('CMC_CACHE_SIZE', '2000'))
+    CMC_BATCH_WINDOW = float(os.getenv('CMC_BATCH_WINDOW', '0.05'))
+    CMC_MAP_REFRESH_INTERVAL = float(os.getenv('CMC_MAP_REFRESH_INTERVAL', str(6 * 60 * 60)))
+
+    # Список пар MEXC (exchangeInfo) для проверки тикеров: как часто обновлять, секунд
+    MEXC_SYMBOLS_REFRESH_INTERVAL = float(os.getenv('MEXC_SYMBOLS_REFRESH_INTERVAL', str(60 * 60)))
+
+    # Очередь исходящих сообщений Telegram (лимиты Bot API: ~30/с всего, 1/с в чат, 20/мин в группу);
+    # лимиты на весь бот, при WEB_WORKERS > 1 делятся между воркерами
+    TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))
+    TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', '1'))
+    TELEGRAM_GROUP_RATE = float(os.getenv('TELEGRAM_GROUP_RATE', str(20 / 60)))
+    TELEGRAM_QUEUE_SIZE = int(os.getenv('TELEGRAM_QUEUE_SIZE', '1000'))
+    TELEGRAM_MERGE = os.getenv('TELEGRAM_MERGE', 'true').lower() == 'true'
+    TELEGRAM_MERGE_MAX = int(os.getenv('TELEGRAM_MERGE_MAX', '5'))
+
+    # Быстрый ответ вебхука: алерт пишется в локальную очередь и обрабатывается в фоне
+    INGEST_MODE = os.getenv('INGEST_MODE', 'false').lower() == 'true'
+    INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '4'))
+    INGEST_MAX_ATTEMPTS = int(os.getenv('INGEST_MAX_ATTEMPTS', '5'))
+
+    # Дедлайны этапов обработки алерта в секундах
+    STAGE_TIMEOUT_CMC = float(os.getenv('STAGE_TIMEOUT_CMC', '2'))
+    STAGE_TIMEOUT_MEXC = float(os.getenv('STAGE_TIMEOUT_MEXC', '5'))
+    STAGE_TIMEOUT_STORE = float(os.getenv('STAGE_TIMEOUT_STORE', '5'))
+
+    # Подавление дублей алертов: окно хранения отпечатков (общие для воркеров, в leases.db)
+    IDEMPOTENCY_WINDOW = float(os.getenv('IDEMPOTENCY_WINDOW', '60'))
+
+    # Потоковые цены для интервальных проверок: '' - выключено, 'mexc' - WebSocket MEXC, 'local' - локальная замена
+    PRICE_FEED = os.getenv('PRICE_FEED', '').lower()
+    PRICE_FEED_URL = os.getenv('PRICE_FEED_URL', 'wss://wbs-api.mexc.com/ws')
+    # Тик старше этого считается устаревшим, и проверка берет цену через REST
+    PRICE_FEED_MAX_AGE = float(os.getenv('PRICE_FEED_MAX_AGE', '60'))
+
+    # Пакетный вебхук: максимальное число алертов и размер тела (байт) в одном запросе
+    BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '500'))
+    BATCH_MAX_BYTES = int(os.getenv('BATCH_MAX_BYTES', str(1024 * 1024)))
+
+    # Несколько воркеров uvicorn или реплик на общем DATA_DIR: работа распределяется арендами в SQLite
+    WEB_WORKERS = int(os.getenv('WEB_WORKERS', '1'))
+    SCHEDULER_LEASE_TTL = float(os.getenv('SCHEDULER_LEASE_TTL', '120'))
+    SCHEDULER_SYNC_INTERVAL = float(os.getenv('SCHEDULER_SYNC_INTERVAL', '5'))
+    INGEST_LEASE_TTL = float(os.getenv('INGEST_LEASE_TTL', '300'))
+
+    # Журнал: запись через очередь в фоновом потоке, ротация по размеру или времени
+    # При WEB_WORKERS > 1 файл не ведется, журнал пишется только в консоль
+    LOG_FILE = Path(os.getenv('LOG_FILE', Path(__file__).parent.parent / 'webhooks.log'))
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+    LOG_JSON = os.getenv('LOG_JSON', 'true').lower() == 'true'
+    LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+    LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+    # Например 'midnight' - ротация по времени вместо размера
+    LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN', '')
+    # Каждая N-я запись ниже WARNING для частых логгеров: 'логгер=N,логгер=N'
+    LOG_SAMPLE = os.getenv('LOG_SAMPLE', 'app.services.mexc=100,app.services.scheduler=100')
+
+    # Статистика сигналов (/stats): как часто дочитывать результаты других воркеров, секунд
+    STATS_SYNC_INTERVAL = float(os.getenv('STATS_SYNC_INTERVAL', '60'))
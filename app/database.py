@@ -0,0 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from app.config import Config
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+def _database_url() -> str:
+    if Config.SIGNAL_STORE_URL:
+        return Config.SIGNAL_STORE_URL
+    # Встроенное хранилище по умолчанию
+    Config.DATA_DIR.mkdir(parents=True, exist_ok=True)
+    return f"sqlite:///{Config.DATA_DIR / 'signals.db'}"
+
+
+engine = create_engine(_database_url(), pool_pre_ping=True)
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
+
+# Запись в хранилище выполняется в одном отдельном потоке: не блокирует event loop
+# и не создает конкуренции за блокировку SQLite
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="signal-store")
+
+
+def init_db():
+    from app import models  # noqa: F401  регистрирует модели в Base.metadata
+    Base.metadata.create_all(bind=engine)
+    # Хранилища, созданные до появления номера изменения у результатов
+    if "seq" not in _columns("interval_results"):
+        try:
+            with engine.begin() as connection:
+                connection.execute(text("ALTER TABLE interval_results ADD COLUMN seq INTEGER NOT NULL DEFAULT 0"))
+                connection.execute(text("UPDATE interval_results SET seq = id"))
+                connection.execute(text("CREATE INDEX ix_interval_results_seq ON interval_results (seq)"))
+        except DBAPIError:
+            # Соседний воркер успел выполнить миграцию первым
+            if "seq" not in _columns("interval_results"):
+                raise
+
+
+def _columns(table: str) -> set:
+    return {column["name"] for column in inspect(engine).get_columns(table)}
+
+
+async def run_in_session(func, *args):
+    """Выполняет func(db, *args) в отдельной сессии в потоке хранилища"""
+    def _call():
+        with SessionLocal() as db:
+            return func(db, *args)
+
+    return await asyncio.get_running_loop().run_in_executor(_executor, _call)
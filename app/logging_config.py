@@ -0,0 +1,173 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Optional
+
+from app.config import Config
+
+# Идентификатор алерта, которым помечаются все записи журнала при его обработке
+correlation_id: ContextVar[str] = ContextVar('correlation_id', default='-')
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(correlation_id)s] %(message)s'
+
+# Библиотеки, которые на INFO пишут строку на каждый запрос
+NOISY_LOGGERS = ('httpx', 'httpcore', 'apscheduler.executors.default')
+
+
+def new_correlation_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+class CorrelationIdMiddleware:
+    """ASGI-прослойка: идентификатор из X-Request-ID или новый на каждый запрос,
+    возвращается в заголовке ответа"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        header = dict(scope["headers"]).get(b"x-request-id")
+        value = header.decode('latin-1')[:64] if header else new_correlation_id()
+        token = correlation_id.set(value)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", []).append((b"x-request-id", value.encode('latin-1')))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            correlation_id.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Добавляет идентификатор алерта; выполняется в потоке вызова, где виден контекст"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.correlation_id = correlation_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает каждую N-ю запись ниже WARNING для указанных логгеров.
+    Счет ведется по шаблону сообщения, поэтому редкие строки не теряются из-за частых"""
+
+    MAX_KEYS = 10000
+
+    def __init__(self, rates: Dict[str, int]):
+        super().__init__()
+        self.rates = rates
+        self._resolved: Dict[str, int] = {}
+        self._counts: Dict[tuple, int] = {}
+
+    def _rate(self, name: str) -> int:
+        rate = self._resolved.get(name)
+        if rate is None:
+            # Ближайший настроенный предок: app.services задает частоту для app.services.mexc
+            rate = 1
+            for prefix, value in self.rates.items():
+                if name == prefix or name.startswith(prefix + '.'):
+                    rate = value
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        if rate <= 1:
+            return True
+        if len(self._counts) > self.MAX_KEYS:
+            self._counts.clear()
+        key = (record.name, record.msg)
+        count = self._counts.get(key, 0)
+        self._counts[key] = count + 1
+        return count % rate == 0
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-запись на строку"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "correlation_id": getattr(record, 'correlation_id', '-'),
+        }
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Передает в очередь готовое сообщение, а трассировку - отдельно, чтобы форматтер
+    записи сам решил, как ее вывести"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+def parse_sample_rates(value: str) -> Dict[str, int]:
+    """'app.services.mexc=100,app.services.scheduler=10' -> {логгер: N}"""
+    rates = {}
+    for item in value.split(','):
+        name, _, rate = item.strip().partition('=')
+        if name and rate:
+            rates[name] = max(1, int(rate))
+    return rates
+
+
+def _file_handler(log_file: Path) -> logging.Handler:
+    if Config.LOG_ROTATE_WHEN:
+        return logging.handlers.TimedRotatingFileHandler(
+            log_file, when=Config.LOG_ROTATE_WHEN, backupCount=Config.LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+    return logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=Config.LOG_MAX_BYTES, backupCount=Config.LOG_BACKUP_COUNT, encoding='utf-8'
+    )
+
+
+def setup_logging(log_file: Optional[Path]) -> logging.handlers.QueueListener:
+    """Корневой логгер пишет только в очередь; форматирование в JSON, вывод и ротацию
+    файла выполняет фоновый поток QueueListener, вне event loop. Без log_file - только консоль"""
+    formatter = JsonFormatter() if Config.LOG_JSON else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if log_file is not None:
+        handlers.append(_file_handler(log_file))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(parse_sample_rates(Config.LOG_SAMPLE)))
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(Config.LOG_LEVEL)
+    for name in NOISY_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # Дописывает оставшиеся в очереди записи при выходе процесса
+    atexit.register(listener.stop)
+    return listener
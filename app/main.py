@@ -1,8 +1,28 @@
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
-from routers.webhook import router as webhook_router
+from routers.webhook import (
+    router as webhook_router, process_interval_jobs, process_alert, recover_missed_intervals, cmc, symbol_index,
+    idempotency,
+)
+from routers.metrics import router as metrics_router
+from routers.stats import router as stats_router
 from app.config import Config
+from app.logging_config import CorrelationIdMiddleware, setup_logging
+from app.services.http import http_client
+from app.services.metrics import monitor_event_loop
+from app.services.ingest import IngestQueue, Outbox
+from app.services.leases import LeaseStore
+from app.services.recovery import RECOVERY_LEASE
+from app.services.trading import create_report_scheduler
+from app.database import init_db
+from app.services.telegram import telegram_queue
+from app.services.scheduler import IntervalScheduler
+from app.services.stats import signal_stats
+from app.services.price_feed import LocalFeedSource, MexcFeedSource, PriceFeed
+from app.services.sheets import SheetMirror, SheetWriter, ensure_sheet_formats
+import asyncio
 import logging
+import time
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 import os
@@ -11,15 +31,9 @@ from pathlib import Path
 # Базовый путь проекта
 BASE_DIR = Path(__file__).parent.parent
 
-# Настройка логирования (только в main.py)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler(BASE_DIR / 'webhooks.log')
-    ]
-)
+# Настройка логирования (только в main.py): очередь и фоновый поток записи с ротацией.
+# Воркеры uvicorn ротировали бы один файл независимо друг от друга - при нескольких только консоль
+setup_logging(Config.LOG_FILE if Config.WEB_WORKERS == 1 else None)
 logger = logging.getLogger(__name__)
 
 # Конфигурация Google Sheets
@@ -68,6 +82,10 @@ def init_google_sheets():
             sheet.insert_row(COLUMN_HEADERS, index=1)
             logger.info("Created column headers in Google Sheet")
 
+        # Процентный формат и цвета колонок изменения цены задаются один раз на весь лист
+        if not Config.SHEETS_CELL_FORMATS:
+            ensure_sheet_formats(sheet)
+
         return client, sheet
 
     except Exception as e:
@@ -75,25 +93,124 @@ def init_google_sheets():
         raise
 
 
+def create_price_feed():
+    """Поток цен по настройке PRICE_FEED или None, если он выключен"""
+    if Config.PRICE_FEED == 'mexc':
+        return PriceFeed(MexcFeedSource(Config.PRICE_FEED_URL))
+    if Config.PRICE_FEED == 'local':
+        return PriceFeed(LocalFeedSource(tick_interval=1.0))
+    return None
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Управление жизненным циклом приложения"""
     try:
+        # Общий пул HTTP-соединений для MEXC, CoinMarketCap и Telegram
+        await http_client.start()
+        app.state.http = http_client
+
+        # Независимые полосы отправки для чата сделок и чата отчетов;
+        # сообщения хранятся в базе очереди алертов до доставки
+        app.state.outbox = Outbox(Config.DATA_DIR / "ingest.db", lease_ttl=Config.INGEST_LEASE_TTL)
+        await telegram_queue.start([Config.CHAT_ID_TRADES, Config.CHAT_ID_REPORTS], outbox=app.state.outbox)
+
+        # Аренды общей работы между воркерами и репликами с общим DATA_DIR
+        app.state.leases = LeaseStore(Config.DATA_DIR / "leases.db")
+
+        # Карта монет CMC со снимка на диске, дальше обновляется в фоне одним из воркеров
+        await cmc.coin_map.start(refresh_interval=Config.CMC_MAP_REFRESH_INTERVAL, leases=app.state.leases)
+
+        # Список пар MEXC со снимка на диске: неизвестные тикеры отклоняются до запросов к API
+        await symbol_index.start(refresh_interval=Config.MEXC_SYMBOLS_REFRESH_INTERVAL, leases=app.state.leases)
+
+        # Локальное хранилище сигналов и ежедневный отчет по его счетчикам
+        init_db()
+        app.state.report_scheduler = create_report_scheduler(app.state.leases)
+        app.state.report_scheduler.start()
+
         client, sheet = init_google_sheets()
         app.state.google_sheets = client
         app.state.sheet = sheet
         logger.info("Google Sheets initialized successfully")
 
         app.state.background_tasks = set()
-        app.state.update_tasks = {}
+        # Задержка event loop - первый признак блокирующего кода в обработчиках
+        app.state.background_tasks.add(asyncio.create_task(monitor_event_loop()))
+
+        # Колонки статистики сигналов: прогрев из хранилища, дальше дочитывание новых результатов
+        await signal_stats.sync()
+        logger.info("Signal stats loaded: %s results", len(signal_stats))
+        app.state.stats = signal_stats
+        app.state.background_tasks.add(asyncio.create_task(signal_stats.run(Config.STATS_SYNC_INTERVAL)))
+
+        # Локальная копия строк листа: номера строк и данные без чтения таблицы на каждый сигнал
+        app.state.sheet_mirror = SheetMirror(sheet)
+        app.state.sheet_mirror.load()
+
+        # Буфер отложенной записи интервальных результатов в таблицу
+        app.state.sheet_writer = SheetWriter(
+            sheet,
+            mirror=app.state.sheet_mirror,
+            flush_interval=Config.SHEETS_FLUSH_INTERVAL,
+            max_pending=Config.SHEETS_MAX_PENDING,
+        )
+        await app.state.sheet_writer.start()
+
+        # Необязательный поток цен: интервальные проверки читают последнюю цену без запросов
+        app.state.price_feed = create_price_feed()
+        if app.state.price_feed is not None:
+            await app.state.price_feed.start()
+
+        # Единый планировщик интервальных проверок (переживает перезапуск)
+        app.state.scheduler = IntervalScheduler(
+            Config.DATA_DIR / "scheduler.db",
+            handler=lambda jobs: process_interval_jobs(app.state.sheet_writer, jobs, app.state.price_feed),
+            batch_size=Config.SCHEDULER_BATCH_SIZE,
+            price_feed=app.state.price_feed,
+            lease_ttl=Config.SCHEDULER_LEASE_TTL,
+            sync_interval=Config.SCHEDULER_SYNC_INTERVAL,
+        )
+        # Проверки, срок которых прошел во время простоя, не выполняются по текущей цене.
+        # Пропуск выполняет один воркер под арендой восстановления, а не каждый запускающийся
+        if Config.RECOVERY_ENABLED and app.state.leases.acquire(RECOVERY_LEASE, Config.RECOVERY_LEASE_TTL):
+            try:
+                app.state.scheduler.skip_missed(time.time())
+            finally:
+                app.state.leases.release(RECOVERY_LEASE)
+        await app.state.scheduler.start()
+        if Config.RECOVERY_ENABLED:
+            # Пустые ячейки интервалов заполняются по свечам MEXC в фоне
+            app.state.background_tasks.add(asyncio.create_task(recover_missed_intervals(app)))
+
+        # Надежная очередь входящих алертов; незавершенные после падения обрабатываются заново
+        app.state.ingest = IngestQueue(
+            Config.DATA_DIR / "ingest.db",
+            handler=lambda data: process_alert(app, data),
+            workers=Config.INGEST_WORKERS,
+            max_attempts=Config.INGEST_MAX_ATTEMPTS,
+            lease_ttl=Config.INGEST_LEASE_TTL,
+        )
+        await app.state.ingest.start()
 
         yield
 
         for task in app.state.background_tasks:
             task.cancel()
-        for task in app.state.update_tasks.values():
-            task.cancel()
+        await app.state.ingest.stop()
+        await app.state.scheduler.stop()
+        if app.state.price_feed is not None:
+            await app.state.price_feed.stop()
+        await app.state.sheet_writer.stop()
+        await cmc.coin_map.stop()
+        await symbol_index.stop()
+        app.state.report_scheduler.shutdown(wait=False)
+        app.state.leases.close()
+        idempotency.close()
+        await telegram_queue.stop()
+        app.state.outbox.close()
+
+        await http_client.close()
 
     except Exception as e:
         logger.critical(f"Application startup failed: {str(e)}")
@@ -106,8 +223,15 @@ app = FastAPI(
     title="TradingView Webhook Processor"
 )
 
+app.add_middleware(CorrelationIdMiddleware)
 app.include_router(webhook_router)
+app.include_router(metrics_router)
+app.include_router(stats_router)
 
 if __name__ == '__main__':
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=5000)
\ No newline at end of file
+    if Config.WEB_WORKERS > 1:
+        # Несколько процессов требуют строку импорта приложения
+        uvicorn.run("main:app", host="0.0.0.0", port=5000, workers=Config.WEB_WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=5000)
\ No newline at end of file
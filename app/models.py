@@ -0,0 +1,59 @@
+from datetime import date, datetime
+from typing import Optional
+from sqlalchemy import Date, DateTime, Float, ForeignKey, Index, Integer, String, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+from app.database import Base
+
+
+class Signal(Base):
+    """Сигнал TradingView с ценой входа"""
+    __tablename__ = "signals"
+    __table_args__ = (
+        Index("ix_signals_symbol_time", "symbol", "signal_time"),
+        Index("ix_signals_action_time", "action", "signal_time"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    symbol: Mapped[str] = mapped_column(String(32))
+    action: Mapped[str] = mapped_column(String(16))
+    entry_price: Mapped[float] = mapped_column(Float)
+    signal_time: Mapped[datetime] = mapped_column(DateTime)  # UTC
+    sheet_row: Mapped[Optional[int]] = mapped_column(Integer, index=True)
+
+    results: Mapped[list["IntervalResult"]] = relationship(back_populates="signal")
+
+
+class IntervalResult(Base):
+    """Цена закрытия и изменение цены сигнала через 15m/1h/4h/1d"""
+    __tablename__ = "interval_results"
+    __table_args__ = (UniqueConstraint("signal_id", "interval", name="uq_interval_results_signal_interval"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    signal_id: Mapped[int] = mapped_column(ForeignKey("signals.id"))
+    interval: Mapped[str] = mapped_column(String(8))
+    close_price: Mapped[float] = mapped_column(Float)
+    change_pct: Mapped[float] = mapped_column(Float)
+    recorded_at: Mapped[datetime] = mapped_column(DateTime)  # UTC
+    # Номер изменения: растет при каждой вставке и обновлении, по нему дочитывает статистика
+    seq: Mapped[int] = mapped_column(Integer, index=True, default=0)
+
+    signal: Mapped[Signal] = relationship(back_populates="results")
+
+
+class Counter(Base):
+    """Счетчики сигналов за день (по московскому времени), обновляются при каждом сигнале"""
+    __tablename__ = "daily_counters"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    buy_count: Mapped[int] = mapped_column(Integer, default=0)
+    sell_count: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class DailyReport(Base):
+    __tablename__ = "daily_reports"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    report_date: Mapped[date] = mapped_column(Date, unique=True)
+    buy_count: Mapped[int] = mapped_column(Integer)
+    sell_count: Mapped[int] = mapped_column(Integer)
+    created_at: Mapped[datetime] = mapped_column(DateTime)
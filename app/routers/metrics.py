@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import PlainTextResponse
+from app.services.breaker import STATE_VALUES, breakers
+from app.services.metrics import REGISTRY, CIRCUIT_STATE, INTERVAL_JOBS_PENDING, QUEUE_DEPTH
+from app.services.telegram import telegram_queue
+
+router = APIRouter()
+
+
+def collect_state(app):
+    """Глубины очередей читаются в момент сбора, а не на каждом изменении"""
+    state = app.state
+    if hasattr(state, 'scheduler'):
+        INTERVAL_JOBS_PENDING.set(state.scheduler.pending)
+    QUEUE_DEPTH.set(telegram_queue.stats()["depth"], ("telegram",))
+    if hasattr(state, 'sheet_writer'):
+        QUEUE_DEPTH.set(state.sheet_writer.pending, ("sheets",))
+    if hasattr(state, 'ingest'):
+        QUEUE_DEPTH.set(state.ingest.stats()["pending"], ("ingest",))
+    for service, breaker in breakers.stats().items():
+        CIRCUIT_STATE.set(STATE_VALUES[breaker["state"]], (service,))
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics(request: Request):
+    """Метрики в текстовом формате Prometheus"""
+    collect_state(request.app)
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
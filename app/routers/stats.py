@@ -0,0 +1,28 @@
+from datetime import datetime
+from typing import Literal, Optional
+
+from fastapi import APIRouter, HTTPException
+
+from app.services.stats import ACTIONS, signal_stats
+
+router = APIRouter()
+
+
+@router.get("/stats")
+async def stats(
+    interval: Optional[str] = None,
+    symbol: Optional[str] = None,
+    action: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    group_by: Optional[Literal['symbol', 'action']] = None,
+):
+    """Результативность сигналов по интервалам за окно времени сигнала [start, end]"""
+    if interval is not None and interval not in signal_stats.intervals:
+        raise HTTPException(status_code=422, detail=f"Unknown interval, expected one of {signal_stats.intervals}")
+    if action is not None and action.lower() not in ACTIONS:
+        raise HTTPException(status_code=422, detail=f"Unknown action, expected one of {list(ACTIONS)}")
+    return {
+        "results": len(signal_stats),
+        "intervals": signal_stats.query(interval, symbol, action, start, end, group_by),
+    }
@@ -1,267 +1,678 @@
 from fastapi import APIRouter, Request, HTTPException, BackgroundTasks
-from datetime import datetime, timedelta
-from typing import Dict
+from fastapi.responses import JSONResponse
+from datetime import datetime
+from typing import Dict, List, Optional
 import asyncio
 import logging
-from app.services.telegram import TelegramBot
+import time
+from app.services.telegram import telegram_queue
+from app.services.trading import record_signal, record_signals, record_interval_results
+from app.database import run_in_session
 from app.services.cmc import CoinMarketCapService
+from app.services.mexc import MexcService
+from app.services.breaker import CircuitOpenError, breakers
+from app.services.symbols import SymbolIndex
+from app.services.price_feed import PriceFeed
+from app.services.scheduler import INTERVALS, IntervalJob
+from app.services.recovery import RECOVERY_LEASE, fetch_boundary_prices, find_missed_checks
+from app.services.idempotency import IdempotencyCache
+from app.services.batch import BatchTooLarge, InvalidItem, iter_alerts
+from app.services.metrics import WEBHOOK_STAGE_SECONDS
+from app.services.stats import signal_stats
+from app.services.sheets import SheetWriter, PERCENT_FORMAT, GREEN, RED
+from gspread.utils import rowcol_to_a1
 from app.config import Config
 import pytz
-import requests
+import httpx
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
-cmc = CoinMarketCapService(api_key=Config.COINMARKETCAP_API_KEY)
-
-# Настройки Google Sheets
-SPREADSHEET_ID = Config.ID_TABLES  # ID вашей Google Таблицы
-MEXC_API_URL = "https://api.mexc.com/api/v3"
-
-update_tasks: Dict[str, asyncio.Task] = {}
+cmc = CoinMarketCapService(
+    api_key=Config.COINMARKETCAP_API_KEY,
+    map_snapshot_path=Config.DATA_DIR / "cmc_map.json.gz",
+    cache_ttl=Config.CMC_CACHE_TTL,
+    cache_size=Config.CMC_CACHE_SIZE,
+    batch_window=Config.CMC_BATCH_WINDOW,
+)
+idempotency = IdempotencyCache(Config.DATA_DIR / "leases.db", window=Config.IDEMPOTENCY_WINDOW)
+mexc = MexcService(cache_ttl=Config.PRICE_CACHE_TTL, snapshot_ttl=Config.PRICE_SNAPSHOT_TTL)
+symbol_index = SymbolIndex(Config.DATA_DIR / "mexc_symbols.json.gz")
+
+
+def stale_price(symbol: str, error: Exception) -> Optional[float]:
+    """Последняя известная цена, если MEXC недоступен (цепь разомкнута, сеть, 5xx)"""
+    if isinstance(error, httpx.HTTPStatusError) and error.response.status_code < 500:
+        return None
+    price = mexc.last_price(symbol, Config.PRICE_STALE_MAX_AGE)
+    if price is not None:
+        logger.info("MEXC unavailable (%s), using last known price for %s", error, symbol)
+    return price
 
 
 async def get_mexc_price(symbol: str) -> float:
-    """Получаем текущую цену с MEXC"""
+    """Получаем текущую цену с MEXC (через кэш с объединением одновременных запросов).
+    При недоступном MEXC - последняя известная цена, если она не устарела"""
     try:
-        # Очистка и валидация символа
-        clean_symbol = symbol.upper().strip()
-        if not clean_symbol:
-            raise ValueError("Empty symbol provided")
-
-        # Формируем торговую пару (обратите внимание на отсутствие подчеркивания)
-        trading_pair = f"{clean_symbol}USDT"
-
-        # Выполняем запрос
-        response = requests.get(
-            f"{MEXC_API_URL}/ticker/price",
-            params={"symbol": trading_pair},
-            timeout=10  # Увеличил таймаут для надежности
-        )
-
-        # Логируем URL для отладки
-        logger.debug(f"MEXC API request URL: {response.url}")
-
-        response.raise_for_status()
-
-        data = response.json()
-
-        # Проверяем структуру ответа
-        if not isinstance(data, dict) or 'price' not in data:
-            raise ValueError(f"Invalid API response structure: {data}")
-
-        price = float(data['price'])
-        logger.info(f"Успешно получена цена для {clean_symbol}: {price}")
-
-        return price
-
-    except requests.exceptions.HTTPError as e:
-        error_detail = f"{e.response.status_code} - {e.response.text}" if e.response else str(e)
-        logger.error(f"Ошибка запроса к MEXC API: {error_detail}")
-        raise HTTPException(
-            status_code=502,
-            detail=f"MEXC API error: {error_detail}"
-        )
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Сетевая ошибка при запросе к MEXC API: {e}")
+        return await mexc.get_price(symbol)
+
+    except httpx.HTTPError as e:
+        price = stale_price(symbol, e)
+        if price is not None:
+            return price
+        if isinstance(e, httpx.HTTPStatusError):
+            error_detail = f"{e.response.status_code} - {e.response.text}"
+            logger.error("Ошибка запроса к MEXC API: %s", error_detail)
+            raise HTTPException(
+                status_code=502,
+                detail=f"MEXC API error: {error_detail}"
+            )
+        # Сетевая ошибка или разомкнутая цепь MEXC
+        logger.error("Сетевая ошибка при запросе к MEXC API: %s", e)
         raise HTTPException(
             status_code=503,
             detail="MEXC API temporarily unavailable"
-        )
+        ) from e
     except (ValueError, KeyError) as e:
-        logger.error(f"Ошибка обработки ответа: {e}")
+        logger.error("Ошибка обработки ответа: %s", e)
         raise HTTPException(
             status_code=502,
             detail=f"Invalid API response: {str(e)}"
         )
     except Exception as e:
-        logger.error(f"Неожиданная ошибка: {str(e)}", exc_info=True)
+        logger.error("Неожиданная ошибка: %s", str(e), exc_info=True)
         raise HTTPException(
             status_code=500,
             detail="Internal server error"
         )
 
 
-async def update_price_periodically(sheet, row_index: int, symbol: str, entry_price: float, action: str):
-    """Обновление цен через фиксированные интервалы после сигнала"""
-    moscow_tz = pytz.timezone('Europe/Moscow')
+async def get_interval_price(symbol: str, price_feed: Optional[PriceFeed] = None) -> float:
+    """Цена для интервальной проверки: последняя цена потока без сетевых запросов,
+    иначе (в режиме снимка) - общий bulk-запрос к MEXC на все проверки одного тика"""
+    if price_feed is not None:
+        price = price_feed.get(symbol, Config.PRICE_FEED_MAX_AGE)
+        if price is not None:
+            return price
+    if Config.PRICE_SNAPSHOT_MODE:
+        try:
+            return await mexc.get_snapshot_price(symbol)
+        except httpx.HTTPError as e:
+            price = stale_price(symbol, e)
+            if price is None:
+                raise
+            return price
+    return await get_mexc_price(symbol)
+
+
+async def process_interval_jobs(writer: SheetWriter, jobs: List[IntervalJob],
+                                price_feed: Optional[PriceFeed] = None):
+    """Обрабатывает пакет наступивших интервальных проверок от планировщика"""
+    results = []
+    for job in jobs:
+        name = job.interval_name
+        try:
+            # Получаем текущую цену (из потока, иначе - общий bulk-запрос на весь пакет)
+            current_price = await get_interval_price(job.symbol, price_feed)
+            change_pct = await write_interval_result(
+                writer, job.row, job.interval, job.action, job.entry_price, current_price
+            )
+            results.append((job.row, name, current_price, change_pct))
+            logger.debug("Обновлен интервал %s для %s", name, job.symbol)
 
-    try:
-        # Получаем время входа
-        entry_time_str = sheet.cell(row_index, 4).value
-        entry_time = moscow_tz.localize(datetime.strptime(entry_time_str, "%Y-%m-%d %H:%M:%S"))
-
-        # Интервалы в секундах (название, интервал)
-        intervals = [
-            ('15m', 15 * 60),  # 15 минут
-            ('1h', 60 * 60),  # 1 час
-            ('4h', 4 * 60 * 60),  # 4 часа
-            ('1d', 24 * 60 * 60)  # 1 день
-        ]
-
-        # Ждем наступления каждого интервала
-        for name, delay in intervals:
-            try:
-                # Вычисляем время, когда нужно обновить данные
-                target_time = entry_time + timedelta(seconds=delay)
-                sleep_duration = (target_time - datetime.now(moscow_tz)).total_seconds()
+        except Exception as e:
+            logger.error("Ошибка при обновлении интервала %s для %s: %s", name, job.symbol, e)
 
-                if sleep_duration > 0:
-                    logger.info(f"Ожидание {name} обновления для {symbol} (через {sleep_duration:.0f} сек)")
-                    await asyncio.sleep(sleep_duration)
+    await store_interval_results(results)
 
-                # Получаем текущую цену
-                current_price = await get_mexc_price(symbol)
 
-                # Расчет изменения цены
-                if action.lower() == 'buy':
-                    change_pct = ((current_price - entry_price) / entry_price) * 100
-                else:
-                    change_pct = ((entry_price - current_price) / entry_price) * 100
+async def write_interval_result(writer: SheetWriter, row: int, interval: int, action: str,
+                                entry_price: float, price: float) -> float:
+    """Цена и изменение в % в буфер записи листа; возвращает изменение в %"""
+    # Расчет изменения цены
+    if action == 'buy':
+        change_pct = ((price - entry_price) / entry_price) * 100
+    else:
+        change_pct = ((entry_price - price) / entry_price) * 100
 
-                # Определяем колонку для записи
-                col = 5 + intervals.index((name, delay)) * 2
+    # Определяем колонку для записи
+    col = 5 + interval * 2
 
-                # Обновляем данные
-                sheet.update_cell(row_index, col, current_price)
+    # Цена и процентное изменение (как число, формат задан на уровне листа)
+    await writer.update(row, col, [price, change_pct / 100])
 
-                # Записываем процентное изменение (как число для последующего форматирования)
-                sheet.update_cell(row_index, col + 1, change_pct / 100)
+    if Config.SHEETS_CELL_FORMATS:
+        await format_cell(writer, row, col + 1, change_pct)
+    return change_pct
 
-                # Получаем букву колонки для форматирования
-                col_letter = chr(ord('A') + col)
-                percent_cell = f"{col_letter}{row_index}"
 
-                # Применяем процентный формат с запятой
-                sheet.format(percent_cell, {
-                    "numberFormat": {
-                        "type": "PERCENT",
-                        "pattern": "#,##0.00%"
-                    }
-                })
+async def store_interval_results(results: List[tuple]):
+    """Результаты всего пакета - одной транзакцией в хранилище сигналов"""
+    if not results:
+        return
+    try:
+        await run_in_session(record_interval_results, results)
+    except Exception as e:
+        logger.error("Failed to store interval results: %s", e)
+        return
+    # Колонки статистики дочитывают только что записанные результаты
+    try:
+        await signal_stats.sync()
+    except Exception as e:
+        logger.error("Failed to update signal stats: %s", e)
 
-                # Применяем цветовое форматирование к ячейке с процентом
-                format_cell(sheet, row_index, col + 1, change_pct)
 
-                logger.info(f"Обновлен интервал {name} для {symbol}")
+async def recover_missed_intervals(app) -> int:
+    """Восстанавливает проверки, пропущенные за время простоя: пустые ячейки интервалов
+    в листе заполняются ценой закрытия минутной свечи на границе интервала.
+    Свечи запрашиваются по символу и диапазону времени, запись - общим буфером листа"""
+    leases = app.state.leases
+    if not leases.acquire(RECOVERY_LEASE, Config.RECOVERY_LEASE_TTL):
+        logger.info("Recovery of missed interval checks is running in another worker")
+        return 0
 
-            except Exception as e:
-                logger.error(f"Ошибка при обновлении интервала {name}: {e}")
+    try:
+        started = time.perf_counter()
+        checks = find_missed_checks(app.state.sheet_mirror.rows, time.time(), Config.RECOVERY_MAX_AGE)
+        if not checks:
+            return 0
+        prices = await fetch_boundary_prices(mexc, checks, Config.RECOVERY_CONCURRENCY)
+
+        writer = app.state.sheet_writer
+        results = []
+        for check in checks:
+            price = prices.get((check.symbol, check.candle))
+            if price is None:
                 continue
+            change_pct = await write_interval_result(
+                writer, check.row, check.interval, check.action, check.entry_price, price
+            )
+            results.append((check.row, INTERVALS[check.interval][0], price, change_pct))
 
-        logger.info(f"Все интервалы обновлены для {symbol}")
-
+        await store_interval_results(results)
+        await writer.flush()
+        logger.info(
+            "Recovered %s of %s missed interval checks in %.1fs",
+            len(results), len(checks), time.perf_counter() - started,
+        )
+        return len(results)
     except Exception as e:
-        logger.error(f"Критическая ошибка: {e}")
+        logger.error("Recovery of missed interval checks failed: %r", e, exc_info=True)
+        return 0
     finally:
-        if symbol in update_tasks:
-            update_tasks.pop(symbol)
+        leases.release(RECOVERY_LEASE)
 
 
-def format_cell(sheet, row: int, col: int, value: float):
-    """Применяет цвет фона к ячейке на основе значения (синхронная версия)"""
-    try:
-        col_letter = chr(ord('A') + col - 1)  # -1 потому что колонки начинаются с 1
-        cell_reference = f"{col_letter}{row}"
+async def format_cell(writer: SheetWriter, row: int, col: int, value: float):
+    """Процентный формат и цвет фона ячейки в буфер записи (если не заданы правила листа)"""
+    cell_reference = rowcol_to_a1(row, col)
+    await writer.format(cell_reference, PERCENT_FORMAT)
 
-        if value == 0:
-            return
+    if value == 0:
+        return
 
-        if value >= 0:
-            # Зелёный фон для положительных значений
-            sheet.format(
-                cell_reference,
-                {"backgroundColor": {"red": 0.5, "green": 1, "blue": 0.5}}
-            )
-        else:
-            # Красный фон для отрицательных значений
-            sheet.format(
-                cell_reference,
-                {"backgroundColor": {"red": 1, "green": 0.5, "blue": 0.5}}
-            )
-    except Exception as e:
-        logger.error(f"Failed to format cell: {e}")
+    # Зелёный фон для положительных значений, красный - для отрицательных
+    await writer.format(cell_reference, {"backgroundColor": GREEN if value >= 0 else RED})
 
 
-@router.post("/webhook")
-async def webhook(request: Request):
-    try:
-        # Проверка инициализации клиента
-        if not hasattr(request.app.state, 'google_sheets'):
-            logger.error("Google Sheets client not initialized")
-            raise HTTPException(status_code=503, detail="Service unavailable")
+@router.get("/prices/cache")
+async def price_cache_stats():
+    """Счетчики кэша цен MEXC: попадания, промахи и объединенные запросы"""
+    return {**mexc.cache.stats(), "snapshot_fetches": mexc.snapshot_fetches}
 
-        client = request.app.state.google_sheets
 
-        try:
-            sheet = client.open_by_key(SPREADSHEET_ID).sheet1
-        except Exception as e:
-            logger.error(f"Sheet access error: {str(e)}")
-            raise HTTPException(status_code=500, detail="Spreadsheet access error")
+@router.get("/symbols")
+async def symbol_index_stats():
+    """Состояние списка пар MEXC: размер, возраст снимка и число отклоненных тикеров"""
+    return symbol_index.stats()
 
-        # Обработка данных...
-        data = await request.json()
-        logger.info(f"Processing data: {data}")
 
-        # Извлекаем переменные
-        ticker = data.get('ticker', 'N/A')
-        action = data.get('strategy.order.action', 'N/A')
+@router.get("/symbols/{ticker}")
+async def resolve_ticker(ticker: str):
+    """Пара MEXC и CMC id, в которые переводится тикер TradingView"""
+    symbol = resolve_symbol(ticker)
+    coin = cmc.coin_map.by_symbol(symbol)
+    return {
+        "ticker": ticker,
+        "symbol": symbol.upper(),
+        "pair": mexc.trading_pair(symbol),
+        "cmc_id": coin.id if coin is not None else None,
+    }
 
-        symbol = cmc.extract_symbol(ticker.lower())
 
-        # Эмодзи для действия
-        action_emoji = '🟢' if action.lower() == 'buy' else '🔴' if action.lower() == 'sell' else '⚪'
+@router.get("/breakers")
+async def breaker_stats():
+    """Состояние автоматов защиты внешних сервисов и бюджетов повторов"""
+    return breakers.stats()
 
-        # Получаем символ монеты
-        logger.info(f"Extracted symbol: {symbol.lower()}")
 
+@router.get("/cmc/cache")
+async def cmc_cache_stats():
+    """Счетчики кэша рыночных данных CoinMarketCap"""
+    return cmc.stats()
 
-        # Получаем рыночные данные
-        market_cap, volume_24h = await cmc.get_market_data(symbol)
-        current_price = await get_mexc_price(symbol)
 
-        # Формируем сообщение для Telegram
-        message = (
-            f"{action_emoji} *{action.upper()}* \n\n"
-            f"*{symbol.upper()}*\n\n"
-            f"PRICE - *{current_price}$*\n"
-            f"MARKET CAP - *{cmc.format_number(market_cap)}*\n"
-            f"24H VOLUME - *{cmc.format_number(volume_24h)}*\n\n"
-            f"Trading on the MEXC exchange - *https://promote.mexc.com/r/scn7giWq*"
-        )
+@router.get("/telegram/queue")
+async def telegram_queue_stats():
+    """Глубина очередей Telegram и задержка отправки по чатам"""
+    return telegram_queue.stats()
+
+
+@router.get("/scheduler/jobs")
+async def scheduler_jobs(request: Request, limit: int = 100):
+    """Ближайшие интервальные проверки и отставание планировщика"""
+    return request.app.state.scheduler.stats(limit=limit)
+
+
+@router.get("/sheets/writer")
+async def sheet_writer_stats(request: Request):
+    """Состояние буфера отложенной записи в Google Sheets"""
+    return request.app.state.sheet_writer.stats()
+
+
+@router.get("/webhook/dedup")
+async def dedup_stats():
+    """Счетчики подавления дублей алертов"""
+    return idempotency.stats()
+
+
+@router.get("/prices/feed")
+async def price_feed_stats(request: Request):
+    """Состояние потока цен: подписанные символы и возраст последних тиков"""
+    price_feed = getattr(request.app.state, 'price_feed', None)
+    if price_feed is None:
+        return {"enabled": False}
+    return {"enabled": True, **price_feed.stats()}
+
+
+@router.get("/ingest/queue")
+async def ingest_queue_stats(request: Request):
+    """Состояние очереди входящих алертов"""
+    return request.app.state.ingest.stats()
+
+
+def validate_alert(data) -> dict:
+    """Минимальная проверка алерта TradingView до постановки в очередь"""
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=422, detail="Alert must be a JSON object")
+    ticker = data.get('ticker')
+    if not isinstance(ticker, str) or not ticker.strip():
+        raise HTTPException(status_code=422, detail="Field 'ticker' is required")
+    action = data.get('strategy.order.action', 'N/A')
+    if not isinstance(action, str):
+        raise HTTPException(status_code=422, detail="Field 'strategy.order.action' must be a string")
+    resolve_symbol(ticker)
+    return data
+
+
+def resolve_symbol(ticker: str) -> str:
+    """Символ актива по списку пар MEXC, без сетевых запросов; неизвестный тикер - 422.
+    Пока список не загружен, символ выделяется по суффиксам, как раньше"""
+    if not symbol_index.ready:
+        return cmc.extract_symbol(ticker.lower())
+    market = symbol_index.resolve(ticker)
+    if market is None:
+        raise HTTPException(status_code=422, detail=f"Ticker '{ticker}' is not traded on MEXC against USDT")
+    return market.symbol
+
+
+def build_message(action: str, symbol: str, price: float, market_cap, volume_24h) -> str:
+    """Текст сигнала для Telegram"""
+    # Эмодзи для действия
+    action_emoji = '🟢' if action.lower() == 'buy' else '🔴' if action.lower() == 'sell' else '⚪'
+    return (
+        f"{action_emoji} *{action.upper()}* \n\n"
+        f"*{symbol.upper()}*\n\n"
+        f"PRICE - *{price}$*\n"
+        f"MARKET CAP - *{cmc.format_number(market_cap)}*\n"
+        f"24H VOLUME - *{cmc.format_number(volume_24h)}*\n\n"
+        f"Trading on the MEXC exchange - *https://promote.mexc.com/r/scn7giWq*"
+    )
+
+
+async def run_stage(timings: Dict[str, float], name: str, awaitable, timeout: Optional[float] = None):
+    """Выполняет этап конвейера с собственным дедлайном (None - без дедлайна)
+    и записывает его длительность (мс)"""
+    started = time.perf_counter()
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    finally:
+        elapsed = time.perf_counter() - started
+        timings[name] = round(elapsed * 1000, 2)
+        WEBHOOK_STAGE_SECONDS.observe(elapsed, (name,))
+
+
+async def process_alert(app, data: dict) -> dict:
+    """Обогащение, уведомление и запись сигнала в таблицу.
+    Независимые этапы выполняются параллельно, каждый со своим дедлайном"""
+    # Проверка инициализации листа (открывается один раз в lifespan)
+    if not hasattr(app.state, 'sheet_mirror'):
+        logger.error("Google Sheets client not initialized")
+        raise HTTPException(status_code=503, detail="Service unavailable")
+
+    mirror = app.state.sheet_mirror
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+
+    logger.debug("Processing data: %s", data)
 
-        # Отправляем в Telegram
+    # Извлекаем переменные
+    ticker = data.get('ticker', 'N/A')
+    action = data.get('strategy.order.action', 'N/A')
+
+    symbol = resolve_symbol(ticker)
+
+    # Получаем символ монеты
+    logger.debug("Extracted symbol: %s", symbol.lower())
+
+    async def market_data_stage():
+        # Медленный CMC не задерживает алерт: капитализация и объем будут "N/A"
         try:
-            TelegramBot.send_message(text=message, chat_id=Config.CHAT_ID_TRADES)
-            logger.info(message)
-        except Exception as e:
-            logger.error(f"Failed to send Telegram message: {e}")
-            raise HTTPException(status_code=500, detail="Failed to send notification")
+            return await run_stage(timings, "cmc", cmc.get_market_data(symbol), Config.STAGE_TIMEOUT_CMC)
+        except asyncio.TimeoutError:
+            logger.warning("CMC stage exceeded %ss for %s, using N/A", Config.STAGE_TIMEOUT_CMC, symbol)
+            return None, None
+
+    async def price_stage():
+        # Без цены сигнал записать нельзя - превышение дедлайна считается ошибкой
+        try:
+            return await run_stage(timings, "mexc", get_mexc_price(symbol), Config.STAGE_TIMEOUT_MEXC)
+        except asyncio.TimeoutError:
+            logger.error("MEXC stage exceeded %ss for %s", Config.STAGE_TIMEOUT_MEXC, symbol)
+            raise HTTPException(status_code=504, detail="MEXC API timeout")
+
+    # Получаем рыночные данные и цену одновременно
+    (market_cap, volume_24h), current_price = await asyncio.gather(market_data_stage(), price_stage())
+
+    # Формируем сообщение для Telegram
+    message = build_message(action, symbol, current_price, market_cap, volume_24h)
 
+    signal_time = datetime.now(pytz.timezone('Europe/Moscow'))
+
+    async def sheet_stage() -> int:
         # Записываем данные в Google Таблицу
         try:
-            sheet.append_row([
+            # Номер строки берется из ответа append, без чтения всего листа.
+            # Без дедлайна: отмена ожидания не останавливает запись в потоке, и повтор дал бы дубль строки
+            return await run_stage(timings, "sheets", mirror.append_row([
                 symbol.upper(),
                 action.lower(),
                 current_price,
-                datetime.now(pytz.timezone('Europe/Moscow')).strftime("%Y-%m-%d %H:%M:%S"),
+                signal_time.strftime("%Y-%m-%d %H:%M:%S"),
                 "", "", "", "", "", "", "", ""
-            ])
+            ]))
+        except CircuitOpenError as e:
+            logger.error("Google Sheets unavailable: %s", e)
+            raise HTTPException(status_code=503, detail="Google Sheets temporarily unavailable") from e
+        except Exception as e:
+            logger.error("Failed to write to Google Sheets: %r", e)
+            raise HTTPException(status_code=500, detail="Failed to save data")
+
+    def telegram_stage():
+        # Ставим сообщение в очередь Telegram (отправляют фоновые воркеры с учетом лимитов).
+        # Строка уже записана: ошибка здесь не должна приводить к повтору алерта и дублю строки
+        started_at = time.perf_counter()
+        try:
+            telegram_queue.enqueue(Config.CHAT_ID_TRADES, message)
+            logger.debug(message)
+        except asyncio.QueueFull:
+            logger.error("Failed to send Telegram message for %s: outbound queue is full", symbol)
+        finally:
+            elapsed = time.perf_counter() - started_at
+            timings["telegram"] = round(elapsed * 1000, 2)
+            WEBHOOK_STAGE_SECONDS.observe(elapsed, ("telegram",))
+
+    # Уведомление - только после записи строки: повтор алерта после ошибки записи не дублирует сообщение
+    row_index = await sheet_stage()
+    telegram_stage()
+
+    app.state.scheduler.schedule(
+        row_index, symbol, float(current_price), action, signal_time.timestamp()
+    )
+
+    # Локальная копия сигнала для статистики и ежедневного отчета
+    try:
+        await run_stage(
+            timings, "store",
+            run_in_session(record_signal, symbol, action, float(current_price), signal_time, row_index),
+            Config.STAGE_TIMEOUT_STORE,
+        )
+    except Exception as e:
+        logger.error("Failed to store signal: %r", e)
+
+    elapsed = time.perf_counter() - started
+    timings["total"] = round(elapsed * 1000, 2)
+    WEBHOOK_STAGE_SECONDS.observe(elapsed, ("total",))
+    logger.info("Alert %s stage timings (ms): %s", symbol, timings)
+    return {"status": "success", "message": "Alert processed", "timings": timings}
 
-            row_index = len(sheet.get_all_values())
 
-            task = asyncio.create_task(
-                update_price_periodically(sheet, row_index, symbol, float(current_price), action)
+@router.post("/webhook")
+async def webhook(request: Request):
+    received = time.perf_counter()
+    try:
+        try:
+            data = validate_alert(await request.json())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON")
+
+        # Повторная доставка или двойное срабатывание: сохраненный ответ без обращений к API
+        fingerprint = idempotency.fingerprint(data, request.headers.get('Idempotency-Key'))
+        duplicate, cached_response = idempotency.claim(fingerprint)
+        if duplicate:
+            logger.info("Duplicate alert suppressed: %s", fingerprint)
+            return JSONResponse(
+                status_code=202 if Config.INGEST_MODE else 200,
+                content={**(cached_response or {"status": "processing"}), "duplicate": True},
             )
-            update_tasks[symbol] = task
 
-        except Exception as e:
-            logger.error(f"Failed to write to Google Sheets: {e}")
-            raise HTTPException(status_code=500, detail="Failed to save data")
+        if Config.INGEST_MODE:
+            # Быстрый ответ: алерт сохранен на диск, обработка - в фоновых воркерах
+            try:
+                item_id = request.app.state.ingest.put(data)
+            except BaseException:
+                idempotency.release(fingerprint)
+                raise
+            response = {"status": "accepted", "id": item_id}
+            logger.info("Alert queued as alert-%s", item_id)
+            idempotency.complete(fingerprint, response)
+            WEBHOOK_STAGE_SECONDS.observe(time.perf_counter() - received, ("ack",))
+            return JSONResponse(status_code=202, content=response)
 
-        return {"status": "success", "message": "Alert processed"}
+        try:
+            response = await process_alert(request.app, data)
+        except BaseException:
+            idempotency.release(fingerprint)
+            raise
+        idempotency.complete(fingerprint, response)
+        return response
 
     except HTTPException:
         raise  # Пробрасываем уже обработанные ошибки
     except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail="Internal server error")
\ No newline at end of file
+        logger.error("Unexpected error: %s", str(e), exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+def _item_error(index: int, status_code: int, detail: str) -> dict:
+    return {"index": index, "status": "error", "code": status_code, "detail": detail}
+
+
+async def process_batch(app, items: List[object]) -> List[dict]:
+    """Пакет алертов за один проход: один bulk-запрос цен, один запрос рыночных данных,
+    одна запись строк в таблицу и одна транзакция планировщика. Результат - по каждому элементу"""
+    mirror = app.state.sheet_mirror
+    results: List[Optional[dict]] = [None] * len(items)
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+
+    # Проверка схемы и подавление дублей, в том числе внутри самого пакета
+    accepted = []
+    for index, item in enumerate(items):
+        if isinstance(item, InvalidItem):
+            results[index] = _item_error(index, 400, item.error)
+            continue
+        try:
+            data = validate_alert(item)
+        except HTTPException as e:
+            results[index] = _item_error(index, e.status_code, e.detail)
+            continue
+        fingerprint = idempotency.fingerprint(data)
+        duplicate, cached_response = idempotency.claim(fingerprint)
+        if duplicate:
+            results[index] = {"index": index, **(cached_response or {"status": "processing"}), "duplicate": True}
+            continue
+        action = data.get('strategy.order.action', 'N/A')
+        accepted.append((index, fingerprint, resolve_symbol(data['ticker']), action))
+
+    try:
+        if accepted:
+            await _process_accepted(app, mirror, accepted, results, timings)
+    finally:
+        # Элементы без успешного результата можно доставить повторно
+        for index, fingerprint, _, _ in accepted:
+            result = results[index]
+            if result is not None and result["status"] == "success":
+                idempotency.complete(fingerprint, result)
+            else:
+                idempotency.release(fingerprint)
+
+    elapsed = time.perf_counter() - started
+    timings["total"] = round(elapsed * 1000, 2)
+    WEBHOOK_STAGE_SECONDS.observe(elapsed, ("batch_total",))
+    logger.info("Batch of %s alerts (%s accepted) stage timings (ms): %s", len(items), len(accepted), timings)
+    return results
+
+
+async def _process_accepted(app, mirror, accepted, results: List[Optional[dict]], timings: Dict[str, float]):
+    symbols = sorted({symbol.upper() for _, _, symbol, _ in accepted})
+
+    async def market_data_stage():
+        try:
+            return await run_stage(timings, "cmc", cmc.get_market_data_many(symbols), Config.STAGE_TIMEOUT_CMC)
+        except asyncio.TimeoutError:
+            logger.warning("CMC stage exceeded %ss for batch, using N/A", Config.STAGE_TIMEOUT_CMC)
+            return {}
+
+    async def price_stage():
+        # Все символы читают один общий снимок MEXC; отдельные запросы - только для пар вне снимка
+        prices = await asyncio.gather(
+            *(mexc.get_snapshot_price(symbol) for symbol in symbols), return_exceptions=True
+        )
+        return dict(zip(symbols, prices))
+
+    try:
+        market_data, prices = await asyncio.gather(
+            market_data_stage(), run_stage(timings, "mexc", price_stage(), Config.STAGE_TIMEOUT_MEXC)
+        )
+    except asyncio.TimeoutError:
+        logger.error("MEXC stage exceeded %ss for batch", Config.STAGE_TIMEOUT_MEXC)
+        for index, _, _, _ in accepted:
+            results[index] = _item_error(index, 504, "MEXC API timeout")
+        return
+
+    signal_time = datetime.now(pytz.timezone('Europe/Moscow'))
+    priced, rows = [], []
+    for index, fingerprint, symbol, action in accepted:
+        price = prices.get(symbol.upper())
+        if isinstance(price, httpx.HTTPError):
+            price = stale_price(symbol, price) or price
+        if isinstance(price, BaseException):
+            logger.error("MEXC price error for %s: %r", symbol, price)
+            if isinstance(price, CircuitOpenError):
+                results[index] = _item_error(index, 503, "MEXC API temporarily unavailable")
+            else:
+                results[index] = _item_error(index, 502, "Failed to get price from MEXC")
+            continue
+        priced.append((index, symbol, action, price))
+        rows.append([
+            symbol.upper(),
+            action.lower(),
+            price,
+            signal_time.strftime("%Y-%m-%d %H:%M:%S"),
+            "", "", "", "", "", "", "", ""
+        ])
+    if not priced:
+        return
+
+    # Все строки пакета - одним запросом append, без отменяющего дедлайна (как для одиночного алерта)
+    try:
+        row_indexes = await run_stage(timings, "sheets", mirror.append_rows(rows))
+    except Exception as e:
+        logger.error("Failed to write batch to Google Sheets: %r", e)
+        unavailable = isinstance(e, CircuitOpenError)
+        for index, _, _, _ in priced:
+            results[index] = _item_error(
+                index, 503 if unavailable else 500,
+                "Google Sheets temporarily unavailable" if unavailable else "Failed to save data",
+            )
+        return
+
+    for (index, symbol, action, price), row_index in zip(priced, row_indexes):
+        market_cap, volume_24h = market_data.get(symbol.upper(), (None, None))
+        try:
+            telegram_queue.enqueue(Config.CHAT_ID_TRADES, build_message(action, symbol, price, market_cap, volume_24h))
+            notified = True
+        except asyncio.QueueFull:
+            logger.error("Failed to send Telegram message for %s: outbound queue is full", symbol)
+            notified = False
+        results[index] = {
+            "index": index,
+            "status": "success",
+            "symbol": symbol.upper(),
+            "price": price,
+            "row": row_index,
+            "notified": notified,
+        }
+
+    entry_ts = signal_time.timestamp()
+    app.state.scheduler.schedule_many([
+        (row_index, symbol, float(price), action, entry_ts)
+        for (_, symbol, action, price), row_index in zip(priced, row_indexes)
+    ])
+
+    try:
+        await run_stage(
+            timings, "store",
+            run_in_session(record_signals, [
+                (symbol, action, float(price), signal_time, row_index)
+                for (_, symbol, action, price), row_index in zip(priced, row_indexes)
+            ]),
+            Config.STAGE_TIMEOUT_STORE,
+        )
+    except Exception as e:
+        logger.error("Failed to store batch signals: %r", e)
+
+
+@router.post("/webhook/batch")
+async def webhook_batch(request: Request):
+    """Пакет алертов: JSON-массив или NDJSON (по алерту в строке), тело разбирается потоком"""
+    if not hasattr(request.app.state, 'sheet_mirror'):
+        logger.error("Google Sheets client not initialized")
+        raise HTTPException(status_code=503, detail="Service unavailable")
+
+    # Заявленный размер проверяется до чтения тела, фактический - по мере чтения
+    try:
+        declared = int(request.headers.get('content-length', 0))
+    except ValueError:
+        declared = 0
+    if declared > Config.BATCH_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {Config.BATCH_MAX_BYTES} bytes")
+
+    items = []
+    try:
+        async for item in iter_alerts(request.stream(), Config.BATCH_MAX_BYTES):
+            items.append(item)
+            if len(items) > Config.BATCH_MAX_ITEMS:
+                raise HTTPException(status_code=413, detail=f"Batch exceeds {Config.BATCH_MAX_ITEMS} alerts")
+    except BatchTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    results = await process_batch(request.app, items)
+    return {
+        "status": "success",
+        "count": len(results),
+        "accepted": sum(result["status"] == "success" for result in results),
+        "results": results,
+    }
@@ -0,0 +1,196 @@
+import codecs
+import json
+import re
+from typing import AsyncIterator, List, Optional, Union
+
+_WHITESPACE = ' \t\r\n'
+# Символы, меняющие глубину или состояние строки, и конец скалярного элемента
+_STRUCTURAL = re.compile(r'["{}\[\]]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+_SCALAR_END = re.compile(r'[,\]\s]')
+
+
+class InvalidItem:
+    """Строка NDJSON, которую не удалось разобрать; остальные элементы пакета обрабатываются"""
+
+    def __init__(self, error: str):
+        self.error = error
+
+
+class BatchTooLarge(ValueError):
+    """Тело пакета больше допустимого размера"""
+
+
+class _ArrayParser:
+    """Разбор JSON-массива по кускам тела. Конец незаконченного элемента ищется сканером,
+    который продолжает с места остановки, поэтому элемент не разбирается заново на каждом
+    куске: raw_decode вызывается один раз для законченного элемента"""
+
+    def __init__(self, decoder: json.JSONDecoder):
+        self.decoder = decoder
+        self.buffer = ""
+        self.pos = 0  # начало неразобранной части буфера
+        self.expect = 'first'  # first - элемент или ']', value - элемент, separator - ',' или ']'
+        self.closed = False
+        # Сканирование незаконченного элемента: позиция, глубина вложенности, внутри строки ли
+        self._scan: Optional[int] = None
+        self._depth = 0
+        self._in_string = False
+
+    def feed(self, text: str) -> List[object]:
+        self.buffer = self.buffer[self.pos:] + text
+        if self._scan is not None:
+            self._scan -= self.pos
+        self.pos = 0
+        if self.closed:
+            self._check_tail()
+            return []
+
+        items = []
+        while True:
+            if self._scan is None:
+                if not self._next_element():
+                    return items
+                if self.closed:
+                    self._check_tail()
+                    return items
+            end = self._find_end()
+            if end is None:
+                return items
+            try:
+                item, stop = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid JSON in array: {e.msg}")
+            if stop != end:
+                raise ValueError("Invalid JSON in array")
+            items.append(item)
+            self.pos = end
+            self._scan = None
+            self.expect = 'separator'
+
+    def _next_element(self) -> bool:
+        """Пропускает пробелы и ровно один разделитель; True, если начался элемент или массив закрыт"""
+        buffer = self.buffer
+        while True:
+            while self.pos < len(buffer) and buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos == len(buffer):
+                return False
+            char = buffer[self.pos]
+            if self.expect == 'separator':
+                if char == ',':
+                    self.expect = 'value'
+                    self.pos += 1
+                    continue
+                if char == ']':
+                    self.closed = True
+                    self.pos += 1
+                    return True
+                raise ValueError("Expected ',' or ']' between array items")
+            if char == ']':
+                if self.expect == 'value':
+                    raise ValueError("Trailing comma in JSON array")
+                self.closed = True
+                self.pos += 1
+                return True
+            if char == ',':
+                raise ValueError("Missing value in JSON array")
+            self._scan = self.pos
+            self._depth = 0
+            self._in_string = False
+            return True
+
+    def _find_end(self) -> Optional[int]:
+        """Конец элемента, начатого в pos, или None, если он еще не пришел целиком"""
+        buffer = self.buffer
+        if buffer[self.pos] not in '{["':
+            match = _SCALAR_END.search(buffer, self._scan)
+            if match is None:
+                self._scan = len(buffer)
+                return None
+            return match.start()
+
+        i = self._scan
+        while True:
+            match = (_STRING_SPECIAL if self._in_string else _STRUCTURAL).search(buffer, i)
+            if match is None:
+                self._scan = max(i, len(buffer))
+                return None
+            char, i = match.group(), match.end()
+            if self._in_string:
+                if char == '\\':
+                    i += 1  # экранированный символ пропускается, даже если он в следующем куске
+                    if i > len(buffer):
+                        self._scan = i
+                        return None
+                    continue
+                self._in_string = False
+                if self._depth == 0:
+                    return i
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    return i
+
+    def _check_tail(self):
+        if self.buffer[self.pos:].strip(_WHITESPACE):
+            raise ValueError("Unexpected data after JSON array")
+
+
+async def iter_alerts(chunks: AsyncIterator[bytes], max_bytes: Optional[int] = None
+                      ) -> AsyncIterator[Union[object, InvalidItem]]:
+    """Элементы JSON-массива или строки NDJSON по мере чтения тела запроса,
+    без буферизации всего тела. Ошибка синтаксиса массива - ValueError,
+    тело больше max_bytes - BatchTooLarge"""
+    text = codecs.getincrementaldecoder('utf-8')()
+    decoder = json.JSONDecoder()
+    buffer = ""
+    mode = None
+    array = _ArrayParser(decoder)
+    received = 0
+
+    async for chunk in chunks:
+        received += len(chunk)
+        if max_bytes is not None and received > max_bytes:
+            raise BatchTooLarge(f"Batch exceeds {max_bytes} bytes")
+        buffer += text.decode(chunk)
+        if mode is None:
+            buffer = buffer.lstrip(_WHITESPACE)
+            if not buffer:
+                continue
+            mode = 'array' if buffer[0] == '[' else 'ndjson'
+            if mode == 'array':
+                buffer = buffer[1:]
+
+        if mode == 'ndjson':
+            *lines, buffer = buffer.split('\n')
+            for line in lines:
+                if line.strip():
+                    yield _parse_line(decoder, line)
+            continue
+
+        # Массив: законченные элементы разбираются сразу, незаконченный хвост ждет следующий кусок
+        for item in array.feed(buffer):
+            yield item
+        buffer = ""
+
+    buffer += text.decode(b'', final=True)
+    if mode == 'ndjson':
+        if buffer.strip():
+            yield _parse_line(decoder, buffer)
+    elif mode == 'array':
+        for item in array.feed(buffer):
+            yield item
+        if not array.closed:
+            raise ValueError("Unterminated JSON array")
+
+
+def _parse_line(decoder: json.JSONDecoder, line: str):
+    try:
+        return decoder.decode(line)
+    except json.JSONDecodeError as e:
+        return InvalidItem(f"Invalid JSON: {e.msg}")
@@ -0,0 +1,164 @@
+import random
+import time
+from typing import Dict
+
+import httpx
+
+from app.config import Config
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+# Значения для метрики состояния
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Вызов отклонен без обращения к сервису: цепь разомкнута.
+    Наследует TransportError, поэтому вызывающие обрабатывают его как недоступность сервиса"""
+
+    def __init__(self, service: str, retry_in: float):
+        super().__init__(f"{service} circuit is open, retry in {retry_in:.1f}s")
+        self.service = service
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Размыкается после failure_threshold ошибок подряд. Через reset_timeout пропускает
+    пробные вызовы (half-open): успех замыкает цепь, ошибка снова размыкает ее
+    с удвоенным таймаутом (до max_reset_timeout)"""
+
+    def __init__(self, service: str, failure_threshold: int = 5, reset_timeout: float = 10.0,
+                 max_reset_timeout: float = 120.0, half_open_max: int = 1):
+        self.service = service
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.half_open_max = half_open_max
+        self.state = CLOSED
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probes = 0
+        self._probe_started = 0.0
+        self.opened = 0
+        self.rejected = 0
+
+    def retry_in(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self):
+        """Разрешает вызов или бросает CircuitOpenError"""
+        now = time.monotonic()
+        if self.state == OPEN:
+            if self.retry_in() > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.service, self.retry_in())
+            self.state = HALF_OPEN
+            self._probes = 0
+        if self.state == HALF_OPEN:
+            # Пробный вызов, отмененный вызывающим, не должен держать цепь полуоткрытой вечно
+            if self._probes >= self.half_open_max and now - self._probe_started < self.reset_timeout:
+                self.rejected += 1
+                raise CircuitOpenError(self.service, self.reset_timeout)
+            if self._probes >= self.half_open_max:
+                self._probes = 0
+            self._probes += 1
+            self._probe_started = now
+
+    def record_success(self):
+        self.failures = 0
+        if self.state != CLOSED:
+            self.state = CLOSED
+            self.reset_timeout = self.base_reset_timeout
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN:
+            # Пробный вызов не прошел - сервис еще болен, ждем дольше
+            self._open(min(self.reset_timeout * 2, self.max_reset_timeout))
+        elif self.state == CLOSED and self.failures >= self.failure_threshold:
+            self._open(self.base_reset_timeout)
+
+    def _open(self, reset_timeout: float):
+        self.state = OPEN
+        # Разброс, чтобы воркеры и реплики не пробовали сервис одновременно
+        self.reset_timeout = reset_timeout * random.uniform(0.8, 1.2)
+        self.opened_at = time.monotonic()
+        self.opened += 1
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "retry_in": self.retry_in() if self.state == OPEN else None,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+class RetryBudget:
+    """Бюджет повторов: каждый первый вызов пополняет его на ratio, каждый повтор тратит единицу.
+    При массовых ошибках повторов не больше ratio от потока вызовов, а не в разы больше"""
+
+    def __init__(self, ratio: float = 0.2, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.exhausted = 0
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        self.exhausted += 1
+        return False
+
+    def stats(self) -> dict:
+        return {"tokens": round(self.tokens, 2), "exhausted": self.exhausted}
+
+
+class BreakerRegistry:
+    """Автомат и бюджет повторов на каждый внешний сервис, создаются при первом обращении"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, max_reset_timeout: float,
+                 retry_ratio: float, retry_max_tokens: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.retry_ratio = retry_ratio
+        self.retry_max_tokens = retry_max_tokens
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._budgets: Dict[str, RetryBudget] = {}
+
+    def breaker(self, service: str) -> CircuitBreaker:
+        breaker = self._breakers.get(service)
+        if breaker is None:
+            breaker = self._breakers[service] = CircuitBreaker(
+                service, self.failure_threshold, self.reset_timeout, self.max_reset_timeout
+            )
+        return breaker
+
+    def budget(self, service: str) -> RetryBudget:
+        budget = self._budgets.get(service)
+        if budget is None:
+            budget = self._budgets[service] = RetryBudget(self.retry_ratio, self.retry_max_tokens)
+        return budget
+
+    def stats(self) -> dict:
+        return {
+            service: {**breaker.stats(), "retry_budget": self.budget(service).stats()}
+            for service, breaker in self._breakers.items()
+        }
+
+
+breakers = BreakerRegistry(
+    failure_threshold=Config.BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=Config.BREAKER_RESET_TIMEOUT,
+    max_reset_timeout=Config.BREAKER_MAX_RESET_TIMEOUT,
+    retry_ratio=Config.RETRY_BUDGET_RATIO,
+    retry_max_tokens=Config.RETRY_BUDGET_MAX,
+)
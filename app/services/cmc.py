@@ -1,102 +1,224 @@
 import logging
-from typing import Tuple, Optional, Dict
+from typing import Tuple, Optional, Dict, Iterable, List, Set
 import asyncio
-import requests
-from requests.exceptions import RequestException
+import httpx
+from pathlib import Path
+from cachetools import TTLCache
+from app.services.coin_map import CoinMap
+from app.services.http import http_client
 
 logger = logging.getLogger(__name__)
 
+MarketData = Tuple[Optional[float], Optional[float]]
+
+# Ограничение CMC на количество id в одном запросе котировок
+QUOTES_BATCH_LIMIT = 100
+
 
 class CoinMarketCapService:
-    def __init__(self, api_key: str, retries: int = 3, delay: float = 1.0):
+    def __init__(self, api_key: str, map_snapshot_path: Path, retries: int = 3, cache_ttl: float = 300,
+                 cache_size: int = 2000, batch_window: float = 0.05):
         self.api_key = api_key
         self.retries = retries
-        self.delay = delay
-        self._coin_cache = {}
         self.base_url = "https://pro-api.coinmarketcap.com/v2"  # Обновлено до v2 API
-
-    async def _get_all_coins(self) -> Dict:
-        """Получает и кэширует список всех монет"""
-        if not self._coin_cache:
-            try:
-                url = f"{self.base_url}/cryptocurrency/map"
-                headers = {
-                    'Accepts': 'application/json',
-                    'X-CMC_PRO_API_KEY': self.api_key
-                }
-
-                response = requests.get(url, headers=headers)
-                response.raise_for_status()
-
-                data = response.json()
-                coins = data.get('data', [])
-                self._coin_cache = {coin['symbol'].lower(): coin for coin in coins}
-                logger.info("Кэш монет успешно обновлен")
-            except RequestException as e:
-                logger.error(f"Ошибка получения списка монет: {e}")
-                raise
-        return self._coin_cache
-
-    async def get_market_data(self, symbol: str) -> Tuple[Optional[float], Optional[float]]:
+        # Карта символ/slug/id -> монета, сохраняется на диск между перезапусками
+        self.coin_map = CoinMap(api_key, map_snapshot_path)
+
+        # Рыночные данные по CMC id: TTL + вытеснение давно не используемых (LRU)
+        self._market_cache: TTLCache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        # Символы, которых нет в карте CMC: по символу, включая отрицательные ответы (None, None)
+        self._symbol_cache: TTLCache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.batch_window = batch_window
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._batch_handle: Optional[asyncio.TimerHandle] = None
+        # Ссылки на запущенные пакеты: задачу без ссылки сборщик мусора может удалить до завершения
+        self._batch_tasks: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.requests = 0
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {
+            'Accepts': 'application/json',
+            'X-CMC_PRO_API_KEY': self.api_key
+        }
+
+    async def get_market_data(self, symbol: str) -> MarketData:
         """Получает рыночные данные (капитализацию и объем)"""
         clean_symbol = self.extract_symbol(symbol).upper()
-
-        for attempt in range(self.retries):
-            try:
-                url = f"{self.base_url}/cryptocurrency/quotes/latest"
-                headers = {
-                    'Accepts': 'application/json',
-                    'X-CMC_PRO_API_KEY': self.api_key
-                }
-                params = {
-                    'symbol': clean_symbol,
-                    'convert': 'USD'
-                }
-
-                response = requests.get(url, headers=headers, params=params)
-                response.raise_for_status()
-                data = response.json()
-
-                # Улучшенная обработка структуры ответа
-                if not data.get('data'):
-                    logger.error(f"Нет данных для {clean_symbol} в ответе API. Полный ответ: {data}")
-                    return None, None
-
-                # Получаем данные первой монеты из ответа
-                coin_data = list(data['data'].values())[0] if data['data'] else None
-                if not coin_data:
-                    logger.error(f"Нет данных о монете {clean_symbol}")
-                    return None, None
-
-                # Проверяем структуру данных
-                if isinstance(coin_data, list):
-                    coin_data = coin_data[0]  # Берем первый элемент если это список
-
-                quote = coin_data.get('quote', {}).get('USD', {})
-                if not quote:
-                    logger.error(f"Нет котировок USD для {clean_symbol}")
-                    return None, None
-
-                market_cap = quote.get('market_cap')
-                volume = quote.get('volume_24h')
-
-                if market_cap is None or volume is None:
-                    logger.warning(f"Отсутствуют данные для {clean_symbol}, попытка {attempt + 1}")
-                    await asyncio.sleep(self.delay)
-                    continue
-
-                return market_cap, volume
-
-            except requests.exceptions.RequestException as e:
-                logger.error(f"Ошибка запроса (попытка {attempt + 1}): {str(e)}")
-                if attempt < self.retries - 1:
-                    await asyncio.sleep(self.delay)
+        result = await self.get_market_data_many([clean_symbol])
+        return result.get(clean_symbol, (None, None))
+
+    async def get_market_data_many(self, symbols: Iterable[str]) -> Dict[str, MarketData]:
+        """Рыночные данные для нескольких символов: из кэша, остальное - пакетным запросом по id"""
+        clean_symbols = {self.extract_symbol(symbol).upper() for symbol in symbols}
+
+        try:
+            await self.coin_map.ensure_loaded()
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error("Ошибка получения списка монет: %s", e)
+
+        result: Dict[str, MarketData] = {}
+        waiting: Dict[str, asyncio.Future] = {}
+        unmapped: List[str] = []
+        for clean_symbol in clean_symbols:
+            coin = self.coin_map.by_symbol(clean_symbol)
+            if coin is None:
+                # Символа нет в карте CMC - запрос по символу
+                cached = self._symbol_cache.get(clean_symbol)
+                if cached is not None:
+                    self.hits += 1
+                    result[clean_symbol] = cached
+                else:
+                    self.misses += 1
+                    unmapped.append(clean_symbol)
                 continue
-            except Exception as e:
-                logger.error(f"Критическая ошибка при обработке данных: {str(e)}", exc_info=True)
-                return None, None
 
-        return None, None
+            cached = self._market_cache.get(coin.id)
+            if cached is not None:
+                self.hits += 1
+                result[clean_symbol] = cached
+            else:
+                waiting[clean_symbol] = self._request_quote(coin.id)
+
+        by_symbol = [self._fetch_by_symbols(unmapped[start:start + QUOTES_BATCH_LIMIT])
+                     for start in range(0, len(unmapped), QUOTES_BATCH_LIMIT)]
+        if waiting or by_symbol:
+            # shield: отмена одного ожидающего не отменяет общий пакет для остальных
+            values, *symbol_quotes = await asyncio.gather(
+                asyncio.gather(*(asyncio.shield(future) for future in waiting.values())), *by_symbol
+            )
+            result.update(zip(waiting.keys(), values))
+            for quotes in symbol_quotes:
+                result.update(quotes)
+        return result
+
+    def _request_quote(self, coin_id: int) -> asyncio.Future:
+        """Ставит id в ближайший пакетный запрос; промахи в пределах batch_window объединяются"""
+        future = self._pending.get(coin_id)
+        if future is not None:
+            self.coalesced += 1
+            return future
+
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending[coin_id] = future
+        if self._batch_handle is None:
+            self._batch_handle = loop.call_later(self.batch_window, self._start_batch)
+        return future
+
+    def _start_batch(self):
+        task = asyncio.ensure_future(self._flush_batch())
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    async def _flush_batch(self):
+        pending, self._pending = self._pending, {}
+        self._batch_handle = None
+
+        ids = list(pending)
+        try:
+            for start in range(0, len(ids), QUOTES_BATCH_LIMIT):
+                chunk = ids[start:start + QUOTES_BATCH_LIMIT]
+                quotes = await self._fetch_quotes(chunk)
+                for coin_id in chunk:
+                    market_data = quotes.get(coin_id, (None, None))
+                    if None not in market_data:
+                        self._market_cache[coin_id] = market_data
+                    if not pending[coin_id].done():
+                        pending[coin_id].set_result(market_data)
+        finally:
+            # Ожидающие не должны зависнуть, даже если пакет упал
+            for future in pending.values():
+                if not future.done():
+                    future.set_result((None, None))
+
+    async def _fetch_quotes(self, ids: List[int]) -> Dict[int, MarketData]:
+        """Один запрос котировок для нескольких CMC id"""
+        self.requests += 1
+        try:
+            response = await http_client.get(
+                "cmc",
+                f"{self.base_url}/cryptocurrency/quotes/latest",
+                headers=self.headers,
+                params={'id': ",".join(str(coin_id) for coin_id in ids), 'convert': 'USD'},
+                retries=self.retries - 1
+            )
+            response.raise_for_status()
+            data = response.json().get('data') or {}
+        except httpx.HTTPError as e:
+            logger.error("Ошибка запроса к CoinMarketCap: %s", str(e))
+            return {}
+        except ValueError as e:
+            logger.error("Некорректный ответ CoinMarketCap: %s", str(e))
+            return {}
+
+        quotes = {}
+        for coin_id, coin_data in data.items():
+            quotes[int(coin_id)] = self._parse_quote(coin_data)
+        return quotes
+
+    async def _fetch_by_symbols(self, symbols: List[str]) -> Dict[str, MarketData]:
+        """Один запрос котировок по символам для монет, которых нет в карте CMC.
+        Символы без данных в ответе кэшируются как (None, None), ошибки запроса - нет"""
+        self.requests += 1
+        try:
+            response = await http_client.get(
+                "cmc",
+                f"{self.base_url}/cryptocurrency/quotes/latest",
+                headers=self.headers,
+                params={'symbol': ",".join(symbols), 'convert': 'USD', 'skip_invalid': 'true'},
+                retries=self.retries - 1
+            )
+            response.raise_for_status()
+            data = response.json().get('data') or {}
+        except httpx.HTTPError as e:
+            logger.error("Ошибка запроса к CoinMarketCap: %s", str(e))
+            return {symbol: (None, None) for symbol in symbols}
+        except ValueError as e:
+            logger.error("Некорректный ответ CoinMarketCap: %s", str(e))
+            return {symbol: (None, None) for symbol in symbols}
+
+        quotes = {}
+        for symbol in symbols:
+            # При запросе по символу каждому символу соответствует список монет, берется первая
+            coin_data = data.get(symbol)
+            if not coin_data:
+                logger.warning("Нет данных CoinMarketCap для %s", symbol)
+                quotes[symbol] = (None, None)
+            else:
+                quotes[symbol] = self._parse_quote(coin_data)
+            self._symbol_cache[symbol] = quotes[symbol]
+        return quotes
+
+    @staticmethod
+    def _parse_quote(coin_data) -> MarketData:
+        """Капитализация и объем из объекта монеты (при запросе по символу - список монет)"""
+        if isinstance(coin_data, list):
+            coin_data = coin_data[0] if coin_data else {}  # Берем первый элемент если это список
+
+        quote = (coin_data or {}).get('quote', {}).get('USD', {})
+        if not quote:
+            logger.error("Нет котировок USD для %s", coin_data.get('symbol') if coin_data else 'N/A')
+            return None, None
+
+        return quote.get('market_cap'), quote.get('volume_24h')
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "size": len(self._market_cache),
+            "symbol_size": len(self._symbol_cache),
+            "ttl": self._market_cache.ttl,
+            "maxsize": self._market_cache.maxsize,
+            "pending": len(self._pending),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "requests": self.requests,
+        }
 
     @staticmethod
     def extract_symbol(ticker: str) -> str:
@@ -117,4 +239,4 @@ class CoinMarketCapService:
         int_value = int(value)
 
         # Форматируем с разделителями тысяч
-        return f"{int_value:,}$"  # Добавляем знак доллара
\ No newline at end of file
+        return f"{int_value:,}$"  # Добавляем знак доллара
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+from app.services.http import http_client
+from app.services.snapshot import SnapshotCache
+
+logger = logging.getLogger(__name__)
+
+# Максимальный размер страницы /cryptocurrency/map
+MAP_PAGE_LIMIT = 5000
+# Имя аренды: карту из CMC обновляет один воркер, остальные читают его снимок
+MAP_LEASE = "cmc_map_refresh"
+
+
+class Coin(NamedTuple):
+    id: int
+    symbol: str
+    slug: str
+    rank: Optional[int]
+
+
+class CoinMap(SnapshotCache):
+    """Карта монет CoinMarketCap с O(1) поиском по символу, slug и id.
+    Хранится на диске компактным сжатым снимком по колонкам, загружается при старте
+    и обновляется в фоне, поэтому первый сигнал после перезапуска не ждет CMC"""
+
+    lease_name = MAP_LEASE
+    title = "карты CMC"
+
+    def __init__(self, api_key: str, snapshot_path: Path,
+                 map_url: str = "https://pro-api.coinmarketcap.com/v1/cryptocurrency/map",
+                 overlap: int = 500, full_refresh_every: int = 4):
+        super().__init__(snapshot_path)
+        self.api_key = api_key
+        self.map_url = map_url
+        self.overlap = overlap
+        self.full_refresh_every = full_refresh_every
+        self._by_id: Dict[int, Coin] = {}
+        self._by_symbol: Dict[str, Coin] = {}
+        self._by_slug: Dict[str, Coin] = {}
+        self._refreshes = 0
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def by_symbol(self, symbol: str) -> Optional[Coin]:
+        return self._by_symbol.get(symbol.lower())
+
+    def by_slug(self, slug: str) -> Optional[Coin]:
+        return self._by_slug.get(slug.lower())
+
+    def by_id(self, coin_id: int) -> Optional[Coin]:
+        return self._by_id.get(coin_id)
+
+    @staticmethod
+    def _better(coin: Coin, current: Optional[Coin]) -> bool:
+        """При совпадении символов выигрывает монета с лучшим рангом"""
+        if current is None:
+            return True
+        return (coin.rank or float('inf')) < (current.rank or float('inf'))
+
+    def _rebuild(self, coins: List[Coin]):
+        by_id, by_symbol, by_slug = {}, {}, {}
+        for coin in coins:
+            by_id[coin.id] = coin
+            by_slug[coin.slug.lower()] = coin
+            key = coin.symbol.lower()
+            if self._better(coin, by_symbol.get(key)):
+                by_symbol[key] = coin
+        self._by_id, self._by_symbol, self._by_slug = by_id, by_symbol, by_slug
+
+    def _restore(self, snapshot: dict):
+        self._rebuild([
+            Coin(*fields) for fields in
+            zip(snapshot['ids'], snapshot['symbols'], snapshot['slugs'], snapshot['ranks'])
+        ])
+        # Снимок уже полный - следующее фоновое обновление инкрементальное
+        self._refreshes = 1
+
+    def _snapshot(self) -> dict:
+        coins = sorted(self._by_id.values())
+        return {
+            'ids': [coin.id for coin in coins],
+            'symbols': [coin.symbol for coin in coins],
+            'slugs': [coin.slug for coin in coins],
+            'ranks': [coin.rank for coin in coins],
+        }
+
+    async def _fetch_page(self, start: int, limit: int) -> List[Coin]:
+        response = await http_client.get(
+            "cmc",
+            self.map_url,
+            headers={'Accepts': 'application/json', 'X-CMC_PRO_API_KEY': self.api_key},
+            params={'start': start, 'limit': limit, 'sort': 'id'},
+        )
+        response.raise_for_status()
+        return [
+            Coin(coin['id'], coin['symbol'], coin['slug'], coin.get('rank'))
+            for coin in response.json().get('data', [])
+        ]
+
+    async def refresh(self, full: bool = False):
+        """Полное обновление или инкрементальное: только хвост списка, отсортированного по id,
+        где появляются новые монеты; полное выполняется каждые full_refresh_every обновлений"""
+        async with self._lock:
+            full = full or not self._by_id or self._refreshes % self.full_refresh_every == 0
+            if full:
+                coins: List[Coin] = []
+                start = 1
+                while True:
+                    page = await self._fetch_page(start, MAP_PAGE_LIMIT)
+                    coins.extend(page)
+                    if len(page) < MAP_PAGE_LIMIT:
+                        break
+                    start += MAP_PAGE_LIMIT
+            else:
+                start = max(1, len(self._by_id) - self.overlap + 1)
+                coins = list(self._by_id.values())
+                known = len(coins)
+                while True:
+                    page = await self._fetch_page(start, MAP_PAGE_LIMIT)
+                    coins.extend(page)
+                    if len(page) < MAP_PAGE_LIMIT:
+                        break
+                    start += MAP_PAGE_LIMIT
+                logger.info("Инкрементальное обновление карты CMC: %s записей", len(coins) - known)
+
+            self._rebuild(coins)
+            self.fetched_at = time.time()
+            self._refreshes += 1
+            # Запись на диск не должна блокировать event loop
+            await asyncio.to_thread(self.save)
+            logger.info("Карта CMC обновлена (%s): %s монет", 'полное' if full else 'инкрементальное', len(self))
+
+    async def ensure_loaded(self):
+        """Для холодного старта без снимка: одна загрузка на всех ожидающих"""
+        if not self._by_id:
+            if self._lock.locked():
+                async with self._lock:
+                    return
+            await self.refresh(full=True)
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import random
+import re
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from app.config import Config
+from app.services.breaker import CLOSED, BreakerRegistry, CircuitOpenError, breakers
+from app.services.metrics import (
+    EXTERNAL_ERRORS, EXTERNAL_REQUESTS, EXTERNAL_REQUEST_SECONDS, EXTERNAL_RETRIES, EXTERNAL_SHORT_CIRCUITS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Статусы, при которых имеет смысл повторить запрос
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Токен бота в пути запроса Telegram не должен попадать в метки метрик
+_BOT_TOKEN_RE = re.compile(r'/bot[^/]+/')
+
+
+def endpoint_label(url: str) -> str:
+    """Путь запроса без параметров и секретов - метка endpoint в метриках"""
+    return _BOT_TOKEN_RE.sub('/bot<token>/', httpx.URL(url).path)
+
+
+class HttpClient:
+    """Общий асинхронный HTTP-клиент: пул keep-alive соединений на каждый внешний сервис,
+    таймауты на вызов и повторы с экспоненциальной задержкой без блокировки event loop.
+    Каждый сервис защищен автоматом (circuit breaker) и бюджетом повторов"""
+
+    def __init__(
+        self,
+        timeout: float = Config.HTTP_TIMEOUT,
+        max_connections: int = Config.HTTP_MAX_CONNECTIONS,
+        max_keepalive: int = Config.HTTP_MAX_KEEPALIVE,
+        keepalive_expiry: float = Config.HTTP_KEEPALIVE_EXPIRY,
+        retries: int = Config.HTTP_RETRIES,
+        backoff: float = Config.HTTP_BACKOFF,
+        max_retry_after: float = Config.HTTP_MAX_RETRY_AFTER,
+        max_backoff: float = Config.HTTP_MAX_BACKOFF,
+        breaker_registry: BreakerRegistry = breakers,
+    ):
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.retries = retries
+        self.backoff = backoff
+        self.max_retry_after = max_retry_after
+        self.max_backoff = max_backoff
+        self.breakers = breaker_registry
+        self.transport: Optional[httpx.AsyncBaseTransport] = None
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _get_client(self, service: str) -> httpx.AsyncClient:
+        """Отдельный пул соединений на сервис: медленный MEXC не занимает соединения Telegram"""
+        client = self._clients.get(service)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+                transport=self.transport,
+            )
+            self._clients[service] = client
+        return client
+
+    async def start(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        """Подготавливает клиент к работе (transport позволяет подменить сеть локальными заглушками)"""
+        await self.close()
+        self.transport = transport
+
+    async def close(self):
+        """Закрывает все пулы соединений"""
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Экспоненциальная задержка со случайным разбросом: повторы разных вызовов не совпадают"""
+        delay = min(self.backoff * (2 ** attempt), self.max_backoff)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        """Задержка перед повтором: Retry-After для 429, иначе экспоненциальная с разбросом"""
+        if response is not None and response.status_code == 429:
+            try:
+                retry_after = float(response.headers.get('Retry-After', 5))
+            except ValueError:
+                retry_after = 5.0
+            return min(retry_after, self.max_retry_after)
+        return self.backoff_delay(attempt)
+
+    async def request(
+        self,
+        service: str,
+        method: str,
+        url: str,
+        *,
+        retries: Optional[int] = None,
+        timeout: Optional[float] = None,
+        retry_statuses=RETRY_STATUSES,
+        **kwargs,
+    ) -> httpx.Response:
+        """Выполняет запрос с повторами; после исчерпания попыток возвращает последний ответ
+        или пробрасывает последнюю сетевую ошибку. При разомкнутой цепи - сразу CircuitOpenError"""
+        client = self._get_client(service)
+        retries = self.retries if retries is None else retries
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        labels = (service, endpoint_label(url))
+        breaker = self.breakers.breaker(service)
+        budget = self.breakers.budget(service)
+
+        try:
+            breaker.allow()
+        except CircuitOpenError:
+            EXTERNAL_SHORT_CIRCUITS.inc((service,))
+            raise
+        budget.deposit()
+
+        for attempt in range(retries + 1):
+            response = None
+            if attempt:
+                EXTERNAL_RETRIES.inc(labels)
+            EXTERNAL_REQUESTS.inc(labels)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                EXTERNAL_REQUEST_SECONDS.observe(time.perf_counter() - started, (service,))
+                if response.status_code >= 400:
+                    EXTERNAL_ERRORS.inc(labels)
+                # Сбоем сервиса считаются только 5xx: 4xx - ошибка запроса, 429 - ограничение частоты
+                if response.status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if response.status_code not in retry_statuses or attempt == retries:
+                    return response
+                if not self._may_retry(breaker, budget):
+                    return response
+                logger.warning("%s: статус %s, попытка %s", service, response.status_code, attempt + 1)
+            except httpx.TransportError as e:
+                EXTERNAL_ERRORS.inc(labels)
+                breaker.record_failure()
+                if attempt == retries or not self._may_retry(breaker, budget):
+                    raise
+                logger.warning("%s: сетевая ошибка (%r), попытка %s", service, e, attempt + 1)
+
+            await asyncio.sleep(self._retry_delay(attempt, response))
+
+    @staticmethod
+    def _may_retry(breaker, budget) -> bool:
+        """Повтор не выполняется, если цепь разомкнулась или бюджет повторов исчерпан"""
+        return breaker.state == CLOSED and budget.withdraw()
+
+    async def get(self, service: str, url: str, **kwargs) -> httpx.Response:
+        return await self.request(service, 'GET', url, **kwargs)
+
+    async def post(self, service: str, url: str, **kwargs) -> httpx.Response:
+        return await self.request(service, 'POST', url, **kwargs)
+
+
+http_client = HttpClient()
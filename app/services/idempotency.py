@@ -0,0 +1,125 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+# Поля, в которых TradingView может передать собственный идентификатор алерта
+CLIENT_ID_FIELDS = ('id', 'alert_id', 'idempotency_key')
+# Проверка выполняется в event loop на каждый алерт: при занятой базе ждем недолго
+BUSY_TIMEOUT = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyCache:
+    """Отпечатки недавно принятых алертов в общем файле SQLite: повторы доставки и двойные
+    срабатывания получают сохраненный ответ, на каком бы воркере uvicorn они ни оказались"""
+
+    def __init__(self, db_path: Path, window: float):
+        self.db_path = Path(db_path)
+        self.window = window
+        self._db: Optional[sqlite3.Connection] = None
+        self._purged_at = 0.0
+        self.duplicates = 0
+        self.accepted = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Экземпляр создается при импорте роутера, база открывается при первом алерте
+        if self._db is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.db_path), isolation_level=None, timeout=BUSY_TIMEOUT)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS idempotency ("
+                " fingerprint TEXT PRIMARY KEY,"
+                " response TEXT,"
+                " expires_at REAL NOT NULL)"
+            )
+        return self._db
+
+    def fingerprint(self, data: dict, client_id: Optional[str] = None) -> str:
+        """Идентификатор клиента, если он есть; иначе (тикер, действие, время алерта),
+        а без времени - (тикер, действие)"""
+        client_id = client_id or next(
+            (str(data[field]) for field in CLIENT_ID_FIELDS if data.get(field)), None
+        )
+        if client_id:
+            return f"id:{client_id}"
+
+        raw = f"{str(data.get('ticker', '')).upper()}|{str(data.get('strategy.order.action', '')).lower()}"
+        # {{time}} бара одинаков у повторной доставки и у двойного срабатывания стратегии
+        if data.get('time'):
+            return "bar:" + hashlib.sha1(f"{raw}|{data['time']}".encode('utf-8')).hexdigest()
+        return "fp:" + hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def claim(self, fingerprint: str) -> Tuple[bool, Optional[dict]]:
+        """(False, None), если алерт новый: отпечаток занят до окончания обработки, одновременный
+        дубль на любом воркере не пройдет. (True, ответ), если алерт уже принят; ответ None,
+        пока первый еще обрабатывается. Если база занята дольше BUSY_TIMEOUT, алерт считается
+        новым: лучше возможный дубль, чем потерянный сигнал"""
+        try:
+            return self._claim(fingerprint)
+        except sqlite3.OperationalError as e:
+            logger.warning("Idempotency check skipped for %s: %s", fingerprint, e)
+            return False, None
+
+    def _claim(self, fingerprint: str) -> Tuple[bool, Optional[dict]]:
+        db = self._connection()
+        now = time.time()
+        self._purge(now)
+        db.execute("DELETE FROM idempotency WHERE fingerprint = ? AND expires_at < ?", (fingerprint, now))
+        # INSERT OR IGNORE атомарен для всех процессов на общем файле: вставляет только первый.
+        # Окно отсчитывается от первого принятого алерта и дублями не продлевается
+        cursor = db.execute(
+            "INSERT OR IGNORE INTO idempotency (fingerprint, expires_at) VALUES (?, ?)",
+            (fingerprint, now + self.window),
+        )
+        if cursor.rowcount == 1:
+            return False, None
+        self.duplicates += 1
+        row = db.execute("SELECT response FROM idempotency WHERE fingerprint = ?", (fingerprint,)).fetchone()
+        return True, json.loads(row[0]) if row and row[0] else None
+
+    def complete(self, fingerprint: str, response: dict):
+        self.accepted += 1
+        self._execute(
+            "UPDATE idempotency SET response = ? WHERE fingerprint = ?",
+            (json.dumps(response, ensure_ascii=False, default=str), fingerprint),
+        )
+
+    def release(self, fingerprint: str):
+        """Обработка не удалась - повторная доставка должна пройти"""
+        self._execute("DELETE FROM idempotency WHERE fingerprint = ?", (fingerprint,))
+
+    def _execute(self, sql: str, params: tuple):
+        # Ответ уже отдан клиенту - занятая база не должна превращать его в ошибку
+        try:
+            self._connection().execute(sql, params)
+        except sqlite3.OperationalError as e:
+            logger.warning("Idempotency store busy: %s", e)
+
+    def _purge(self, now: float):
+        # Истекшие отпечатки удаляются не чаще раза за окно
+        if now - self._purged_at >= self.window:
+            self._connection().execute("DELETE FROM idempotency WHERE expires_at < ?", (now,))
+            self._purged_at = now
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def stats(self) -> dict:
+        size = self._connection().execute(
+            "SELECT COUNT(*) FROM idempotency WHERE expires_at >= ?", (time.time(),)
+        ).fetchone()[0]
+        return {
+            "size": size,
+            "window": self.window,
+            "accepted": self.accepted,
+            "duplicates": self.duplicates,
+        }
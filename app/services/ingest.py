@@ -0,0 +1,298 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.logging_config import correlation_id
+from app.services.breaker import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueue:
+    """Надежная локальная очередь входящих алертов (SQLite в режиме WAL).
+    Вебхук только записывает алерт и сразу отвечает, обработку выполняют воркеры
+    с семантикой at-least-once: незавершенные после падения записи обрабатываются повторно"""
+
+    def __init__(
+        self,
+        db_path: Path,
+        handler: Callable[[dict], Awaitable[object]],
+        workers: int = 4,
+        max_attempts: int = 5,
+        retry_delay: float = 5.0,
+        poll_interval: float = 1.0,
+        lease_ttl: float = 300.0,
+    ):
+        self.db_path = Path(db_path)
+        self.handler = handler
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        # Запись в обработке дольше lease_ttl считается брошенной упавшим воркером
+        self.lease_ttl = lease_ttl
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        # Записи в обработке и их текущая аренда: совпадение lease_until подтверждает владение
+        self._inflight: Dict[int, List[float]] = {}
+        self.accepted = 0
+        self.processed = 0
+        self.failed = 0
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.db_path), isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS ingest ("
+            " id INTEGER PRIMARY KEY,"
+            " payload TEXT NOT NULL,"
+            " status TEXT NOT NULL DEFAULT 'pending',"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " available_at REAL NOT NULL,"
+            " received_at REAL NOT NULL,"
+            " error TEXT,"
+            " lease_until REAL NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(ingest)")}
+        if 'lease_until' not in columns:
+            self._db.execute("ALTER TABLE ingest ADD COLUMN lease_until REAL NOT NULL DEFAULT 0")
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_ingest_status ON ingest (status, available_at)")
+
+    def put(self, payload: dict) -> int:
+        """Записывает алерт на диск; после возврата алерт не потеряется при падении процесса"""
+        now = time.time()
+        cursor = self._db.execute(
+            "INSERT INTO ingest (payload, available_at, received_at) VALUES (?, ?, ?)",
+            (json.dumps(payload, ensure_ascii=False), now, now),
+        )
+        self.accepted += 1
+        self._wakeup.set()
+        return cursor.lastrowid
+
+    def _claim(self) -> Optional[tuple]:
+        """Забирает самую старую готовую запись или запись с истекшей арендой: (id, алерт, попытки, аренда).
+        BEGIN IMMEDIATE берет блокировку файла, поэтому ни воркеры одного процесса,
+        ни другие процессы на той же базе не заберут одну запись дважды"""
+        now = time.time()
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._db.execute(
+                "SELECT id, payload, attempts FROM ingest"
+                " WHERE (status = 'pending' AND available_at <= ?)"
+                " OR (status = 'processing' AND lease_until < ?) ORDER BY id LIMIT 1",
+                (now, now),
+            ).fetchone()
+            if row is not None:
+                row = (*row, now + self.lease_ttl)
+                self._db.execute(
+                    "UPDATE ingest SET status = 'processing', attempts = attempts + 1, lease_until = ?"
+                    " WHERE id = ?",
+                    (row[3], row[0]),
+                )
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+        return row
+
+    # Завершение, ошибка и отсрочка меняют запись, только пока воркер держит ее аренду:
+    # запись, перехваченную другим воркером после истечения аренды, обрабатывает он
+
+    def _complete(self, item_id: int, lease_until: float) -> bool:
+        cursor = self._db.execute("DELETE FROM ingest WHERE id = ? AND lease_until = ?", (item_id, lease_until))
+        return cursor.rowcount == 1
+
+    def _fail(self, item_id: int, lease_until: float, attempts: int, error: str):
+        if attempts >= self.max_attempts:
+            # Исчерпаны попытки - запись остается в базе для разбора
+            cursor = self._db.execute(
+                "UPDATE ingest SET status = 'failed', error = ? WHERE id = ? AND lease_until = ?",
+                (error, item_id, lease_until),
+            )
+            if cursor.rowcount:
+                self.failed += 1
+                logger.error("Алерт %s не обработан после %s попыток: %s", item_id, attempts, error)
+        else:
+            self._db.execute(
+                "UPDATE ingest SET status = 'pending', available_at = ?, error = ? WHERE id = ? AND lease_until = ?",
+                (time.time() + self.retry_delay * attempts, error, item_id, lease_until),
+            )
+
+    def _defer(self, item_id: int, lease_until: float, attempts: int, delay: float, error: str):
+        self._db.execute(
+            "UPDATE ingest SET status = 'pending', attempts = ?, available_at = ?, error = ?"
+            " WHERE id = ? AND lease_until = ?",
+            (attempts, time.time() + max(delay, self.retry_delay), error, item_id, lease_until),
+        )
+
+    async def _renew(self, item_id: int, lease: List[float]):
+        """Продлевает аренду, пока алерт обрабатывается, чтобы его не забрал другой воркер"""
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            lease_until = time.time() + self.lease_ttl
+            try:
+                cursor = self._db.execute(
+                    "UPDATE ingest SET lease_until = ? WHERE id = ? AND lease_until = ?",
+                    (lease_until, item_id, lease[0]),
+                )
+            except sqlite3.Error as e:
+                logger.warning("Аренда алерта %s не продлена: %s", item_id, e)
+                continue
+            if cursor.rowcount != 1:
+                logger.warning("Аренда алерта %s перехвачена другим воркером", item_id)
+                return
+            lease[0] = lease_until
+
+    def recover(self) -> int:
+        """После падения возвращает в очередь записи, обработка которых не завершилась.
+        Записи в действующей аренде других воркеров не трогает"""
+        cursor = self._db.execute(
+            "UPDATE ingest SET status = 'pending' WHERE status = 'processing' AND lease_until < ?",
+            (time.time(),),
+        )
+        if cursor.rowcount:
+            logger.warning("Повторная обработка незавершенных алертов: %s", cursor.rowcount)
+        return cursor.rowcount
+
+    async def start(self):
+        self.recover()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Прерванные при остановке записи сразу возвращаются в очередь, после падения - по истечении аренды
+        self._db.executemany(
+            "UPDATE ingest SET status = 'pending', lease_until = 0 WHERE id = ? AND lease_until = ?",
+            [(item_id, lease[0]) for item_id, lease in self._inflight.items()],
+        )
+        self._inflight.clear()
+        self._db.close()
+
+    async def _worker(self):
+        while True:
+            row = self._claim()
+            if row is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            item_id, payload, attempts, lease_until = row
+            lease = self._inflight[item_id] = [lease_until]
+            # Записи журнала при обработке помечаются номером алерта из ответа вебхука
+            correlation_id.set(f"alert-{item_id}")
+            renewer = asyncio.create_task(self._renew(item_id, lease))
+            try:
+                await self.handler(json.loads(payload))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                blocked = e if isinstance(e, CircuitOpenError) else e.__cause__
+                if isinstance(blocked, CircuitOpenError):
+                    # Сервис недоступен: попытка не засчитывается, алерт ждет пробного окна
+                    logger.warning("Алерт %s отложен: %s", item_id, blocked)
+                    self._defer(item_id, lease[0], attempts, blocked.retry_in, str(e))
+                else:
+                    logger.warning("Ошибка обработки алерта %s (попытка %s): %s", item_id, attempts + 1, e)
+                    self._fail(item_id, lease[0], attempts + 1, str(e))
+            else:
+                if self._complete(item_id, lease[0]):
+                    self.processed += 1
+                else:
+                    logger.warning("Алерт %s обработан после потери аренды", item_id)
+            finally:
+                renewer.cancel()
+            self._inflight.pop(item_id, None)
+
+    def stats(self) -> dict:
+        counts = dict(self._db.execute("SELECT status, COUNT(*) FROM ingest GROUP BY status").fetchall())
+        oldest = self._db.execute(
+            "SELECT MIN(received_at) FROM ingest WHERE status != 'failed'"
+        ).fetchone()[0]
+        return {
+            "pending": counts.get('pending', 0),
+            "processing": counts.get('processing', 0),
+            "failed": counts.get('failed', 0),
+            "oldest_age": time.time() - oldest if oldest else 0.0,
+            "accepted": self.accepted,
+            "processed": self.processed,
+            "dead_lettered": self.failed,
+            "workers": self.workers,
+        }
+
+
+class Outbox:
+    """Исходящие уведомления Telegram в той же базе, что и очередь алертов.
+    Алерт удаляется из очереди после обработки, а его сообщение хранится здесь до доставки:
+    после падения процесса недоставленные сообщения забирает живой воркер по истечении аренды"""
+
+    def __init__(self, db_path: Path, lease_ttl: float = 300.0):
+        self.db_path = Path(db_path)
+        self.lease_ttl = lease_ttl
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.db_path), isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY,"
+            " chat_id TEXT NOT NULL,"
+            " text TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " lease_until REAL NOT NULL)"
+        )
+
+    def add(self, chat_id: str, text: str) -> int:
+        now = time.time()
+        cursor = self._db.execute(
+            "INSERT INTO outbox (chat_id, text, created_at, lease_until) VALUES (?, ?, ?, ?)",
+            (str(chat_id), text, now, now + self.lease_ttl),
+        )
+        return cursor.lastrowid
+
+    def done(self, ids: Iterable[int]):
+        self._db.executemany("DELETE FROM outbox WHERE id = ?", [(item_id,) for item_id in ids])
+
+    def renew(self, ids: Iterable[int]):
+        """Продлевает аренду сообщений, которые еще ждут отправки в этом процессе"""
+        lease_until = time.time() + self.lease_ttl
+        self._db.executemany(
+            "UPDATE outbox SET lease_until = ? WHERE id = ?", [(lease_until, item_id) for item_id in ids]
+        )
+
+    def release(self, ids: Iterable[int]):
+        """Сообщения, не отправленные до остановки или из-за сбоя, сразу доступны для повторной отправки"""
+        self._db.executemany("UPDATE outbox SET lease_until = 0 WHERE id = ?", [(item_id,) for item_id in ids])
+
+    def claim(self, limit: int = 100) -> List[Tuple[int, str, str]]:
+        """Забирает сообщения с истекшей арендой: (id, chat_id, текст)"""
+        now = time.time()
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self._db.execute(
+                "SELECT id, chat_id, text FROM outbox WHERE lease_until < ? ORDER BY id LIMIT ?", (now, limit)
+            ).fetchall()
+            self._db.executemany(
+                "UPDATE outbox SET lease_until = ? WHERE id = ?", [(now + self.lease_ttl, row[0]) for row in rows]
+            )
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+        return rows
+
+    def pending(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def close(self):
+        self._db.close()
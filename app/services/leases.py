@@ -0,0 +1,75 @@
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+# Идентификатор процесса-владельца аренды: воркеры uvicorn и реплики на общем томе различаются
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+# Выполненная разовая работа (например, отчет за день) переходит этому владельцу навсегда
+DONE_OWNER = "done"
+DONE_TTL = 10 * 365 * 24 * 60 * 60
+# Аренды берутся из event loop: при занятой базе не ждем, а пробуем на следующем цикле
+BUSY_TIMEOUT = 1.0
+
+
+class LeaseStore:
+    """Именованные аренды в общем файле SQLite: работу выполняет только владелец аренды,
+    владелец продлевает ее, а после истечения срока ее забирает другой процесс"""
+
+    def __init__(self, db_path: Path, owner: str = WORKER_ID):
+        self.db_path = Path(db_path)
+        self.owner = owner
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.db_path), isolation_level=None, timeout=BUSY_TIMEOUT)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS leases ("
+            " name TEXT PRIMARY KEY,"
+            " owner TEXT NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+
+    def acquire(self, name: str, ttl: float) -> bool:
+        """Берет свободную или истекшую аренду либо продлевает свою; False и при занятой базе"""
+        now = time.time()
+        try:
+            cursor = self._db.execute(
+                "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at"
+                " WHERE leases.owner = excluded.owner OR leases.expires_at < ?",
+                (name, self.owner, now + ttl, now),
+            )
+        except sqlite3.OperationalError:
+            return False
+        return cursor.rowcount == 1
+
+    def renew(self, name: str, ttl: float) -> bool:
+        cursor = self._db.execute(
+            "UPDATE leases SET expires_at = ? WHERE name = ? AND owner = ?",
+            (time.time() + ttl, name, self.owner),
+        )
+        return cursor.rowcount == 1
+
+    def release(self, name: str):
+        self._db.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, self.owner))
+
+    def complete(self, name: str):
+        """Помечает разовую работу выполненной: ее не возьмет ни другой воркер, ни этот же"""
+        self._db.execute(
+            "UPDATE leases SET owner = ?, expires_at = ? WHERE name = ? AND owner = ?",
+            (DONE_OWNER, time.time() + DONE_TTL, name, self.owner),
+        )
+
+    def holder(self, name: str) -> Optional[dict]:
+        row = self._db.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        return {"owner": row[0], "expires_in": row[1] - time.time()}
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,162 @@
+import asyncio
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Границы корзин гистограмм задержек в секундах
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LAG_BUCKETS = (0.1, 1, 5, 15, 60, 300, 900, 3600)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    """Монотонный счетчик; метки передаются кортежем значений, без построения словарей"""
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Gauge(_Metric):
+    """Текущее значение: задается явно или читается функцией в момент сбора"""
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+        self._function: Optional[Callable[[], Dict[Labels, float]]] = None
+
+    def set(self, value: float, labels: Labels = ()):
+        self._values[labels] = value
+
+    def set_function(self, function: Callable[[], Dict[Labels, float]]):
+        self._function = function
+
+    def render(self) -> List[str]:
+        values = self._values
+        if self._function is not None:
+            try:
+                values = self._function()
+            except Exception:
+                values = {}
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+            for labels, value in values.items()
+        ]
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными корзинами: observe - bisect и два сложения"""
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self._counts: Dict[Labels, List[int]] = {}
+        self._sums: Dict[Labels, float] = {}
+
+    def observe(self, value: float, labels: Labels = ()):
+        counts = self._counts.get(labels)
+        if counts is None:
+            counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+            self._sums[labels] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self._sums[labels] += value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, counts in self._counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{float(bound)!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {self._sums[labels]}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+WEBHOOK_STAGE_SECONDS = REGISTRY.register(Histogram(
+    "webhook_stage_seconds", "Duration of webhook pipeline stages", ["stage"]))
+EXTERNAL_REQUESTS = REGISTRY.register(Counter(
+    "external_requests_total", "Requests to external APIs", ["service", "endpoint"]))
+EXTERNAL_ERRORS = REGISTRY.register(Counter(
+    "external_errors_total", "Failed requests to external APIs (network errors and 4xx/5xx)",
+    ["service", "endpoint"]))
+EXTERNAL_RETRIES = REGISTRY.register(Counter(
+    "external_retries_total", "Retried requests to external APIs", ["service", "endpoint"]))
+EXTERNAL_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "external_request_seconds", "Latency of external API requests", ["service"]))
+EXTERNAL_SHORT_CIRCUITS = REGISTRY.register(Counter(
+    "external_short_circuits_total", "Calls rejected by an open circuit breaker", ["service"]))
+CIRCUIT_STATE = REGISTRY.register(Gauge(
+    "circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ["service"]))
+INTERVAL_JOBS_PENDING = REGISTRY.register(Gauge(
+    "interval_jobs_pending", "Signals with pending interval checks"))
+INTERVAL_JOB_LAG_SECONDS = REGISTRY.register(Histogram(
+    "interval_job_lag_seconds", "How late interval checks fire after their due time", buckets=LAG_BUCKETS))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "queue_depth", "Depth of internal queues", ["queue"]))
+EVENT_LOOP_LAG_SECONDS = REGISTRY.register(Histogram(
+    "event_loop_lag_seconds", "Event loop scheduling lag"))
+
+
+async def monitor_event_loop(interval: float = 0.5):
+    """Измеряет, насколько позже запланированного просыпается корутина: это и есть лаг event loop"""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(0.0, time.perf_counter() - started - interval))
@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from app.services.http import http_client
+
+logger = logging.getLogger(__name__)
+
+
+class PriceCache:
+    """TTL-кэш цен по торговой паре с объединением параллельных запросов (single-flight)"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._prices: Dict[str, Tuple[float, float]] = {}  # пара -> (цена, время получения)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get_fresh(self, key: str):
+        """Возвращает цену, если она моложе ttl, иначе None"""
+        cached = self._prices.get(key)
+        if cached is not None and time.monotonic() - cached[1] < self.ttl:
+            return cached[0]
+        return None
+
+    def get_last(self, key: str, max_age: float):
+        """Последняя известная цена не старше max_age (для работы при недоступном API), иначе None"""
+        cached = self._prices.get(key)
+        if cached is not None and time.monotonic() - cached[1] < max_age:
+            return cached[0]
+        return None
+
+    def put(self, key: str, price: float):
+        self._prices[key] = (price, time.monotonic())
+
+    async def get(self, key: str, fetch: Callable[[], Awaitable[float]]) -> float:
+        """Цена из кэша, из уже идущего запроса или из нового запроса через fetch"""
+        price = self.get_fresh(key)
+        if price is not None:
+            self.hits += 1
+            return price
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(fetch())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._on_fetched(key, t))
+
+        # shield: отмена одного ожидающего не отменяет общий запрос для остальных
+        return await asyncio.shield(task)
+
+    def _on_fetched(self, key: str, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self.put(key, task.result())
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "ttl": self.ttl,
+            "size": len(self._prices),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
+
+
+class MexcService:
+    def __init__(self, cache_ttl: float, snapshot_ttl: float, base_url: str = "https://api.mexc.com/api/v3"):
+        self.base_url = base_url
+        self.cache = PriceCache(ttl=cache_ttl)
+        self.snapshot_ttl = snapshot_ttl
+        self._snapshot: Dict[str, float] = {}
+        self._snapshot_at = 0.0
+        self._snapshot_task: Optional[asyncio.Task] = None
+        self.snapshot_fetches = 0
+
+    @staticmethod
+    def trading_pair(symbol: str) -> str:
+        """Формирует торговую пару (обратите внимание на отсутствие подчеркивания)"""
+        clean_symbol = symbol.upper().strip()
+        if not clean_symbol:
+            raise ValueError("Empty symbol provided")
+        return f"{clean_symbol}USDT"
+
+    async def get_price(self, symbol: str) -> float:
+        """Текущая цена пары к USDT; одновременные запросы одной пары объединяются"""
+        trading_pair = self.trading_pair(symbol)
+        return await self.cache.get(trading_pair, lambda: self._fetch_price(trading_pair))
+
+    def last_price(self, symbol: str, max_age: float) -> Optional[float]:
+        """Последняя полученная цена пары к USDT (одиночный запрос или снимок) без обращения к API"""
+        return self.cache.get_last(self.trading_pair(symbol), max_age)
+
+    async def get_snapshot(self) -> Dict[str, float]:
+        """Таблица пара -> цена из одного bulk-запроса; все проверки в пределах
+        snapshot_ttl читают одну и ту же таблицу"""
+        if self._snapshot and time.monotonic() - self._snapshot_at < self.snapshot_ttl:
+            return self._snapshot
+
+        if self._snapshot_task is None:
+            self._snapshot_task = asyncio.ensure_future(self._fetch_snapshot())
+            self._snapshot_task.add_done_callback(self._on_snapshot_fetched)
+        return await asyncio.shield(self._snapshot_task)
+
+    def _on_snapshot_fetched(self, task: asyncio.Task):
+        self._snapshot_task = None
+        if not task.cancelled() and task.exception() is None:
+            self._snapshot = task.result()
+            self._snapshot_at = time.monotonic()
+
+    async def get_snapshot_price(self, symbol: str) -> float:
+        """Цена из общего снимка; для пары, которой нет в снимке, - отдельный запрос"""
+        trading_pair = self.trading_pair(symbol)
+        snapshot = await self.get_snapshot()
+        price = snapshot.get(trading_pair)
+        if price is None:
+            return await self.get_price(symbol)
+        return price
+
+    async def _fetch_snapshot(self) -> Dict[str, float]:
+        # Без параметра symbol MEXC возвращает цены всех пар одним ответом
+        response = await http_client.get("mexc", f"{self.base_url}/ticker/price")
+        response.raise_for_status()
+
+        data = response.json()
+        if not isinstance(data, list):
+            raise ValueError(f"Invalid API response structure: {type(data).__name__}")
+
+        snapshot = {}
+        for item in data:
+            try:
+                snapshot[item['symbol']] = float(item['price'])
+            except (KeyError, TypeError, ValueError):
+                continue
+
+        # Снимок заодно прогревает кэш одиночных цен
+        for trading_pair, price in snapshot.items():
+            self.cache.put(trading_pair, price)
+
+        self.snapshot_fetches += 1
+        logger.debug("Получен снимок цен MEXC: %s пар", len(snapshot))
+        return snapshot
+
+    async def _fetch_price(self, trading_pair: str) -> float:
+        response = await http_client.get(
+            "mexc",
+            f"{self.base_url}/ticker/price",
+            params={"symbol": trading_pair},
+        )
+
+        # Логируем URL для отладки
+        logger.debug("MEXC API request URL: %s", response.url)
+
+        response.raise_for_status()
+
+        data = response.json()
+
+        # Проверяем структуру ответа
+        if not isinstance(data, dict) or 'price' not in data:
+            raise ValueError(f"Invalid API response structure: {data}")
+
+        price = float(data['price'])
+        logger.debug("Успешно получена цена для %s: %s", trading_pair, price)
+        return price
+
+    async def get_klines(self, symbol: str, start_ms: int, end_ms: int, interval: str = "1m",
+                         limit: int = 1000) -> Dict[int, float]:
+        """Цены закрытия свечей пары к USDT за [start_ms, end_ms]: время открытия (мс) -> close"""
+        response = await http_client.get(
+            "mexc",
+            f"{self.base_url}/klines",
+            params={
+                "symbol": self.trading_pair(symbol),
+                "interval": interval,
+                "startTime": start_ms,
+                "endTime": end_ms,
+                "limit": limit,
+            },
+        )
+        response.raise_for_status()
+
+        data = response.json()
+        if not isinstance(data, list):
+            raise ValueError(f"Invalid API response structure: {type(data).__name__}")
+
+        # Свеча: [время открытия, open, high, low, close, volume, время закрытия, оборот]
+        closes = {}
+        for kline in data:
+            try:
+                closes[int(kline[0])] = float(kline[4])
+            except (IndexError, TypeError, ValueError):
+                continue
+        return closes
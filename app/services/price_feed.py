@@ -0,0 +1,376 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from array import array
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+Tick = Tuple[str, float, float]  # символ, цена, время (unix, секунды)
+
+
+class PriceTable:
+    """Последняя цена и время по символу в двух массивах double.
+    Символу выделяется слот, освобожденные слоты переиспользуются"""
+
+    def __init__(self):
+        self._slots: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._prices = array('d')
+        self._times = array('d')
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol.upper() in self._slots
+
+    def symbols(self) -> List[str]:
+        return list(self._slots)
+
+    def add(self, symbol: str) -> int:
+        symbol = symbol.upper()
+        slot = self._slots.get(symbol)
+        if slot is not None:
+            return slot
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = len(self._prices)
+            self._prices.append(0.0)
+            self._times.append(0.0)
+        self._prices[slot] = 0.0
+        self._times[slot] = 0.0
+        self._slots[symbol] = slot
+        return slot
+
+    def remove(self, symbol: str):
+        slot = self._slots.pop(symbol.upper(), None)
+        if slot is not None:
+            self._free.append(slot)
+
+    def update(self, symbol: str, price: float, ts: float) -> bool:
+        """Записывает тик; тики неотслеживаемых символов и устаревшие по времени отбрасываются"""
+        slot = self._slots.get(symbol)
+        if slot is None or ts < self._times[slot]:
+            return False
+        self._prices[slot] = price
+        self._times[slot] = ts
+        return True
+
+    def get(self, symbol: str, max_age: Optional[float] = None) -> Optional[float]:
+        """Последняя цена или None, если тиков еще не было или они старше max_age"""
+        slot = self._slots.get(symbol.upper())
+        if slot is None or not self._times[slot]:
+            return None
+        if max_age is not None and time.time() - self._times[slot] > max_age:
+            return None
+        return self._prices[slot]
+
+    def age(self, symbol: str) -> Optional[float]:
+        slot = self._slots.get(symbol.upper())
+        if slot is None or not self._times[slot]:
+            return None
+        return time.time() - self._times[slot]
+
+
+# Номера полей protobuf-сообщений MEXC (PushDataV3ApiWrapper.proto)
+WRAPPER_SYMBOL = 3
+WRAPPER_AGGRE_DEALS = 314
+DEALS_ITEM = 1
+DEAL_PRICE = 1
+DEAL_TIME = 4
+
+
+def _varint(data: bytes, pos: int) -> Tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _fields(data: bytes) -> Iterator[Tuple[int, object]]:
+    """Поля сообщения protobuf: (номер, значение); строки и вложенные сообщения - bytes"""
+    pos = 0
+    while pos < len(data):
+        key, pos = _varint(data, pos)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = _varint(data, pos)
+        elif wire_type == 2:
+            length, pos = _varint(data, pos)
+            value, pos = data[pos:pos + length], pos + length
+        elif wire_type == 1:
+            value, pos = data[pos:pos + 8], pos + 8
+        elif wire_type == 5:
+            value, pos = data[pos:pos + 4], pos + 4
+        else:
+            raise ValueError(f"unsupported protobuf wire type {wire_type}")
+        yield number, value
+
+
+class MexcFeedSource:
+    """Поток сделок MEXC spot через WebSocket (пакет websockets подключается только в этом режиме).
+    Каналы v3 отдают protobuf, разбираются только нужные поля без сгенерированных классов.
+    MEXC допускает не больше 30 подписок на соединение - символы распределяются по нескольким"""
+
+    CHANNEL = "spot@public.aggre.deals.v3.api.pb@100ms@{pair}"
+    MAX_SUBSCRIPTIONS = 30
+
+    def __init__(self, url: str):
+        self.url = url
+        self._sockets: List[object] = []
+        self._symbols: List[Set[str]] = []  # подписки каждого соединения
+        self._readers: List[asyncio.Task] = []
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    async def connect(self):
+        # Соединения открываются при подписке, по одному на MAX_SUBSCRIPTIONS символов
+        self._queue = asyncio.Queue()
+
+    async def _open(self) -> int:
+        import websockets
+
+        ws = await websockets.connect(self.url, ping_interval=20, ping_timeout=20)
+        self._sockets.append(ws)
+        self._symbols.append(set())
+        self._readers.append(asyncio.create_task(self._read(ws)))
+        return len(self._sockets) - 1
+
+    async def close(self):
+        for reader in self._readers:
+            reader.cancel()
+        for ws in self._sockets:
+            await ws.close()
+        self._sockets, self._symbols, self._readers = [], [], []
+
+    async def _read(self, ws):
+        # Тики всех соединений идут в одну очередь; обрыв любого переподключает поток целиком
+        try:
+            async for raw in ws:
+                tick = self.parse(raw)
+                if tick is not None:
+                    self._queue.put_nowait(tick)
+            raise ConnectionError("MEXC stream closed")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._queue.put_nowait(e)
+
+    def _message(self, method: str, symbols: List[str]) -> str:
+        params = [self.CHANNEL.format(pair=f"{symbol}USDT") for symbol in symbols]
+        return json.dumps({"method": method, "params": params})
+
+    async def subscribe(self, symbols: List[str]):
+        pending = [symbol for symbol in symbols if not any(symbol in subscribed for subscribed in self._symbols)]
+        while pending:
+            index = next(
+                (i for i, subscribed in enumerate(self._symbols) if len(subscribed) < self.MAX_SUBSCRIPTIONS), None
+            )
+            if index is None:
+                index = await self._open()
+            chunk = pending[:self.MAX_SUBSCRIPTIONS - len(self._symbols[index])]
+            pending = pending[len(chunk):]
+            await self._sockets[index].send(self._message("SUBSCRIPTION", chunk))
+            self._symbols[index].update(chunk)
+
+    async def unsubscribe(self, symbols: List[str]):
+        for ws, subscribed in zip(self._sockets, self._symbols):
+            chunk = [symbol for symbol in symbols if symbol in subscribed]
+            if chunk:
+                await ws.send(self._message("UNSUBSCRIPTION", chunk))
+                subscribed.difference_update(chunk)
+
+    @staticmethod
+    def parse(raw) -> Optional[Tick]:
+        """Последняя сделка из PushDataV3ApiWrapper с телом publicAggreDeals
+        или None для служебных JSON-ответов и других каналов"""
+        if not isinstance(raw, (bytes, bytearray)):
+            return None
+        try:
+            pair, deals = None, None
+            for number, value in _fields(raw):
+                if number == WRAPPER_SYMBOL:
+                    pair = value.decode()
+                elif number == WRAPPER_AGGRE_DEALS:
+                    deals = value
+            if pair is None or deals is None or not pair.endswith("USDT"):
+                return None
+            last = None
+            for number, value in _fields(deals):
+                if number == DEALS_ITEM:
+                    deal = dict(_fields(value))
+                    if last is None or deal.get(DEAL_TIME, 0) >= last.get(DEAL_TIME, 0):
+                        last = deal
+            if last is None:
+                return None
+            return pair[:-4], float(last[DEAL_PRICE].decode()), last[DEAL_TIME] / 1000
+        except (IndexError, KeyError, ValueError, AttributeError):
+            return None
+
+    async def ticks(self) -> AsyncIterator[Tick]:
+        while True:
+            item = await self._queue.get()
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+class LocalFeedSource:
+    """Локальная замена биржевого потока: тики подаются через push() или генерируются
+    случайным блужданием от стартовых цен каждые tick_interval секунд"""
+
+    def __init__(self, prices: Optional[Dict[str, float]] = None, tick_interval: Optional[float] = None,
+                 seed: int = 0):
+        self.prices = {symbol.upper(): price for symbol, price in (prices or {}).items()}
+        self.tick_interval = tick_interval
+        self.subscribed = set()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._rng = random.Random(seed)
+
+    async def connect(self):
+        self._queue = asyncio.Queue()
+
+    async def close(self):
+        pass
+
+    async def subscribe(self, symbols: List[str]):
+        self.subscribed.update(symbols)
+
+    async def unsubscribe(self, symbols: List[str]):
+        self.subscribed.difference_update(symbols)
+
+    def push(self, symbol: str, price: float, ts: Optional[float] = None):
+        symbol = symbol.upper()
+        self.prices[symbol] = price
+        if symbol in self.subscribed:
+            self._queue.put_nowait((symbol, price, ts or time.time()))
+
+    async def ticks(self) -> AsyncIterator[Tick]:
+        while True:
+            try:
+                yield await asyncio.wait_for(self._queue.get(), self.tick_interval)
+            except asyncio.TimeoutError:
+                now = time.time()
+                for symbol in list(self.subscribed):
+                    price = self.prices.get(symbol)
+                    if price:
+                        price = self.prices[symbol] = price * (1 + self._rng.gauss(0, 0.001))
+                        yield symbol, price, now
+
+
+class PriceFeed:
+    """Потоковые цены только по символам с незавершенными интервальными проверками.
+    Подписки добавляются и снимаются планировщиком, переподключение - с экспоненциальной задержкой"""
+
+    def __init__(self, source, max_backoff: float = 30.0):
+        self.source = source
+        self.max_backoff = max_backoff
+        self.table = PriceTable()
+        self._changes: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self.connected = False
+        self.ticks = 0
+        self.reconnects = 0
+
+    def subscribe(self, symbol: str):
+        symbol = symbol.upper()
+        if symbol not in self.table:
+            self.table.add(symbol)
+            self._changes.put_nowait((True, symbol))
+
+    def unsubscribe(self, symbol: str):
+        symbol = symbol.upper()
+        if symbol in self.table:
+            self.table.remove(symbol)
+            self._changes.put_nowait((False, symbol))
+
+    def sync(self, symbols: Iterable[str]):
+        """Приводит подписки к заданному набору символов (после загрузки планировщика)"""
+        wanted = {symbol.upper() for symbol in symbols}
+        for symbol in self.table.symbols():
+            if symbol not in wanted:
+                self.unsubscribe(symbol)
+        for symbol in wanted:
+            self.subscribe(symbol)
+
+    def get(self, symbol: str, max_age: Optional[float] = None) -> Optional[float]:
+        return self.table.get(symbol, max_age)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        backoff = 1.0
+        while True:
+            try:
+                await self._session()
+                backoff = 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Поток цен прерван: %r, переподключение через %.0f с", e, backoff)
+            self.connected = False
+            self.reconnects += 1
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def _session(self):
+        await self.source.connect()
+        try:
+            # Изменения, накопленные без соединения, покрываются полной подпиской
+            while not self._changes.empty():
+                self._changes.get_nowait()
+            symbols = self.table.symbols()
+            if symbols:
+                await self.source.subscribe(symbols)
+            self.connected = True
+            logger.info("Поток цен подключен, символов: %s", len(symbols))
+
+            consumer = asyncio.create_task(self._consume())
+            try:
+                while True:
+                    change = asyncio.create_task(self._changes.get())
+                    done, _ = await asyncio.wait({consumer, change}, return_when=asyncio.FIRST_COMPLETED)
+                    if consumer in done:
+                        change.cancel()
+                        consumer.result()
+                        raise ConnectionError("price stream closed")
+                    added, symbol = change.result()
+                    if added:
+                        await self.source.subscribe([symbol])
+                    else:
+                        await self.source.unsubscribe([symbol])
+            finally:
+                consumer.cancel()
+        finally:
+            await self.source.close()
+
+    async def _consume(self):
+        async for symbol, price, ts in self.source.ticks():
+            if self.table.update(symbol, price, ts):
+                self.ticks += 1
+
+    def stats(self) -> dict:
+        return {
+            "connected": self.connected,
+            "symbols": len(self.table),
+            "ticks": self.ticks,
+            "reconnects": self.reconnects,
+            "ages": {symbol: self.table.age(symbol) for symbol in self.table.symbols()},
+        }
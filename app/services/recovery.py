@@ -0,0 +1,111 @@
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import httpx
+import pytz
+
+from app.services.scheduler import INTERVALS
+
+logger = logging.getLogger(__name__)
+
+# Имя аренды: пропущенные проверки восстанавливает один воркер
+RECOVERY_LEASE = "interval_recovery"
+# Минутные свечи: цена на границе интервала - закрытие последней завершенной минуты
+CANDLE = 60
+# Максимум свечей в одном ответе MEXC klines
+KLINE_LIMIT = 1000
+# Время сигнала в таблице записывается по Москве
+SHEET_TZ = pytz.timezone('Europe/Moscow')
+SHEET_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class MissedCheck(NamedTuple):
+    row: int
+    symbol: str
+    action: str
+    entry_price: float
+    interval: int  # индекс в INTERVALS
+    boundary: float  # unix-время границы интервала
+
+    @property
+    def candle(self) -> int:
+        """Время открытия минутной свечи, закрывшейся не позже границы"""
+        return int(self.boundary // CANDLE) * CANDLE - CANDLE
+
+
+def _number(value) -> Optional[float]:
+    try:
+        return float(str(value).replace('\xa0', '').replace(' ', '').replace(',', '.'))
+    except ValueError:
+        return None
+
+
+def find_missed_checks(rows: Sequence[Sequence[object]], now: float, max_age: float) -> List[MissedCheck]:
+    """Проверки из строк листа, у которых граница интервала прошла, а ячейка цены пуста.
+    Строки: символ, действие, цена входа, время сигнала, затем цена и % на каждый интервал"""
+    checks = []
+    for index, cells in enumerate(rows[1:], start=2):
+        if len(cells) < 4 or not cells[0]:
+            continue
+        entry_price = _number(cells[2])
+        try:
+            entry_ts = SHEET_TZ.localize(datetime.strptime(str(cells[3]), SHEET_TIME_FORMAT)).timestamp()
+        except ValueError:
+            continue
+        if not entry_price:
+            continue
+        for interval, (_, seconds) in enumerate(INTERVALS):
+            boundary = entry_ts + seconds
+            if boundary > now or now - boundary > max_age:
+                continue
+            col = 4 + interval * 2  # индекс ячейки цены (колонка 5 + interval * 2)
+            if len(cells) > col and str(cells[col]).strip():
+                continue
+            checks.append(MissedCheck(
+                index, str(cells[0]).upper(), str(cells[1]).lower(), entry_price, interval, boundary
+            ))
+    return checks
+
+
+def kline_windows(candles: Sequence[int], limit: int = KLINE_LIMIT) -> List[Tuple[int, int]]:
+    """Группирует отсортированные времена свечей в диапазоны не длиннее limit свечей:
+    одна выборка klines на диапазон вместо запроса на каждую ячейку"""
+    windows = []
+    for candle in candles:
+        if windows and candle - windows[-1][0] < limit * CANDLE:
+            windows[-1] = (windows[-1][0], candle)
+        else:
+            windows.append((candle, candle))
+    return windows
+
+
+async def fetch_boundary_prices(mexc, checks: Sequence[MissedCheck], concurrency: int
+                                ) -> Dict[Tuple[str, int], float]:
+    """Цены закрытия на границах интервалов: (символ, свеча) -> цена.
+    Запросы сгруппированы по символу и диапазону времени, одновременно не больше concurrency"""
+    candles = defaultdict(set)
+    for check in checks:
+        candles[check.symbol].add(check.candle)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    prices: Dict[Tuple[str, int], float] = {}
+
+    async def fetch(symbol: str, start: int, end: int):
+        async with semaphore:
+            try:
+                closes = await mexc.get_klines(symbol, start * 1000, (end + CANDLE) * 1000 - 1, limit=KLINE_LIMIT)
+            except (httpx.HTTPError, ValueError) as e:
+                logger.warning("Свечи MEXC для %s недоступны: %s", symbol, e)
+                return
+        for open_ms, close in closes.items():
+            prices[(symbol, open_ms // 1000)] = close
+
+    await asyncio.gather(*(
+        fetch(symbol, start, end)
+        for symbol, times in candles.items()
+        for start, end in kline_windows(sorted(times))
+    ))
+    return prices
@@ -0,0 +1,426 @@
+import asyncio
+import heapq
+import logging
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from app.services.leases import WORKER_ID
+from app.services.metrics import INTERVAL_JOB_LAG_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Интервалы в секундах (название, интервал)
+INTERVALS = [
+    ('15m', 15 * 60),  # 15 минут
+    ('1h', 60 * 60),  # 1 час
+    ('4h', 4 * 60 * 60),  # 4 часа
+    ('1d', 24 * 60 * 60)  # 1 день
+]
+
+# id не переиспользуются (AUTOINCREMENT): воркеры подгружают чужие проверки по id > последнего
+JOBS_TABLE = (
+    "CREATE TABLE IF NOT EXISTS {name} ("
+    " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+    " due_at REAL NOT NULL,"
+    " row INTEGER NOT NULL,"
+    " symbol TEXT NOT NULL,"
+    " interval INTEGER NOT NULL,"
+    " entry_price REAL NOT NULL,"
+    " action TEXT NOT NULL,"
+    " entry_ts REAL NOT NULL,"
+    " owner TEXT,"
+    " lease_until REAL NOT NULL DEFAULT 0)"
+)
+
+
+class IntervalJob(NamedTuple):
+    """Следующая непроверенная точка сигнала; в куче хранится одна запись на сигнал"""
+    due_at: float
+    job_id: int
+    row: int
+    symbol: str
+    interval: int  # индекс в INTERVALS
+    entry_price: float
+    action: str
+    entry_ts: float
+
+    @property
+    def interval_name(self) -> str:
+        return INTERVALS[self.interval][0]
+
+
+class IntervalScheduler:
+    """Единый планировщик интервальных проверок: min-куча сроков в памяти
+    и SQLite на диске, чтобы незавершенные проверки переживали перезапуск.
+    Файл базы может быть общим для нескольких воркеров: наступившую проверку
+    выполняет тот, кто взял ее в аренду, остальные сверяют кучу с базой"""
+
+    def __init__(
+        self,
+        db_path: Path,
+        handler: Callable[[List[IntervalJob]], Awaitable[None]],
+        batch_size: int = 500,
+        price_feed=None,
+        lease_ttl: float = 120.0,
+        sync_interval: float = 5.0,
+        owner: str = WORKER_ID,
+    ):
+        self.db_path = Path(db_path)
+        self.handler = handler
+        self.batch_size = batch_size
+        # Поток цен подписывается только на символы с незавершенными проверками
+        self.price_feed = price_feed
+        self._heap: List[IntervalJob] = []
+        self._symbols: Dict[str, int] = {}
+        self.lease_ttl = lease_ttl
+        self.sync_interval = sync_interval
+        self.owner = owner
+        # Проверки, известные куче; новые записи других воркеров подгружаются по id
+        self._known: Set[int] = set()
+        self._synced_id = 0
+        self._synced_at = 0.0
+        self.taken_over = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.processed = 0
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.db_path), isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(JOBS_TABLE.format(name="interval_jobs"))
+        # Базы, созданные до появления аренды
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(interval_jobs)")}
+        if 'owner' not in columns:
+            self._db.execute("ALTER TABLE interval_jobs ADD COLUMN owner TEXT")
+            self._db.execute("ALTER TABLE interval_jobs ADD COLUMN lease_until REAL NOT NULL DEFAULT 0")
+        self._migrate_autoincrement()
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_interval_jobs_due ON interval_jobs (due_at)")
+
+    def _has_autoincrement(self) -> bool:
+        sql = self._db.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'interval_jobs'"
+        ).fetchone()[0]
+        return 'AUTOINCREMENT' in sql.upper()
+
+    def _migrate_autoincrement(self):
+        """Без AUTOINCREMENT SQLite повторно выдает id удаленной последней записи, и воркеры,
+        уже прочитавшие этот id, не подгружают новую проверку. Таблица пересоздается"""
+        if self._has_autoincrement():
+            return
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            if not self._has_autoincrement():  # другой воркер мог успеть раньше
+                self._db.execute("DROP TABLE IF EXISTS interval_jobs_new")
+                self._db.execute(JOBS_TABLE.format(name="interval_jobs_new"))
+                self._db.execute(
+                    "INSERT INTO interval_jobs_new (id, due_at, row, symbol, interval, entry_price, action,"
+                    " entry_ts, owner, lease_until) SELECT id, due_at, row, symbol, interval, entry_price,"
+                    " action, entry_ts, owner, lease_until FROM interval_jobs"
+                )
+                self._db.execute("DROP TABLE interval_jobs")
+                self._db.execute("ALTER TABLE interval_jobs_new RENAME TO interval_jobs")
+                logger.info("Таблица интервальных проверок переведена на AUTOINCREMENT")
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def load(self) -> int:
+        """Восстанавливает кучу из базы после перезапуска"""
+        rows = self._db.execute(
+            "SELECT due_at, id, row, symbol, interval, entry_price, action, entry_ts FROM interval_jobs"
+        ).fetchall()
+        self._heap = [IntervalJob(r[0], r[1], r[2], sys.intern(r[3]), r[4], r[5], r[6], r[7]) for r in rows]
+        heapq.heapify(self._heap)
+        self._known = {job.job_id for job in self._heap}
+        self._synced_id = max(self._known, default=0)
+        self._synced_at = time.time()
+        self._symbols = {}
+        for job in self._heap:
+            self._symbols[job.symbol] = self._symbols.get(job.symbol, 0) + 1
+        if self.price_feed is not None:
+            self.price_feed.sync(self._symbols)
+        logger.info("Загружено незавершенных интервальных проверок: %s", len(self._heap))
+        return len(self._heap)
+
+    def skip_missed(self, now: float) -> int:
+        """После простоя переводит просроченные проверки на первый интервал в будущем,
+        чтобы не записать текущую цену вместо цены на границе; пропущенные точки
+        восстанавливаются по свечам. Возвращает число пропущенных точек"""
+        skipped = 0
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self._db.execute(
+                "SELECT id, interval, entry_ts FROM interval_jobs"
+                " WHERE due_at <= ? AND (owner IS NULL OR lease_until < ?)",
+                (now, now),
+            ).fetchall()
+            updates, finished = [], []
+            for job_id, interval, entry_ts in rows:
+                next_interval = interval
+                while next_interval < len(INTERVALS) and entry_ts + INTERVALS[next_interval][1] <= now:
+                    next_interval += 1
+                skipped += next_interval - interval
+                if next_interval < len(INTERVALS):
+                    updates.append((entry_ts + INTERVALS[next_interval][1], next_interval, job_id))
+                else:
+                    finished.append((job_id,))
+            self._db.executemany(
+                "UPDATE interval_jobs SET due_at = ?, interval = ?, owner = NULL, lease_until = 0 WHERE id = ?",
+                updates,
+            )
+            self._db.executemany("DELETE FROM interval_jobs WHERE id = ?", finished)
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+        if skipped:
+            logger.info("Пропущено интервальных проверок за время простоя: %s", skipped)
+        return skipped
+
+    async def start(self):
+        self.load()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._db.close()
+
+    def schedule(self, row: int, symbol: str, entry_price: float, action: str, entry_ts: float) -> IntervalJob:
+        """Ставит сигнал на проверку, начиная с первого интервала"""
+        return self.schedule_many([(row, symbol, entry_price, action, entry_ts)])[0]
+
+    def schedule_many(self, signals: List[Tuple[int, str, float, str, float]]) -> List[IntervalJob]:
+        """Ставит пакет сигналов (строка, символ, цена входа, действие, время) одной транзакцией"""
+        jobs = []
+        self._db.execute("BEGIN")
+        try:
+            for row, symbol, entry_price, action, entry_ts in signals:
+                symbol = sys.intern(symbol)
+                action = action.lower()
+                due_at = entry_ts + INTERVALS[0][1]
+                cursor = self._db.execute(
+                    "INSERT INTO interval_jobs (due_at, row, symbol, interval, entry_price, action, entry_ts)"
+                    " VALUES (?, ?, ?, 0, ?, ?, ?)",
+                    (due_at, row, symbol, entry_price, action, entry_ts),
+                )
+                jobs.append(IntervalJob(due_at, cursor.lastrowid, row, symbol, 0, entry_price, action, entry_ts))
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+
+        for job in jobs:
+            self._known.add(job.job_id)
+            self._push(job)
+            self._track(job.symbol, 1)
+        return jobs
+
+    def _sync(self):
+        """Подгружает проверки, добавленные другими воркерами (id растут в порядке фиксации)"""
+        rows = self._db.execute(
+            "SELECT due_at, id, row, symbol, interval, entry_price, action, entry_ts FROM interval_jobs"
+            " WHERE id > ? ORDER BY id",
+            (self._synced_id,),
+        ).fetchall()
+        self._synced_at = time.time()
+        for r in rows:
+            self._synced_id = r[1]
+            if r[1] in self._known:
+                continue
+            job = IntervalJob(r[0], r[1], r[2], sys.intern(r[3]), r[4], r[5], r[6], r[7])
+            self._known.add(job.job_id)
+            self._push(job)
+            self._track(job.symbol, 1)
+
+    def _claim(self, batch: List[IntervalJob], now: float) -> List[IntervalJob]:
+        """Берет наступившие проверки в аренду. Проверки, которые другой воркер уже продвинул,
+        удалил или держит в действующей аренде, возвращаются в кучу с актуальным сроком"""
+        claimed, deferred, gone = [], [], []
+        ids = [job.job_id for job in batch]
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = {
+                r[0]: r[1:] for r in self._db.execute(
+                    f"SELECT id, due_at, interval, owner, lease_until FROM interval_jobs"
+                    f" WHERE id IN ({','.join('?' * len(ids))})",
+                    ids,
+                )
+            }
+            for job in batch:
+                row = rows.get(job.job_id)
+                if row is None:
+                    gone.append(job)
+                    continue
+                due_at, interval, owner, lease_until = row
+                if interval != job.interval or due_at > now:
+                    deferred.append(job._replace(due_at=due_at, interval=interval))
+                elif owner and owner != self.owner and lease_until > now:
+                    deferred.append(job._replace(due_at=lease_until))
+                else:
+                    if owner and owner != self.owner:
+                        self.taken_over += 1
+                    claimed.append(job)
+            self._db.executemany(
+                "UPDATE interval_jobs SET owner = ?, lease_until = ? WHERE id = ?",
+                [(self.owner, now + self.lease_ttl, job.job_id) for job in claimed],
+            )
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+
+        for job in gone:
+            self._known.discard(job.job_id)
+            self._track(job.symbol, -1)
+        for job in deferred:
+            heapq.heappush(self._heap, job)
+        return claimed
+
+    async def _renew(self, batch: List[IntervalJob]):
+        """Продлевает аренду, пока пакет обрабатывается, чтобы его не забрал другой воркер"""
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            self._db.executemany(
+                "UPDATE interval_jobs SET lease_until = ? WHERE id = ? AND owner = ?",
+                [(time.time() + self.lease_ttl, job.job_id, self.owner) for job in batch],
+            )
+
+    def _track(self, symbol: str, delta: int):
+        """Счетчик открытых сигналов по символу; подписка живет, пока он больше нуля"""
+        count = self._symbols.get(symbol, 0) + delta
+        if count > 0:
+            self._symbols[symbol] = count
+        else:
+            self._symbols.pop(symbol, None)
+        if self.price_feed is not None:
+            if delta > 0 and count == delta:
+                self.price_feed.subscribe(symbol)
+            elif count <= 0:
+                self.price_feed.unsubscribe(symbol)
+
+    def _push(self, job: IntervalJob):
+        heapq.heappush(self._heap, job)
+        if self._heap[0] is job:
+            # Новый ближайший срок - будим цикл, чтобы он пересчитал время сна
+            self._wakeup.set()
+
+    def _pop_due(self, now: float) -> List[IntervalJob]:
+        batch = []
+        while self._heap and self._heap[0].due_at <= now and len(batch) < self.batch_size:
+            batch.append(heapq.heappop(self._heap))
+        return batch
+
+    def _advance(self, batch: List[IntervalJob]):
+        """Переводит сигналы на следующий интервал или удаляет завершенные"""
+        updates, finished = [], []
+        for job in batch:
+            next_interval = job.interval + 1
+            if next_interval < len(INTERVALS):
+                next_job = job._replace(
+                    interval=next_interval,
+                    due_at=job.entry_ts + INTERVALS[next_interval][1],
+                )
+                updates.append((next_job.due_at, next_interval, job.job_id, self.owner))
+                heapq.heappush(self._heap, next_job)
+            else:
+                finished.append((job.job_id, self.owner))
+                logger.debug("Все интервалы обновлены для %s (строка %s)", job.symbol, job.row)
+
+        # Аренда снимается вместе с переходом на следующий интервал
+        self._db.execute("BEGIN")
+        self._db.executemany(
+            "UPDATE interval_jobs SET due_at = ?, interval = ?, owner = NULL, lease_until = 0"
+            " WHERE id = ? AND owner = ?",
+            updates,
+        )
+        self._db.executemany("DELETE FROM interval_jobs WHERE id = ? AND owner = ?", finished)
+        self._db.execute("COMMIT")
+
+        for job in batch:
+            if job.interval + 1 >= len(INTERVALS):
+                self._known.discard(job.job_id)
+                self._track(job.symbol, -1)
+
+    async def _run(self):
+        while True:
+            try:
+                now = time.time()
+                if now - self._synced_at >= self.sync_interval:
+                    self._sync()
+                batch = self._pop_due(now)
+                if batch:
+                    batch = self._claim(batch, now)
+                    if not batch:
+                        continue
+                else:
+                    timeout = self.sync_interval
+                    if self._heap:
+                        timeout = min(timeout, self._heap[0].due_at - now)
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                self.last_lag = now - batch[0].due_at
+                self.max_lag = max(self.max_lag, self.last_lag)
+                for job in batch:
+                    INTERVAL_JOB_LAG_SECONDS.observe(now - job.due_at)
+                renewer = asyncio.create_task(self._renew(batch))
+                try:
+                    await self.handler(batch)
+                except Exception as e:
+                    logger.error("Ошибка обработки пакета интервальных проверок: %s", e, exc_info=True)
+                finally:
+                    renewer.cancel()
+
+                self._advance(batch)
+                self.processed += len(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Ошибка цикла планировщика: %s", e, exc_info=True)
+                await asyncio.sleep(1)
+
+    @property
+    def pending(self) -> int:
+        return len(self._heap)
+
+    def stats(self, limit: int = 100) -> dict:
+        """Состояние очереди для интроспекции: ближайшие проверки и отставание"""
+        now = time.time()
+        upcoming = heapq.nsmallest(limit, self._heap)
+        return {
+            "pending": len(self._heap),
+            "processed": self.processed,
+            "next_due_in": upcoming[0].due_at - now if upcoming else None,
+            "last_lag": self.last_lag,
+            "max_lag": self.max_lag,
+            "owner": self.owner,
+            "taken_over": self.taken_over,
+            "jobs": [
+                {
+                    "row": job.row,
+                    "symbol": job.symbol,
+                    "interval": job.interval_name,
+                    "entry_price": job.entry_price,
+                    "action": job.action,
+                    "due_in": job.due_at - now,
+                }
+                for job in upcoming
+            ],
+        }
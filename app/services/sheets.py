@@ -0,0 +1,309 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from gspread.exceptions import APIError
+from gspread.utils import a1_to_rowcol, rowcol_to_a1
+
+from app.services.breaker import CircuitOpenError, breakers
+from app.services.http import http_client
+from app.services.metrics import (
+    EXTERNAL_ERRORS, EXTERNAL_REQUESTS, EXTERNAL_REQUEST_SECONDS, EXTERNAL_SHORT_CIRCUITS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Колонки "Рост/падение" (нумерация с 1): 15m, 1h, 4h, 1d
+PERCENT_COLUMNS = [6, 8, 10, 12]
+
+PERCENT_FORMAT = {"numberFormat": {"type": "PERCENT", "pattern": "#,##0.00%"}}
+GREEN = {"red": 0.5, "green": 1, "blue": 0.5}
+RED = {"red": 1, "green": 0.5, "blue": 0.5}
+
+
+def _column_range(sheet_id: int, col: int) -> dict:
+    """Вся колонка без заголовка; конец не ограничен, чтобы правило покрывало новые строки"""
+    return {"sheetId": sheet_id, "startRowIndex": 1, "startColumnIndex": col - 1, "endColumnIndex": col}
+
+
+async def _sheets_call(endpoint: str, func, *args, **kwargs):
+    """Синхронный вызов gspread в отдельном потоке с учетом в метриках внешних API.
+    При разомкнутой цепи Sheets вызов сразу отклоняется с CircuitOpenError"""
+    labels = ("sheets", endpoint)
+    breaker = breakers.breaker("sheets")
+    try:
+        breaker.allow()
+    except CircuitOpenError:
+        EXTERNAL_SHORT_CIRCUITS.inc(("sheets",))
+        raise
+    EXTERNAL_REQUESTS.inc(labels)
+    started = time.perf_counter()
+    try:
+        result = await asyncio.to_thread(func, *args, **kwargs)
+    except Exception as e:
+        EXTERNAL_ERRORS.inc(labels)
+        # Ошибка запроса (4xx, кроме превышения квоты) не говорит о сбое сервиса
+        status = e.response.status_code if isinstance(e, APIError) else None
+        if status is None or status >= 500 or status == 429:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        raise
+    finally:
+        EXTERNAL_REQUEST_SECONDS.observe(time.perf_counter() - started, ("sheets",))
+    breaker.record_success()
+    return result
+
+
+def ensure_sheet_formats(sheet):
+    """Один раз задает процентный формат и правила условного форматирования для колонок
+    с изменением цены вместо форматирования каждой ячейки отдельно"""
+    spreadsheet = sheet.spreadsheet
+    metadata = spreadsheet.fetch_sheet_metadata({"fields": "sheets(properties.sheetId,conditionalFormats)"})
+    for sheet_meta in metadata.get("sheets", []):
+        if sheet_meta["properties"]["sheetId"] == sheet.id and sheet_meta.get("conditionalFormats"):
+            return
+
+    ranges = [_column_range(sheet.id, col) for col in PERCENT_COLUMNS]
+    requests = [
+        {
+            "repeatCell": {
+                "range": grid_range,
+                "cell": {"userEnteredFormat": PERCENT_FORMAT},
+                "fields": "userEnteredFormat.numberFormat",
+            }
+        }
+        for grid_range in ranges
+    ]
+    for condition, color in (("NUMBER_GREATER", GREEN), ("NUMBER_LESS", RED)):
+        requests.append({
+            "addConditionalFormatRule": {
+                "index": 0,
+                "rule": {
+                    "ranges": ranges,
+                    "booleanRule": {
+                        "condition": {"type": condition, "values": [{"userEnteredValue": "0"}]},
+                        "format": {"backgroundColor": color},
+                    },
+                },
+            }
+        })
+
+    spreadsheet.batch_update({"requests": requests})
+    logger.info("Sheet-level formats for price change columns created")
+
+
+class SheetMirror:
+    """Локальная копия строк листа: загружается один раз при старте, дальше обновляется
+    по собственным записям, поэтому обработка сигнала не читает таблицу"""
+
+    def __init__(self, sheet):
+        self.sheet = sheet
+        self.rows: List[List[object]] = []
+
+    def load(self) -> int:
+        self.rows = self.sheet.get_all_values()
+        logger.info("Sheet mirror loaded: %s rows", len(self.rows))
+        return len(self.rows)
+
+    @property
+    def row_count(self) -> int:
+        return len(self.rows)
+
+    def _store(self, row: int, values: List[object]):
+        while len(self.rows) < row:
+            self.rows.append([])
+        self.rows[row - 1] = list(values)
+
+    def set_cells(self, row: int, col: int, values: List[object]):
+        """Отражает в копии значения, записанные в строку row начиная с колонки col"""
+        while len(self.rows) < row:
+            self.rows.append([])
+        cells = self.rows[row - 1]
+        if len(cells) < col - 1 + len(values):
+            cells.extend([""] * (col - 1 + len(values) - len(cells)))
+        cells[col - 1:col - 1 + len(values)] = values
+
+    @staticmethod
+    def _first_updated_row(response: dict) -> Optional[int]:
+        """Номер первой записанной строки из updatedRange ответа append ("Sheet1!A5:L7")"""
+        try:
+            updated_range = response["updates"]["updatedRange"]
+            return a1_to_rowcol(updated_range.split("!")[-1].split(":")[0])[0]
+        except (KeyError, TypeError, IndexError, ValueError):
+            return None
+
+    async def append_rows(self, rows: List[List[object]]) -> List[int]:
+        """Добавляет строки одним запросом и возвращает их номера.
+        Номер берется из ответа API, поэтому одновременные добавления не путают индексы"""
+        # Резервируем номера локально на случай ответа без updatedRange
+        reserved = self.row_count + 1
+        for offset, values in enumerate(rows):
+            self._store(reserved + offset, values)
+
+        response = await _sheets_call("append_rows", self.sheet.append_rows, rows, value_input_option="RAW")
+
+        first_row = self._first_updated_row(response)
+        if first_row is None:
+            logger.warning("Append response without updatedRange, using local row counter")
+            first_row = reserved
+        elif first_row != reserved:
+            # Таблицу меняли в обход сервиса - переносим строки на фактические номера
+            for offset, values in enumerate(rows):
+                self._store(first_row + offset, values)
+
+        return [first_row + offset for offset in range(len(rows))]
+
+    async def append_row(self, values: List[object]) -> int:
+        return (await self.append_rows([values]))[0]
+
+
+class SheetWriter:
+    """Write-behind буфер перед листом: значения и форматы всех сигналов копятся в памяти
+    и сбрасываются одним values_batch_update и одним batch_update"""
+
+    def __init__(self, sheet, mirror: Optional[SheetMirror] = None, flush_interval: float = 2.0,
+                 max_pending: int = 5000):
+        self.sheet = sheet
+        self.mirror = mirror
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._values: Dict[Tuple[int, int], object] = {}  # (строка, колонка) -> значение
+        self._formats: Dict[str, dict] = {}  # A1-диапазон -> формат
+        self._flush_requested = asyncio.Event()
+        self._space = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.last_flush_cells = 0
+        self.failures = 0  # неудачных сбросов подряд
+        self.retry_in = 0.0  # пауза перед следующим сбросом после ошибки
+
+    @property
+    def pending(self) -> int:
+        return len(self._values) + len(self._formats)
+
+    async def _wait_for_space(self):
+        # Backpressure: при переполненном буфере писатели ждут ближайшего сброса
+        while self.pending >= self.max_pending:
+            self._space.clear()
+            self._flush_requested.set()
+            await self._space.wait()
+
+    async def update(self, row: int, col: int, values: List[object]):
+        """Записывает значения в строку row начиная с колонки col"""
+        await self._wait_for_space()
+        for offset, value in enumerate(values):
+            self._values[(row, col + offset)] = value
+        if self.mirror is not None:
+            self.mirror.set_cells(row, col, values)
+
+    async def format(self, a1_range: str, cell_format: dict):
+        await self._wait_for_space()
+        self._formats.setdefault(a1_range, {}).update(cell_format)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            if not await self.flush():
+                # Без паузы ожидающие писатели сразу запросили бы новый сброс
+                await asyncio.sleep(self.retry_in)
+
+    def _value_ranges(self, values: Dict[Tuple[int, int], object]) -> List[dict]:
+        """Склеивает соседние ячейки одной строки в один диапазон"""
+        data = []
+        run_start, run_values, prev = None, [], None
+        for (row, col) in sorted(values):
+            if prev is not None and (row, col) == (prev[0], prev[1] + 1):
+                run_values.append(values[(row, col)])
+            else:
+                if run_start is not None:
+                    data.append(self._range_entry(run_start, run_values))
+                run_start, run_values = (row, col), [values[(row, col)]]
+            prev = (row, col)
+        if run_start is not None:
+            data.append(self._range_entry(run_start, run_values))
+        return data
+
+    def _range_entry(self, start: Tuple[int, int], values: List[object]) -> dict:
+        row, col = start
+        a1_range = f"{rowcol_to_a1(row, col)}:{rowcol_to_a1(row, col + len(values) - 1)}"
+        return {"range": f"'{self.sheet.title}'!{a1_range}", "values": [values]}
+
+    def _write(self, values: Dict[Tuple[int, int], object], formats: Dict[str, dict]):
+        spreadsheet = self.sheet.spreadsheet
+        if values:
+            spreadsheet.values_batch_update({
+                "valueInputOption": "USER_ENTERED",
+                "data": self._value_ranges(values),
+            })
+        if formats:
+            self.sheet.batch_format([
+                {"range": a1_range, "format": cell_format} for a1_range, cell_format in formats.items()
+            ])
+
+    async def flush(self) -> bool:
+        """Сбрасывает накопленное в таблицу; при ошибке данные возвращаются в буфер
+        и возвращается False, пауза перед повтором - в retry_in"""
+        if not self._values and not self._formats:
+            self._space.set()
+            return True
+
+        values, self._values = self._values, {}
+        formats, self._formats = self._formats, {}
+        try:
+            # gspread синхронный - выполняем в отдельном потоке, не блокируя event loop
+            await _sheets_call("batch_update", self._write, values, formats)
+            self.flushes += 1
+            self.last_flush_cells = len(values)
+            self.failures = 0
+            logger.info("Sheets flush: %s cells, %s formats", len(values), len(formats))
+            return True
+        except CircuitOpenError as e:
+            # Запрос не отправлялся: ждем пробного вызова, не считая это новой ошибкой
+            logger.info("Sheets flush postponed: %s", e)
+            self._restore(values, formats)
+            self.retry_in = max(e.retry_in, self.flush_interval)
+            return False
+        except Exception as e:
+            logger.error("Failed to flush sheet updates: %s", e)
+            self._restore(values, formats)
+            self.failures += 1
+            self.retry_in = http_client.backoff_delay(self.failures)
+            return False
+        finally:
+            # Писателей будим, только если место в буфере действительно появилось
+            if self.pending < self.max_pending:
+                self._space.set()
+
+    def _restore(self, values: Dict[Tuple[int, int], object], formats: Dict[str, dict]):
+        # Более свежие значения, записанные во время сброса, не перетираем
+        self._values = {**values, **self._values}
+        self._formats = {**formats, **self._formats}
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "flushes": self.flushes,
+            "last_flush_cells": self.last_flush_cells,
+            "failures": self.failures,
+            "flush_interval": self.flush_interval,
+            "max_pending": self.max_pending,
+        }
@@ -0,0 +1,99 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotCache:
+    """Справочник в памяти со сжатым снимком на диске: загружается при старте и обновляется
+    в фоне. С арендой обновляет один воркер, остальные перечитывают записанный им снимок.
+    Наследник задает lease_name и title и реализует refresh, _snapshot и _restore"""
+
+    lease_name = ""
+    title = ""  # в родительном падеже для журнала: "карты CMC"
+
+    def __init__(self, snapshot_path: Path):
+        self.snapshot_path = Path(snapshot_path)
+        self.fetched_at = 0.0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.leases = None
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def _snapshot(self) -> dict:
+        """Содержимое снимка колонками: списки вместо объектов в несколько раз компактнее"""
+        raise NotImplementedError
+
+    def _restore(self, snapshot: dict):
+        """Пересобирает справочник из снимка; KeyError или ValueError, если снимок поврежден"""
+        raise NotImplementedError
+
+    async def refresh(self):
+        raise NotImplementedError
+
+    def load(self) -> bool:
+        """Загружает снимок с диска; False, если снимка нет или он поврежден"""
+        try:
+            with gzip.open(self.snapshot_path, 'rt', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            self._restore(snapshot)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Снимок %s поврежден, будет загружен заново: %s", self.title, e)
+            return False
+
+        self.fetched_at = snapshot.get('fetched_at', 0.0)
+        logger.info("Снимок %s загружен с диска: %s записей", self.title, len(self))
+        return True
+
+    def save(self):
+        """Атомарно записывает снимок"""
+        snapshot = {'fetched_at': self.fetched_at, **self._snapshot()}
+        self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.snapshot_path.with_suffix('.tmp')
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        os.replace(tmp_path, self.snapshot_path)
+
+    async def start(self, refresh_interval: float, leases=None):
+        self.leases = leases
+        self.load()
+        self._task = asyncio.create_task(self._run(refresh_interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, refresh_interval: float):
+        while True:
+            # Свежий снимок с диска не обновляем сразу после старта
+            age = time.time() - self.fetched_at
+            if len(self) and age < refresh_interval:
+                await asyncio.sleep(refresh_interval - age)
+            try:
+                if self.leases is not None and not self.leases.acquire(self.lease_name, refresh_interval):
+                    # Обновляет другой воркер - перечитываем общий снимок, когда он его запишет
+                    await asyncio.to_thread(self.load)
+                    if time.time() - self.fetched_at >= refresh_interval:
+                        await asyncio.sleep(min(refresh_interval, 60))
+                    continue
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Ошибка обновления %s: %s", self.title, e)
+                await asyncio.sleep(min(refresh_interval, 300))
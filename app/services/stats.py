@@ -0,0 +1,269 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+
+from app.database import run_in_session
+from app.models import IntervalResult, Signal
+from app.services.scheduler import INTERVALS
+
+logger = logging.getLogger(__name__)
+
+ACTIONS = ('buy', 'sell')
+# Границы корзин распределения изменения цены, %
+DEFAULT_BINS = (-10, -5, -3, -2, -1, -0.5, 0, 0.5, 1, 2, 3, 5, 10)
+# Сколько результатов читать из базы за один запрос синхронизации
+SYNC_CHUNK = 50000
+
+ResultRow = Tuple[int, int, str, float, str, str, datetime]
+
+
+def fetch_results(db, after_seq: int, limit: int = SYNC_CHUNK) -> List[ResultRow]:
+    """Новые и обновленные результаты интервалов вместе с полями сигнала, по возрастанию номера изменения"""
+    return db.execute(
+        select(
+            IntervalResult.id, IntervalResult.seq, IntervalResult.interval, IntervalResult.change_pct,
+            Signal.symbol, Signal.action, Signal.signal_time,
+        )
+        .join(Signal, IntervalResult.signal_id == Signal.id)
+        .where(IntervalResult.seq > after_seq)
+        .order_by(IntervalResult.seq)
+        .limit(limit)
+    ).all()
+
+
+class _Columns:
+    """Колонки результатов одного интервала. Результаты приходят почти по порядку времени
+    сигнала, поэтому окно времени ищется бинарным поиском; редкие запоздавшие записи
+    помечают колонки неотсортированными, и сортировка выполняется при следующем чтении"""
+
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self.sorted = True
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.ts = np.empty(capacity, dtype=np.float64)
+        self.symbol = np.empty(capacity, dtype=np.int32)
+        self.action = np.empty(capacity, dtype=np.int8)
+        self.change = np.empty(capacity, dtype=np.float64)
+
+    def _reserve(self, extra: int):
+        needed = self.size + extra
+        if needed <= len(self.ts):
+            return
+        capacity = max(needed, len(self.ts) * 2)
+        for name in ('ids', 'ts', 'symbol', 'action', 'change'):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def extend(self, ids: np.ndarray, ts: np.ndarray, symbol: np.ndarray, action: np.ndarray,
+               change: np.ndarray):
+        count = len(ts)
+        if not count:
+            return
+        self._reserve(count)
+        start, end = self.size, self.size + count
+        if self.sorted and ((start and ts[0] < self.ts[start - 1]) or np.any(np.diff(ts) < 0)):
+            self.sorted = False
+        self.ids[start:end] = ids
+        self.ts[start:end] = ts
+        self.symbol[start:end] = symbol
+        self.action[start:end] = action
+        self.change[start:end] = change
+        self.size = end
+
+    def update(self, changes: Dict[int, float]) -> List[int]:
+        """Заменяет изменение цены у уже загруженных результатов; возвращает id, которых нет"""
+        ids = self.ids[:self.size]
+        positions = np.flatnonzero(np.isin(ids, np.fromiter(changes, np.int64, len(changes))))
+        for position in positions:
+            self.change[position] = changes[int(ids[position])]
+        found = set(ids[positions].tolist())
+        return [result_id for result_id in changes if result_id not in found]
+
+    def window(self, start: Optional[float], end: Optional[float]) -> slice:
+        if not self.sorted:
+            order = np.argsort(self.ts[:self.size], kind='stable')
+            for name in ('ids', 'ts', 'symbol', 'action', 'change'):
+                column = getattr(self, name)
+                column[:self.size] = column[:self.size][order]
+            self.sorted = True
+        ts = self.ts[:self.size]
+        lo = 0 if start is None else int(np.searchsorted(ts, start, side='left'))
+        hi = self.size if end is None else int(np.searchsorted(ts, end, side='right'))
+        return slice(lo, hi)
+
+
+def _summary(change: np.ndarray, bins: np.ndarray) -> dict:
+    if not len(change):
+        return {"count": 0}
+    histogram, _ = np.histogram(np.clip(change, bins[0], bins[-1]), bins=bins)
+    p5, p25, p75, p95 = np.percentile(change, [5, 25, 75, 95])
+    return {
+        "count": int(len(change)),
+        "win_rate": float(np.count_nonzero(change > 0) / len(change)),
+        "mean": float(change.mean()),
+        "median": float(np.median(change)),
+        "std": float(change.std()),
+        "p5": float(p5),
+        "p25": float(p25),
+        "p75": float(p75),
+        "p95": float(p95),
+        "distribution": {"bins": bins.tolist(), "counts": histogram.tolist()},
+    }
+
+
+def _grouped(codes: np.ndarray, change: np.ndarray, names: Sequence[str]) -> Dict[str, dict]:
+    """Сводка по группам без цикла по записям: lexsort по группе и изменению, суммы через reduceat,
+    медиана - середина каждой отсортированной группы"""
+    if not len(change):
+        return {}
+    order = np.lexsort((change, codes))
+    codes_sorted, change_sorted = codes[order], change[order]
+    groups, starts, counts = np.unique(codes_sorted, return_index=True, return_counts=True)
+    sums = np.add.reduceat(change_sorted, starts)
+    wins = np.add.reduceat((change_sorted > 0).astype(np.int64), starts)
+    medians = (change_sorted[starts + (counts - 1) // 2] + change_sorted[starts + counts // 2]) / 2
+    return {
+        names[code]: {
+            "count": int(count),
+            "win_rate": float(win / count),
+            "mean": float(total / count),
+            "median": float(median),
+        }
+        for code, count, win, total, median in zip(groups, counts, wins, sums, medians)
+    }
+
+
+class SignalStats:
+    """Колоночное хранилище результатов сигналов в памяти (массивы NumPy по интервалам).
+    Пополняется из хранилища сигналов по возрастанию номера изменения, поэтому видит
+    новые и перезаписанные результаты всех воркеров; агрегаты считаются векторно по окну времени"""
+
+    def __init__(self, bins: Sequence[float] = DEFAULT_BINS):
+        self.bins = np.asarray(bins, dtype=np.float64)
+        self.intervals = [name for name, _ in INTERVALS]
+        self._columns = {name: _Columns() for name in self.intervals}
+        self._symbol_codes: Dict[str, int] = {}
+        self.symbols: List[str] = []
+        self.last_seq = 0
+        self.max_id = 0  # результаты с id не больше уже загружались - это обновления
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return sum(columns.size for columns in self._columns.values())
+
+    def _symbol_code(self, symbol: str) -> int:
+        code = self._symbol_codes.get(symbol)
+        if code is None:
+            code = self._symbol_codes[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return code
+
+    def add_rows(self, rows: Iterable[ResultRow]):
+        """Добавляет или обновляет результаты
+        (id, номер изменения, интервал, изменение %, символ, действие, время сигнала UTC)"""
+        batches: Dict[str, Dict[int, tuple]] = {}
+        updates: Dict[str, Dict[int, tuple]] = {}
+        for result_id, seq, interval, change_pct, symbol, action, signal_time in rows:
+            self.last_seq = max(self.last_seq, seq)
+            if interval not in self._columns or action not in ACTIONS:
+                continue
+            entry = (
+                result_id,
+                signal_time.replace(tzinfo=timezone.utc).timestamp(),
+                self._symbol_code(symbol.upper()),
+                ACTIONS.index(action),
+                change_pct,
+            )
+            batch = batches.setdefault(interval, {})
+            if result_id > self.max_id or result_id in batch:
+                batch[result_id] = entry
+            else:
+                updates.setdefault(interval, {})[result_id] = entry
+            self.max_id = max(self.max_id, result_id)
+
+        for interval, entries in updates.items():
+            missing = self._columns[interval].update({result_id: entry[4] for result_id, entry in entries.items()})
+            # id не по порядку фиксации (например, в другой СУБД) - это новый результат
+            for result_id in missing:
+                batches[interval][result_id] = entries[result_id]
+        for interval, batch in batches.items():
+            if not batch:
+                continue
+            ids, ts, symbol, action, change = zip(*batch.values())
+            self._columns[interval].extend(
+                np.fromiter(ids, np.int64, len(ids)),
+                np.fromiter(ts, np.float64, len(ts)),
+                np.fromiter(symbol, np.int32, len(ts)),
+                np.fromiter(action, np.int8, len(ts)),
+                np.fromiter(change, np.float64, len(ts)),
+            )
+
+    async def sync(self) -> int:
+        """Дочитывает новые и обновленные результаты из базы; чтение - в потоке базы, запись в массивы - в event loop"""
+        async with self._lock:
+            added = 0
+            while True:
+                rows = await run_in_session(fetch_results, self.last_seq)
+                self.add_rows(rows)
+                added += len(rows)
+                if len(rows) < SYNC_CHUNK:
+                    return added
+
+    async def run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Ошибка синхронизации статистики сигналов: %s", e)
+
+    def query(
+        self,
+        interval: Optional[str] = None,
+        symbol: Optional[str] = None,
+        action: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        group_by: Optional[str] = None,
+    ) -> Dict[str, dict]:
+        """Сводка по каждому интервалу: доля прибыльных, среднее, медиана и распределение
+        изменения цены; group_by - symbol или action"""
+        start_ts = start.replace(tzinfo=start.tzinfo or timezone.utc).timestamp() if start else None
+        end_ts = end.replace(tzinfo=end.tzinfo or timezone.utc).timestamp() if end else None
+        symbol_code = self._symbol_codes.get(symbol.upper()) if symbol else None
+        action_code = ACTIONS.index(action.lower()) if action else None
+
+        result = {}
+        for name in ([interval] if interval else self.intervals):
+            columns = self._columns[name]
+            window = columns.window(start_ts, end_ts)
+            change = columns.change[window]
+            mask = None
+            if symbol:
+                mask = columns.symbol[window] == (-1 if symbol_code is None else symbol_code)
+            if action_code is not None:
+                action_mask = columns.action[window] == action_code
+                mask = action_mask if mask is None else mask & action_mask
+            if mask is not None:
+                change = change[mask]
+
+            summary = _summary(change, self.bins)
+            if group_by == 'symbol':
+                codes = columns.symbol[window] if mask is None else columns.symbol[window][mask]
+                summary["groups"] = _grouped(codes, change, self.symbols)
+            elif group_by == 'action':
+                codes = columns.action[window] if mask is None else columns.action[window][mask]
+                summary["groups"] = _grouped(codes, change, ACTIONS)
+            result[name] = summary
+        return result
+
+
+signal_stats = SignalStats()
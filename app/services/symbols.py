@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import re
+import time
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Set
+
+from app.services.http import http_client
+from app.services.snapshot import SnapshotCache
+
+logger = logging.getLogger(__name__)
+
+# Имя аренды: список пар MEXC обновляет один воркер, остальные читают его снимок
+SYMBOLS_LEASE = "mexc_symbols_refresh"
+# Вся обработка идет в USDT: цены в $, поток сделок и пары планировщика - к USDT
+QUOTE = "USDT"
+# Котировки, которые отрезаются от тикера TradingView (USDT и USDC раньше USD)
+QUOTES = ("USDT", "USDC", "USD", "BUSD", "FDUSD", "TUSD", "DAI", "BTC", "ETH", "EUR")
+# Суффиксы бессрочных контрактов и префикс биржи, например MEXC:BTCUSDT.P
+SUFFIXES = (".P", "PERP")
+# Множитель контракта: 1000PEPE, 1000000MOG, 1MBABYDOGE торгуются на споте как PEPE, MOG, BABYDOGE
+MULTIPLIER = re.compile(r"^(?:10{3,6}|1M)(?=[A-Z])")
+# Статус пары, доступной для торговли (в v3 - "1", в старых ответах - ENABLED)
+ONLINE = ("1", "ENABLED", "TRADING")
+
+
+class Market(NamedTuple):
+    symbol: str  # базовый актив, как он пишется в таблицу и передается в сервисы
+    pair: str  # пара MEXC к USDT
+
+
+class SymbolIndex(SnapshotCache):
+    """Пары MEXC spot из exchangeInfo: проверка и нормализация тикеров TradingView
+    без сетевых запросов. Хранится на диске сжатым снимком и обновляется в фоне"""
+
+    lease_name = SYMBOLS_LEASE
+    title = "пар MEXC"
+
+    def __init__(self, snapshot_path: Path, base_url: str = "https://api.mexc.com/api/v3"):
+        super().__init__(snapshot_path)
+        self.base_url = base_url
+        self._pairs: Dict[str, str] = {}  # пара -> базовый актив (все котировки)
+        self._quotes: Dict[str, str] = {}  # пара -> котировка
+        self._usdt: Set[str] = set()  # базовые активы с парой к USDT
+        self.rejected = 0
+
+    def __len__(self) -> int:
+        return len(self._pairs)
+
+    @property
+    def ready(self) -> bool:
+        return bool(self._usdt)
+
+    @staticmethod
+    def normalize(ticker: str) -> str:
+        """MEXC:1000PEPEUSDT.P -> 1000PEPEUSDT"""
+        ticker = ticker.strip().upper().rpartition(':')[2]
+        for suffix in SUFFIXES:
+            if ticker.endswith(suffix):
+                ticker = ticker[:-len(suffix)]
+        return ticker
+
+    def resolve(self, ticker: str) -> Optional[Market]:
+        """Пара к USDT для тикера TradingView или None, если такой на MEXC нет.
+        Другие котировки и множители контрактов переводятся на пару того же актива к USDT"""
+        ticker = self.normalize(ticker)
+        base = self._pairs.get(ticker)
+        if base is None:
+            base = ticker
+            # Голый актив (WBTC) не режем по котировке, иначе получится другой актив (W)
+            if ticker not in self._usdt:
+                for quote in QUOTES:
+                    if ticker.endswith(quote) and len(ticker) > len(quote):
+                        base = ticker[:-len(quote)]
+                        break
+
+        for candidate in (base, MULTIPLIER.sub("", base)):
+            if candidate in self._usdt:
+                return Market(candidate, candidate + QUOTE)
+        self.rejected += 1
+        return None
+
+    def _rebuild(self, pairs: Dict[str, str], quotes: Dict[str, str]):
+        self._usdt = {base for pair, base in pairs.items() if quotes[pair] == QUOTE}
+        self._pairs, self._quotes = pairs, quotes
+
+    def _restore(self, snapshot: dict):
+        self._rebuild(
+            dict(zip(snapshot['pairs'], snapshot['bases'])),
+            dict(zip(snapshot['pairs'], snapshot['quotes'])),
+        )
+
+    def _snapshot(self) -> dict:
+        pairs = sorted(self._pairs)
+        return {
+            'pairs': pairs,
+            'bases': [self._pairs[pair] for pair in pairs],
+            'quotes': [self._quotes[pair] for pair in pairs],
+        }
+
+    async def refresh(self):
+        """Полный список пар одним запросом exchangeInfo"""
+        async with self._lock:
+            response = await http_client.get("mexc", f"{self.base_url}/exchangeInfo")
+            response.raise_for_status()
+            data = response.json()
+            if not isinstance(data, dict) or not isinstance(data.get('symbols'), list):
+                raise ValueError("Invalid exchangeInfo response structure")
+
+            pairs, quotes = {}, {}
+            for item in data['symbols']:
+                try:
+                    if str(item.get('status', '1')) not in ONLINE or item.get('isSpotTradingAllowed') is False:
+                        continue
+                    pair = item['symbol'].upper()
+                    pairs[pair] = item['baseAsset'].upper()
+                    quotes[pair] = item['quoteAsset'].upper()
+                except (KeyError, AttributeError):
+                    continue
+            if not pairs:
+                raise ValueError("exchangeInfo returned no trading pairs")
+
+            self._rebuild(pairs, quotes)
+            self.fetched_at = time.time()
+            await asyncio.to_thread(self.save)
+            logger.info("Пары MEXC обновлены: %s, к USDT: %s", len(pairs), len(self._usdt))
+
+    def stats(self) -> dict:
+        return {
+            "pairs": len(self._pairs),
+            "usdt_pairs": len(self._usdt),
+            "age": time.time() - self.fetched_at if self.fetched_at else None,
+            "rejected": self.rejected,
+        }
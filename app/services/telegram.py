@@ -1,44 +1,347 @@
-import requests
+import asyncio
+import sqlite3
 import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import httpx
 from app.config import Config
+from app.services.breaker import CircuitOpenError
+from app.services.http import http_client
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Ограничение Telegram на длину одного сообщения
+MAX_MESSAGE_LENGTH = 4096
+MERGE_SEPARATOR = "\n\n〰〰〰〰〰\n\n"
+
 
 class TelegramBot:
     @staticmethod
-    def send_message(chat_id: str, text: str) -> bool:
-        max_retries = 3
-        backoff_time = 1
+    async def _post(chat_id: str, text: str, retries: int) -> httpx.Response:
+        return await http_client.post(
+            "telegram",
+            f"https://api.telegram.org/bot{Config.TOKEN}/sendMessage",
+            json={
+                "chat_id": chat_id,
+                "text": text,
+                "parse_mode": "Markdown",
+                "disable_web_page_preview": True
+            },
+            timeout=5,
+            retries=retries
+        )
+
+    @staticmethod
+    async def send_once(chat_id: str, text: str) -> httpx.Response:
+        """Одна попытка отправки без повторов (повторами управляет очередь)"""
+        return await TelegramBot._post(chat_id, text, retries=0)
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity про запас"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        # Lock сохраняет порядок ожидающих и не дает им разобрать один токен
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+class _Lane:
+    """Отдельная полоса отправки для одного чата: своя очередь, свой лимит и свой Retry-After"""
+
+    def __init__(self, chat_id: str, bucket: TokenBucket, maxsize: int):
+        self.chat_id = chat_id
+        self.bucket = bucket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        # Сообщение, не поместившееся в прошлое объединение, уходит первым в следующее
+        self.carry: Optional[Tuple[str, float, Optional[int]]] = None
+        self.task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.failed = 0
+        self.merged = 0
+        self.rate_limited = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.queue.qsize() + (self.carry is not None),
+            "sent": self.sent,
+            "failed": self.failed,
+            "merged": self.merged,
+            "rate_limited": self.rate_limited,
+            "last_latency": self.last_latency,
+            "max_latency": self.max_latency,
+        }
+
+
+class TelegramQueue:
+    """Очередь исходящих сообщений: отправка фоновыми воркерами, по полосе на чат,
+    с общим и по-чатовым token bucket и объединением сигналов при всплесках"""
+
+    def __init__(
+        self,
+        global_rate: float = Config.TELEGRAM_GLOBAL_RATE,
+        chat_rate: float = Config.TELEGRAM_CHAT_RATE,
+        group_rate: float = Config.TELEGRAM_GROUP_RATE,
+        maxsize: int = Config.TELEGRAM_QUEUE_SIZE,
+        merge: bool = Config.TELEGRAM_MERGE,
+        merge_max: int = Config.TELEGRAM_MERGE_MAX,
+        max_attempts: int = 3,
+        workers: int = Config.WEB_WORKERS,
+    ):
+        # Лимиты Telegram общие для бота, а очереди - в каждом воркере uvicorn:
+        # каждый воркер получает свою долю, чтобы вместе они не превышали лимит
+        workers = max(1, workers)
+        global_rate = global_rate / workers
+        self.global_bucket = TokenBucket(global_rate, capacity=max(1.0, global_rate))
+        self.chat_rate = chat_rate / workers
+        self.group_rate = group_rate / workers
+        self.maxsize = maxsize
+        self.merge = merge
+        self.merge_max = merge_max
+        self.max_attempts = max_attempts
+        self._lanes: Dict[str, _Lane] = {}
+        self._running = False
+        # Необязательное хранилище недоставленных сообщений (Outbox) и id сообщений из него в очередях
+        self.outbox = None
+        self._outbox_ids: Set[int] = set()
+        self._outbox_task: Optional[asyncio.Task] = None
+
+    def _lane(self, chat_id: str) -> _Lane:
+        lane = self._lanes.get(chat_id)
+        if lane is None:
+            # Группы (отрицательный chat_id) Telegram ограничивает сильнее личных чатов
+            rate = self.group_rate if str(chat_id).startswith('-') else self.chat_rate
+            lane = _Lane(chat_id, TokenBucket(rate, capacity=1), self.maxsize)
+            self._lanes[chat_id] = lane
+            if self._running:
+                lane.task = asyncio.create_task(self._worker(lane))
+        return lane
+
+    def enqueue(self, chat_id: str, text: str):
+        """Ставит сообщение в очередь чата; asyncio.QueueFull, если полоса переполнена.
+        С outbox сообщение сначала записывается на диск и переживает падение процесса"""
+        lane = self._lane(chat_id)
+        if lane.queue.full():
+            raise asyncio.QueueFull
+        outbox_id = self.outbox.add(chat_id, text) if self.outbox is not None else None
+        self._put(lane, text, outbox_id)
+
+    def _put(self, lane: _Lane, text: str, outbox_id: Optional[int]):
+        lane.queue.put_nowait((text, time.monotonic(), outbox_id))
+        if outbox_id is not None:
+            self._outbox_ids.add(outbox_id)
+
+    async def start(self, chat_ids: List[str] = (), outbox=None):
+        self._running = True
+        for chat_id in chat_ids:
+            if chat_id:
+                self._lane(chat_id)
+        for lane in self._lanes.values():
+            if lane.task is None:
+                lane.task = asyncio.create_task(self._worker(lane))
+        if outbox is not None:
+            self.outbox = outbox
+            self._outbox_task = asyncio.create_task(self._outbox_run())
 
-        for attempt in range(max_retries):
+    async def _outbox_run(self):
+        """Продлевает аренду своих сообщений и подбирает брошенные упавшими процессами"""
+        while True:
             try:
-                response = requests.post(
-                    f"https://api.telegram.org/bot{Config.TOKEN}/sendMessage",
-                    json={
-                        "chat_id": chat_id,
-                        "text": text,
-                        "parse_mode": "Markdown",
-                        "disable_web_page_preview": True
-                    },
-                    timeout=5
-                )
-
-                # Обработка лимитов Telegram
-                if response.status_code == 429:
-                    retry_after = int(response.headers.get('Retry-After', 5))
-                    logger.warning(f"Rate limited. Sleeping for {retry_after} sec")
-                    time.sleep(retry_after)
-                    continue
-
-                response.raise_for_status()
-                return True
-
-            except Exception as e:
-                logger.error(f"Attempt {attempt + 1} failed: {str(e)}")
-                if attempt < max_retries - 1:
-                    time.sleep(backoff_time * (attempt + 1))
-
-        logger.error("All sending attempts failed")
-        return False
\ No newline at end of file
+                self.outbox.renew(self._outbox_ids)
+                claimed = self.outbox.claim()
+                for outbox_id, chat_id, text in claimed:
+                    lane = self._lane(chat_id)
+                    if lane.queue.full():
+                        self.outbox.release([outbox_id])
+                        continue
+                    self._put(lane, text, outbox_id)
+                if claimed:
+                    logger.warning("Telegram messages restored from outbox: %s", len(claimed))
+            except sqlite3.Error as e:
+                logger.error("Telegram outbox error: %s", e)
+            await asyncio.sleep(self.outbox.lease_ttl / 3)
+
+    async def stop(self, timeout: float = 5.0):
+        """Дает очередям досылать сообщения не дольше timeout, затем останавливает воркеров"""
+        self._running = False
+        lanes = list(self._lanes.values())
+        try:
+            await asyncio.wait_for(asyncio.gather(*(lane.queue.join() for lane in lanes)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Telegram queue not drained before shutdown")
+        for lane in lanes:
+            if lane.task is not None:
+                lane.task.cancel()
+                lane.task = None
+        if self._outbox_task is not None:
+            self._outbox_task.cancel()
+            self._outbox_task = None
+        if self.outbox is not None:
+            # Недоставленные сообщения остаются в outbox и сразу доступны следующему запуску
+            self.outbox.release(self._outbox_ids)
+            self._outbox_ids.clear()
+
+    def _take_batch(self, lane: _Lane, first: Tuple[str, float, Optional[int]]
+                    ) -> List[Tuple[str, float, Optional[int]]]:
+        """При накопившейся очереди склеивает несколько сигналов в одно сообщение"""
+        batch = [first]
+        if not self.merge:
+            return batch
+        length = len(first[0])
+        while len(batch) < self.merge_max and not lane.queue.empty():
+            item = lane.queue.get_nowait()
+            if length + len(MERGE_SEPARATOR) + len(item[0]) > MAX_MESSAGE_LENGTH:
+                lane.carry = item
+                break
+            batch.append(item)
+            length += len(MERGE_SEPARATOR) + len(item[0])
+        return batch
+
+    async def _worker(self, lane: _Lane):
+        while True:
+            if lane.carry is not None:
+                first, lane.carry = lane.carry, None
+            else:
+                first = await lane.queue.get()
+            batch = self._take_batch(lane, first)
+            settled: List[Tuple[str, float, Optional[int]]] = []
+            finished = False
+            try:
+                await self._send(lane, batch, settled)
+                finished = True
+            finally:
+                # Доставленное или окончательно отклоненное сообщение удаляется из outbox.
+                # Объединение, не отправленное из-за сбоя, возвращается в outbox для повтора,
+                # прерванное остановкой - остается в нем до следующего запуска
+                self._forget([outbox_id for _, _, outbox_id in settled if outbox_id is not None])
+                if finished:
+                    self._release([item[2] for item in batch if item[2] is not None and item not in settled])
+                for _ in batch:
+                    lane.queue.task_done()
+
+    async def _send(self, lane: _Lane, items: List[Tuple[str, float, Optional[int]]],
+                    settled: List[Tuple[str, float, Optional[int]]]):
+        """Отправляет items одним сообщением; в settled попадают доставленные и отклоненные по отдельности"""
+        try:
+            await self._deliver(lane, MERGE_SEPARATOR.join(text for text, _, _ in items))
+        except asyncio.CancelledError:
+            raise
+        except httpx.HTTPStatusError as e:
+            if len(items) > 1 and 400 <= e.response.status_code < 500:
+                # Telegram отклонил объединение (например, из-за разметки одного сигнала):
+                # сигналы отправляются по одному, теряется только отклоненный
+                logger.warning("Merged message rejected in chat %s, sending %s signals separately: %s",
+                               lane.chat_id, len(items), e)
+                for item in items:
+                    await self._send(lane, [item], settled)
+                return
+            self._failed(lane, items, settled, e)
+        except Exception as e:
+            self._failed(lane, items, settled, e)
+        else:
+            settled.extend(items)
+            now = time.monotonic()
+            lane.sent += 1
+            lane.merged += len(items) - 1
+            lane.last_latency = now - items[0][1]
+            lane.max_latency = max(lane.max_latency, lane.last_latency)
+
+    @staticmethod
+    def _failed(lane: _Lane, items: List[Tuple[str, float, Optional[int]]],
+                settled: List[Tuple[str, float, Optional[int]]], error: Exception):
+        lane.failed += len(items)
+        logger.error("All sending attempts failed for chat %s: %s", lane.chat_id, error)
+        if len(items) == 1:
+            settled.extend(items)
+
+    def _forget(self, outbox_ids: List[int]):
+        if not outbox_ids:
+            return
+        try:
+            self.outbox.done(outbox_ids)
+        except sqlite3.Error as e:
+            logger.error("Telegram outbox error: %s", e)
+        self._outbox_ids.difference_update(outbox_ids)
+
+    def _release(self, outbox_ids: List[int]):
+        if not outbox_ids:
+            return
+        try:
+            self.outbox.release(outbox_ids)
+        except sqlite3.Error as e:
+            logger.error("Telegram outbox error: %s", e)
+        self._outbox_ids.difference_update(outbox_ids)
+
+    async def _deliver(self, lane: _Lane, text: str):
+        attempt = 0
+        while attempt < self.max_attempts:
+            await lane.bucket.acquire()
+            await self.global_bucket.acquire()
+            try:
+                response = await TelegramBot.send_once(lane.chat_id, text)
+            except CircuitOpenError as e:
+                # Telegram недоступен: полоса ждет пробного окна, попытка не тратится,
+                # а переполненная очередь отклоняет новые сообщения (обратное давление)
+                await asyncio.sleep(e.retry_in or 1)
+                continue
+            except httpx.TransportError as e:
+                attempt += 1
+                if attempt == self.max_attempts:
+                    raise
+                logger.warning("Attempt %s failed: %s", attempt, str(e))
+                await asyncio.sleep(http_client.backoff_delay(attempt))
+                continue
+            attempt += 1
+
+            if response.status_code == 429:
+                # Ждет только полоса этого чата, остальные продолжают отправку
+                lane.rate_limited += 1
+                retry_after = self._retry_after(response)
+                logger.warning("Rate limited in chat %s. Waiting %s sec", lane.chat_id, retry_after)
+                await asyncio.sleep(retry_after)
+                continue
+
+            response.raise_for_status()
+            return
+
+        raise RuntimeError("rate limit retries exhausted")
+
+    @staticmethod
+    def _retry_after(response: httpx.Response) -> float:
+        try:
+            return float(response.json()["parameters"]["retry_after"])
+        except (ValueError, KeyError, TypeError):
+            pass
+        try:
+            return float(response.headers.get('Retry-After', 5))
+        except ValueError:
+            return 5.0
+
+    def stats(self) -> dict:
+        return {
+            "depth": sum(lane.stats()["depth"] for lane in self._lanes.values()),
+            "outbox": len(self._outbox_ids),
+            "lanes": {chat_id: lane.stats() for chat_id, lane in self._lanes.items()},
+        }
+
+
+telegram_queue = TelegramQueue()
@@ -1,43 +1,175 @@
-#from datetime import datetime
-#from pytz import timezone
-#from app.models import Counter, DailyReport
-#from app.services.telegram import TelegramBot
-#from app.config import Config
-#import logging
-#
-#logger = logging.getLogger(__name__)
-#
-#def get_or_create_counter(db):
-#    counter = db.query(Counter).first()
-#    if not counter:
-#        counter = Counter()
-#        db.add(counter)
-#        db.commit()
-#    return counter
-#
-#def reset_counters(db):
-#    try:
-#        counter = get_or_create_counter(db)
-#        daily_report = DailyReport(
-#            buy_count=counter.buy_count,
-#            sell_count=counter.sell_count
-#        )
-#        db.add(daily_report)
-#
-#        report_date = datetime.now(timezone('Europe/Moscow')).strftime("%Y-%m-%d")
-#        report_msg = (
-#            f"📊 *Daily Trading Report ({report_date})*\n\n"
-#            f"🟢 BUY Count: *{counter.buy_count}*\n"
-#            f"🔴 SELL Count: *{counter.sell_count}*\n\n"
-#            f"Total Trades: *{counter.buy_count + counter.sell_count}*"
-#        )
-#
-#        TelegramBot.send_message(Config.CHAT_ID_REPORTS, report_msg)
-#        logger.info(f"Report sent. Buy: {counter.buy_count}, Sell: {counter.sell_count}")
-#
-#        counter.buy_count = 0
-#        counter.sell_count = 0
-#        db.commit()
-#    except Exception as e:
-#        logger.error(f"Reset counters error: {str(e)}")
-#        raise
\ No newline at end of file
+from datetime import datetime, timedelta, date
+from collections import Counter as Tally
+from typing import Iterable, List, Optional, Tuple
+from pytz import timezone, utc
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
+from app.database import run_in_session
+from app.models import Counter, DailyReport, IntervalResult, Signal
+from app.services.leases import LeaseStore
+from app.services.telegram import telegram_queue
+from app.config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+MOSCOW_TZ = timezone('Europe/Moscow')
+# Срок, за который воркер должен поставить отчет в очередь, иначе его заберет другой
+REPORT_LEASE_TTL = 10 * 60
+
+
+def increment_counter(db, day: date, buy: int = 0, sell: int = 0):
+    """Увеличивает счетчики дня одним UPDATE count = count + n: приращения одновременных
+    сигналов разных воркеров не теряются, как при чтении и записи значения в Python"""
+    increment = update(Counter).where(Counter.day == day).values(
+        buy_count=Counter.buy_count + buy, sell_count=Counter.sell_count + sell
+    )
+    if db.execute(increment).rowcount:
+        return
+    try:
+        with db.begin_nested():
+            db.add(Counter(day=day, buy_count=buy, sell_count=sell))
+    except IntegrityError:
+        # Строку дня одновременно создал другой воркер - увеличиваем ее
+        db.execute(increment)
+
+
+def record_signal(db, symbol: str, action: str, entry_price: float, signal_time: datetime,
+                  sheet_row: Optional[int]) -> int:
+    """Сохраняет сигнал и в той же транзакции увеличивает счетчик дня"""
+    signal = _add_signal(db, symbol, action, entry_price, signal_time, sheet_row)
+    _count_signals(db, [signal_time], [signal.action])
+    db.commit()
+    return signal.id
+
+
+def record_signals(db, signals: Iterable[Tuple[str, str, float, datetime, Optional[int]]]) -> List[int]:
+    """Сохраняет пакет сигналов (символ, действие, цена, время, строка) одной транзакцией"""
+    signals = list(signals)
+    added = [_add_signal(db, *signal) for signal in signals]
+    _count_signals(db, [signal[3] for signal in signals], [signal.action for signal in added])
+    db.commit()
+    return [signal.id for signal in added]
+
+
+def _add_signal(db, symbol: str, action: str, entry_price: float, signal_time: datetime,
+                sheet_row: Optional[int]) -> Signal:
+    signal = Signal(
+        symbol=symbol.upper(),
+        action=action.lower(),
+        entry_price=entry_price,
+        signal_time=signal_time.astimezone(utc).replace(tzinfo=None),
+        sheet_row=sheet_row,
+    )
+    db.add(signal)
+    return signal
+
+
+def _count_signals(db, signal_times: List[datetime], actions: List[str]):
+    """Счетчики дней по московскому времени: один UPDATE на день и действие пакета"""
+    tally = Tally(
+        (signal_time.astimezone(MOSCOW_TZ).date(), action)
+        for signal_time, action in zip(signal_times, actions)
+    )
+    for day in sorted({day for day, _ in tally}):
+        if tally[(day, 'buy')] or tally[(day, 'sell')]:
+            increment_counter(db, day, buy=tally[(day, 'buy')], sell=tally[(day, 'sell')])
+
+
+def record_interval_results(db, results: Iterable[Tuple[int, str, float, float]]):
+    """Сохраняет результаты интервалов (строка листа, интервал, цена, изменение в %)
+    одной транзакцией; повторная запись того же интервала обновляет значение"""
+    recorded_at = datetime.now(utc).replace(tzinfo=None)
+    touched = set()
+    for sheet_row, interval, close_price, change_pct in results:
+        signal_id = db.scalar(
+            select(Signal.id).where(Signal.sheet_row == sheet_row).order_by(Signal.id.desc()).limit(1)
+        )
+        if signal_id is None:
+            continue
+
+        result = db.scalar(
+            select(IntervalResult).where(
+                IntervalResult.signal_id == signal_id, IntervalResult.interval == interval
+            )
+        )
+        if result is None:
+            result = IntervalResult(signal_id=signal_id, interval=interval)
+            db.add(result)
+        result.close_price = close_price
+        result.change_pct = change_pct
+        result.recorded_at = recorded_at
+        touched.add(result)
+    db.flush()
+
+    # Номер изменения берется под блокировкой записи, поэтому растет в порядке фиксации;
+    # новые результаты получают номера по возрастанию id
+    latest = aliased(IntervalResult)
+    next_seq = select(func.coalesce(func.max(latest.seq), 0) + 1).scalar_subquery()
+    for result_id in sorted(result.id for result in touched):
+        db.execute(
+            update(IntervalResult).where(IntervalResult.id == result_id).values(seq=next_seq),
+            execution_options={"synchronize_session": False},
+        )
+    db.commit()
+
+
+def build_daily_report(db, report_date: date) -> str:
+    """Отчет за день по счетчикам (поиск по первичному ключу, без чтения сигналов)"""
+    counter = db.get(Counter, report_date) or Counter(day=report_date, buy_count=0, sell_count=0)
+
+    if db.scalar(select(DailyReport).where(DailyReport.report_date == report_date)) is None:
+        db.add(DailyReport(
+            report_date=report_date,
+            buy_count=counter.buy_count,
+            sell_count=counter.sell_count,
+            created_at=datetime.now(utc).replace(tzinfo=None),
+        ))
+        db.commit()
+
+    return (
+        f"📊 *Daily Trading Report ({report_date.strftime('%Y-%m-%d')})*\n\n"
+        f"🟢 BUY Count: *{counter.buy_count}*\n"
+        f"🔴 SELL Count: *{counter.sell_count}*\n\n"
+        f"Total Trades: *{counter.buy_count + counter.sell_count}*"
+    )
+
+
+async def send_daily_report(report_date: Optional[date] = None, leases: Optional[LeaseStore] = None):
+    """Отправляет отчет за прошедшие сутки в чат отчетов. При нескольких воркерах
+    отчет отправляет тот, кто взял аренду дня; выполненная аренда не истекает"""
+    if report_date is None:
+        report_date = datetime.now(MOSCOW_TZ).date() - timedelta(days=1)
+    lease = f"daily_report:{report_date.isoformat()}"
+    if leases is not None and not leases.acquire(lease, REPORT_LEASE_TTL):
+        logger.info("Report for %s is handled by another worker", report_date)
+        return
+
+    try:
+        report_msg = await run_in_session(build_daily_report, report_date)
+        telegram_queue.enqueue(Config.CHAT_ID_REPORTS, report_msg)
+        if leases is not None:
+            leases.complete(lease)
+        logger.info("Report for %s queued", report_date)
+    except Exception as e:
+        if leases is not None:
+            leases.release(lease)
+        logger.error("Daily report error: %s", str(e))
+
+
+def create_report_scheduler(leases: Optional[LeaseStore] = None) -> AsyncIOScheduler:
+    """Ежедневный отчет в полночь по Москве; запуск в 00:15 подхватывает отчет,
+    если взявший его воркер упал и аренда истекла"""
+    scheduler = AsyncIOScheduler(timezone=MOSCOW_TZ)
+    scheduler.add_job(
+        send_daily_report,
+        CronTrigger(hour=0, minute='0,15', timezone=MOSCOW_TZ),
+        kwargs={"leases": leases},
+        id="daily_report",
+        misfire_grace_time=3600,
+        coalesce=True,
+    )
+    return scheduler
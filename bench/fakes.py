@@ -0,0 +1,213 @@
+"""Локальные заглушки внешних сервисов для бенчмарка: MEXC, CoinMarketCap и Telegram
+отвечают через httpx.MockTransport, Google Sheets подменяется объектом с интерфейсом gspread.
+У каждого сервиса настраиваются задержка, доля ошибок 5xx и лимит запросов с ответом 429"""
+import asyncio
+import random
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import httpx
+
+SERVICES = ('mexc', 'cmc', 'telegram', 'sheets')
+
+SYMBOLS = [
+    'BTC', 'ETH', 'SOL', 'XRP', 'DOGE', 'ADA', 'AVAX', 'LINK', 'DOT', 'TON',
+    'TRX', 'LTC', 'BCH', 'NEAR', 'APT', 'ARB', 'OP', 'SUI', 'PEPE', 'WIF',
+]
+
+
+@dataclass
+class ServiceProfile:
+    """Поведение одного сервиса: задержка (с равномерным разбросом), доля ошибок и лимит в секунду"""
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    rate_limit: Optional[float] = None
+    retry_after: float = 1.0
+
+    def delay(self, rng: random.Random) -> float:
+        return max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter))
+
+
+class _RateWindow:
+    """Счетчик запросов в текущей секунде; сверх лимита сервис отвечает 429"""
+
+    def __init__(self, limit: Optional[float]):
+        self.limit = limit
+        self._second = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if self.limit is None:
+            return True
+        with self._lock:
+            second = int(time.monotonic())
+            if second != self._second:
+                self._second, self._count = second, 0
+            self._count += 1
+            return self._count <= self.limit
+
+
+class FakeServices:
+    """Общий учет вызовов и поведение заглушек"""
+
+    def __init__(self, profiles: Dict[str, ServiceProfile], seed: int = 0):
+        self.profiles = {service: profiles.get(service, ServiceProfile()) for service in SERVICES}
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.rate_limited: Counter = Counter()
+        self._windows = {service: _RateWindow(profile.rate_limit) for service, profile in self.profiles.items()}
+        self._rng = random.Random(seed)
+        self.prices = {symbol: round(self._rng.uniform(0.01, 50000), 4) for symbol in SYMBOLS}
+
+    def _failure(self, service: str) -> Optional[int]:
+        """Статус сбоя для очередного вызова или None"""
+        self.calls[service] += 1
+        if not self._windows[service].allow():
+            self.rate_limited[service] += 1
+            return 429
+        if self._rng.random() < self.profiles[service].error_rate:
+            self.errors[service] += 1
+            return 500
+        return None
+
+    def reset(self):
+        self.calls.clear()
+        self.errors.clear()
+        self.rate_limited.clear()
+
+    # HTTP-сервисы
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self._handle)
+
+    @staticmethod
+    def _service(request: httpx.Request) -> str:
+        host = request.url.host
+        if 'mexc' in host:
+            return 'mexc'
+        if 'coinmarketcap' in host:
+            return 'cmc'
+        if 'telegram' in host:
+            return 'telegram'
+        return 'unknown'
+
+    async def _handle(self, request: httpx.Request) -> httpx.Response:
+        service = self._service(request)
+        if service == 'unknown':
+            return httpx.Response(404)
+
+        profile = self.profiles[service]
+        await asyncio.sleep(profile.delay(self._rng))
+        status = self._failure(service)
+        if status == 429:
+            body = {"ok": False, "parameters": {"retry_after": profile.retry_after}}
+            return httpx.Response(429, json=body, headers={"Retry-After": str(profile.retry_after)})
+        if status is not None:
+            return httpx.Response(status, json={"error": "fake failure"})
+
+        if service == 'mexc':
+            return self._mexc(request)
+        if service == 'cmc':
+            return self._cmc(request)
+        return httpx.Response(200, json={"ok": True, "result": {}})
+
+    def _mexc(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith('/exchangeInfo'):
+            return httpx.Response(200, json={"symbols": [
+                {"symbol": f"{symbol}USDT", "baseAsset": symbol, "quoteAsset": "USDT", "status": "1"}
+                for symbol in self.prices
+            ]})
+        pair = request.url.params.get('symbol')
+        if pair:
+            symbol = pair[:-4] if pair.endswith('USDT') else pair
+            if symbol not in self.prices:
+                return httpx.Response(400, json={"code": -1121, "msg": "Invalid symbol."})
+            return httpx.Response(200, json={"symbol": pair, "price": str(self.prices[symbol])})
+        return httpx.Response(200, json=[
+            {"symbol": f"{symbol}USDT", "price": str(price)} for symbol, price in self.prices.items()
+        ])
+
+    def _cmc(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path.endswith('/map'):
+            start = int(request.url.params.get('start', 1))
+            coins = [
+                {"id": index + 1, "symbol": symbol, "slug": symbol.lower(), "rank": index + 1}
+                for index, symbol in enumerate(SYMBOLS)
+            ]
+            return httpx.Response(200, json={"data": coins[start - 1:]})
+        if path.endswith('/quotes/latest'):
+            ids = request.url.params.get('id')
+            if ids:
+                keys = ids.split(',')
+            else:
+                keys = request.url.params.get('symbol', '').split(',')
+            return httpx.Response(200, json={"data": {
+                key: {"quote": {"USD": {"market_cap": 1e9 + index, "volume_24h": 1e7 + index}}}
+                for index, key in enumerate(keys)
+            }})
+        return httpx.Response(404)
+
+    # Google Sheets
+
+    def worksheet(self, headers: List[str]) -> "FakeWorksheet":
+        return FakeWorksheet(self, headers)
+
+
+class FakeSpreadsheet:
+    def __init__(self, worksheet: "FakeWorksheet"):
+        self.worksheet = worksheet
+
+    def values_batch_update(self, body: dict):
+        self.worksheet.call()
+        return {"totalUpdatedCells": sum(len(entry["values"][0]) for entry in body["data"])}
+
+    def batch_update(self, body: dict):
+        self.worksheet.call()
+        return {}
+
+    def fetch_sheet_metadata(self, params=None):
+        return {"sheets": [{"properties": {"sheetId": 0}, "conditionalFormats": [{}]}]}
+
+
+class FakeWorksheet:
+    """Лист в памяти с синхронными (как в gspread) вызовами и настраиваемой задержкой"""
+    title = 'Sheet1'
+    id = 0
+
+    def __init__(self, services: FakeServices, headers: List[str]):
+        self.services = services
+        self.rows: List[List[object]] = [list(headers)]
+        self.spreadsheet = FakeSpreadsheet(self)
+        self._lock = threading.Lock()
+
+    def call(self):
+        profile = self.services.profiles['sheets']
+        time.sleep(profile.delay(self.services._rng))
+        status = self.services._failure('sheets')
+        if status is not None:
+            raise RuntimeError(f"fake Google Sheets failure {status}")
+
+    def get_all_values(self):
+        return [list(row) for row in self.rows]
+
+    def row_values(self, index: int):
+        return list(self.rows[index - 1]) if index <= len(self.rows) else []
+
+    def append_rows(self, rows, value_input_option=None):
+        self.call()
+        with self._lock:
+            start = len(self.rows) + 1
+            self.rows.extend(list(row) for row in rows)
+        return {"updates": {"updatedRange": f"{self.title}!A{start}:L{start + len(rows) - 1}"}}
+
+    def batch_format(self, formats):
+        self.call()
+
+    def format(self, a1_range, cell_format):
+        self.call()
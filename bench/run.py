@@ -0,0 +1,267 @@
+"""Нагрузочный бенчмарк вебхука без обращений к внешним сервисам.
+
+Запуск из корня репозитория:
+    python bench/run.py --rate 50 --duration 20 --label baseline
+    python bench/run.py --ingest --latency mexc=0.05 --error-rate cmc=0.1 --rate-limit telegram=30
+    python bench/run.py --compare bench/results/a.json bench/results/b.json
+
+Результаты сохраняются в bench/results/<время>-<метка>.json
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = BASE_DIR / "bench" / "results"
+
+# main.py импортирует роутеры как пакет верхнего уровня, остальное - как app.*
+sys.path[:0] = [str(BASE_DIR), str(BASE_DIR / "app")]
+
+# Конфигурация читается при импорте - задаем значения до импорта приложения
+os.environ.setdefault('TOKENTELEGRAM', 'bench-token')
+os.environ.setdefault('CHAT_IDTELEGRAM', '-1001')
+os.environ.setdefault('CHAT_ID_REPORTS', '-1002')
+os.environ.setdefault('COINMARKETCAP_API_KEY', 'bench-key')
+# Снимки, базы и журнал бенчмарка - во временном каталоге, а не в data/ и webhooks.log репозитория:
+# сервисы-синглтоны привязываются к DATA_DIR при импорте
+BENCH_DIR = Path(tempfile.mkdtemp(prefix="bench-"))
+os.environ['DATA_DIR'] = str(BENCH_DIR / "data")
+os.environ['LOG_FILE'] = str(BENCH_DIR / "bench.log")
+
+import httpx  # noqa: E402
+
+from bench.fakes import SERVICES, SYMBOLS, FakeServices, ServiceProfile  # noqa: E402
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def parse_overrides(items: List[str], field: str, profiles: Dict[str, ServiceProfile]):
+    """Аргументы вида service=value, например mexc=0.05"""
+    for item in items or []:
+        service, _, value = item.partition('=')
+        if service not in SERVICES:
+            raise SystemExit(f"Unknown service {service!r}, expected one of {', '.join(SERVICES)}")
+        setattr(profiles.setdefault(service, ServiceProfile()), field, float(value))
+
+
+def make_alert(index: int, duplicate_every: int) -> dict:
+    symbol = SYMBOLS[index % len(SYMBOLS)]
+    alert_id = index - 1 if duplicate_every and index and index % duplicate_every == 0 else index
+    return {
+        "ticker": f"{symbol}USDT",
+        "strategy.order.action": "buy" if index % 2 else "sell",
+        "id": f"bench-{alert_id}",
+    }
+
+
+async def wait_for_ingest(app, timeout: float) -> float:
+    """Ждет, пока фоновые воркеры обработают все принятые алерты; возвращает время ожидания"""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        stats = app.state.ingest.stats()
+        if stats["pending"] == 0 and stats["processing"] == 0:
+            break
+        await asyncio.sleep(0.05)
+    return time.perf_counter() - started
+
+
+async def run_load(args, services: FakeServices) -> dict:
+    from app.config import Config
+    from app.services.http import http_client
+    import main
+
+    logging.getLogger().setLevel(logging.WARNING)
+    Config.INGEST_MODE = args.ingest
+
+    worksheet = services.worksheet(main.COLUMN_HEADERS)
+    main.init_google_sheets = lambda: (object(), worksheet)
+
+    start_http = http_client.start
+
+    async def start_with_fakes(transport=None):
+        await start_http(services.transport())
+
+    http_client.start = start_with_fakes
+
+    app = main.app
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60
+        ) as client:
+
+            async def send(alert: dict):
+                started = time.perf_counter()
+                try:
+                    response = await client.post("/webhook", json=alert)
+                    status = response.status_code
+                except Exception:
+                    status = 0
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+
+            # Прогрев: карта CMC, снимок цен, пулы соединений
+            await send(make_alert(0, 0))
+            if args.ingest:
+                await wait_for_ingest(app, 10)
+            latencies.clear()
+            statuses.clear()
+            services.reset()
+
+            gc.collect()
+            tasks_before = len(asyncio.all_tasks())
+            pending_before = app.state.scheduler.pending
+            tracemalloc.start()
+            memory_before = tracemalloc.get_traced_memory()[0]
+
+            # Открытая модель нагрузки: алерты уходят по расписанию, не дожидаясь ответов
+            total = int(args.rate * args.duration)
+            interval = 1 / args.rate
+            started = time.perf_counter()
+            inflight = []
+            for index in range(1, total + 1):
+                delay = started + index * interval - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                inflight.append(asyncio.create_task(send(make_alert(index, args.duplicate_every))))
+            await asyncio.gather(*inflight)
+            elapsed = time.perf_counter() - started
+            drain = await wait_for_ingest(app, args.drain_timeout) if args.ingest else 0.0
+            await app.state.sheet_writer.flush()
+
+            gc.collect()
+            memory_after = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            pending_after = app.state.scheduler.pending
+            tasks_after = len(asyncio.all_tasks())
+
+    http_client.start = start_http
+    alerts = len(latencies)
+    new_jobs = pending_after - pending_before
+    return {
+        "alerts": alerts,
+        "target_rate": args.rate,
+        "throughput": alerts / (elapsed + drain) if elapsed + drain else 0.0,
+        "elapsed": elapsed,
+        "drain": drain,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "latency_ms": {
+            "p50": percentile(latencies, 50) * 1000,
+            "p95": percentile(latencies, 95) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+            "max": max(latencies, default=0.0) * 1000,
+        },
+        "external_calls": dict(services.calls),
+        "external_calls_per_alert": {
+            service: count / alerts for service, count in services.calls.items()
+        } if alerts else {},
+        "external_errors": dict(services.errors),
+        "rate_limited": dict(services.rate_limited),
+        "pending_interval_jobs": pending_after,
+        "asyncio_tasks": {"before": tasks_before, "after": tasks_after},
+        "memory_growth_bytes": memory_after - memory_before,
+        "memory_per_pending_job": (memory_after - memory_before) / new_jobs if new_jobs > 0 else None,
+    }
+
+
+def save(result: dict, label: str) -> Path:
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    path = RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{label}.json"
+    path.write_text(json.dumps(result, indent=2, ensure_ascii=False))
+    return path
+
+
+def flatten(data: dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(paths: List[str]):
+    """Таблица метрик нескольких прогонов; изменение считается относительно первого"""
+    runs = [json.loads(Path(path).read_text()) for path in paths]
+    flats = [flatten(run["result"]) for run in runs]
+    keys = sorted(set().union(*flats))
+    print(f"{'metric':40}" + "".join(f"{run['label'][:18]:>20}" for run in runs))
+    for key in keys:
+        base = flats[0].get(key)
+        cells = []
+        for flat in flats:
+            value = flat.get(key)
+            if value is None:
+                cells.append(f"{'-':>20}")
+            elif base and flat is not flats[0]:
+                cells.append(f"{value:>12.2f} ({(value - base) / base:+.0%})".rjust(20))
+            else:
+                cells.append(f"{value:>20.2f}")
+        print(f"{key:40}" + "".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline webhook load benchmark")
+    parser.add_argument("--rate", type=float, default=20, help="alerts per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load")
+    parser.add_argument("--ingest", action="store_true", help="fast-ack mode with the ingest queue")
+    parser.add_argument("--duplicate-every", type=int, default=0, help="resend every N-th alert id")
+    parser.add_argument("--drain-timeout", type=float, default=60)
+    parser.add_argument("--latency", nargs="*", metavar="SERVICE=SEC")
+    parser.add_argument("--jitter", nargs="*", metavar="SERVICE=SEC")
+    parser.add_argument("--error-rate", nargs="*", metavar="SERVICE=FRACTION")
+    parser.add_argument("--rate-limit", nargs="*", metavar="SERVICE=PER_SEC")
+    parser.add_argument("--retry-after", nargs="*", metavar="SERVICE=SEC")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--compare", nargs="+", metavar="RESULT_JSON")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.compare)
+        return
+
+    profiles: Dict[str, ServiceProfile] = {}
+    parse_overrides(args.latency, "latency", profiles)
+    parse_overrides(args.jitter, "jitter", profiles)
+    parse_overrides(args.error_rate, "error_rate", profiles)
+    parse_overrides(args.rate_limit, "rate_limit", profiles)
+    parse_overrides(args.retry_after, "retry_after", profiles)
+
+    services = FakeServices(profiles, seed=args.seed)
+    result = asyncio.run(run_load(args, services))
+    print(json.dumps(result, indent=2))
+
+    if not args.no_save:
+        path = save({
+            "label": args.label,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "args": {key: value for key, value in vars(args).items() if key != "compare"},
+            "result": result,
+        }, args.label)
+        print(f"Saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import time
+
+import pytest
+
+from app.services.idempotency import IdempotencyCache
+
+ALERT = {"ticker": "BTCUSDT", "strategy.order.action": "buy"}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = IdempotencyCache(tmp_path / "leases.db", window=60)
+    yield cache
+    cache.close()
+
+
+def test_window_is_anchored_at_first_alert(cache, clock):
+    fingerprint = cache.fingerprint(ALERT)
+    assert cache.claim(fingerprint) == (False, None)
+    cache.complete(fingerprint, {"status": "success"})
+
+    # Повторы внутри окна получают сохраненный ответ и не продлевают окно
+    for _ in range(5):
+        clock[0] += 11
+        assert cache.claim(fingerprint) == (True, {"status": "success"})
+
+    clock[0] += 11  # 66 с от первого алерта
+    assert cache.claim(fingerprint) == (False, None)
+    assert cache.stats()["duplicates"] == 5
+
+
+def test_duplicates_across_bucket_boundary_are_suppressed(cache, clock):
+    clock[0] = 1_700_000_039.0  # за секунду до границы минутной корзины
+    fingerprint = cache.fingerprint(ALERT)
+    assert cache.claim(fingerprint)[0] is False
+    clock[0] += 2
+    assert cache.fingerprint(ALERT) == fingerprint
+    assert cache.claim(fingerprint) == (True, None)
+
+
+def test_release_lets_retry_through(cache, clock):
+    fingerprint = cache.fingerprint(ALERT)
+    cache.claim(fingerprint)
+    cache.release(fingerprint)
+    assert cache.claim(fingerprint) == (False, None)
+
+
+def test_claim_is_shared_between_processes(tmp_path, clock):
+    first = IdempotencyCache(tmp_path / "leases.db", window=60)
+    second = IdempotencyCache(tmp_path / "leases.db", window=60)
+    try:
+        fingerprint = first.fingerprint(ALERT)
+        assert first.claim(fingerprint)[0] is False
+        assert second.claim(fingerprint)[0] is True
+    finally:
+        first.close()
+        second.close()
+
+
+def test_fingerprint_keys():
+    cache = IdempotencyCache("unused.db", window=60)
+    assert cache.fingerprint(ALERT, client_id="abc") == "id:abc"
+    assert cache.fingerprint({**ALERT, "time": "1"}) != cache.fingerprint({**ALERT, "time": "2"})
+    assert cache.fingerprint(ALERT) != cache.fingerprint({**ALERT, "strategy.order.action": "sell"})
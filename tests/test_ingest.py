@@ -0,0 +1,73 @@
+import asyncio
+import sqlite3
+import time
+
+from app.services.ingest import IngestQueue
+
+
+async def _wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        await asyncio.sleep(0.01)
+
+
+def _rows(path):
+    db = sqlite3.connect(str(path))
+    try:
+        return db.execute("SELECT id, status FROM ingest").fetchall()
+    finally:
+        db.close()
+
+
+def test_lease_is_renewed_while_handler_runs(tmp_path):
+    path = tmp_path / "ingest.db"
+    calls = []
+
+    async def slow(payload):
+        calls.append(("slow", payload))
+        await asyncio.sleep(1.0)
+
+    async def other(payload):
+        calls.append(("other", payload))
+
+    async def scenario():
+        first = IngestQueue(path, slow, workers=1, poll_interval=0.05, lease_ttl=0.3)
+        second = IngestQueue(path, other, workers=1, poll_interval=0.05, lease_ttl=0.3)
+        first.put({"n": 1})
+        await first.start()
+        await _wait_for(lambda: calls)
+        # Аренда в 0.3 с истекла бы во время обработки, но первый воркер ее продлевает
+        await second.start()
+        await _wait_for(lambda: first.processed == 1)
+        await second.stop()
+        await first.stop()
+
+    asyncio.run(scenario())
+    assert calls == [("slow", {"n": 1})]
+    assert _rows(path) == []
+
+
+def test_lost_lease_does_not_complete(tmp_path):
+    path = tmp_path / "ingest.db"
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def handler(payload):
+            await release.wait()
+
+        queue = IngestQueue(path, handler, workers=1, poll_interval=0.05, lease_ttl=60)
+        item_id = queue.put({"n": 1})
+        await queue.start()
+        await _wait_for(lambda: queue._inflight)
+        # Аренда истекла, и запись забрал другой воркер со своей арендой
+        queue._db.execute("UPDATE ingest SET lease_until = ? WHERE id = ?", (time.time() + 60, item_id))
+        release.set()
+        await asyncio.sleep(0.1)
+        assert queue.processed == 0
+        await queue.stop()
+        return item_id
+
+    item_id = asyncio.run(scenario())
+    assert _rows(path) == [(item_id, "processing")]
@@ -0,0 +1,40 @@
+import sqlite3
+
+from app.services.idempotency import IdempotencyCache
+from app.services.leases import LeaseStore
+
+
+def _lock(path):
+    # Другой процесс держит запись в общей базе
+    db = sqlite3.connect(str(path), isolation_level=None)
+    db.execute("BEGIN IMMEDIATE")
+    return db
+
+
+def test_lease_acquire_and_takeover(tmp_path):
+    first = LeaseStore(tmp_path / "leases.db", owner="a")
+    second = LeaseStore(tmp_path / "leases.db", owner="b")
+    assert first.acquire("job", ttl=60)
+    assert not second.acquire("job", ttl=60)
+    first.release("job")
+    assert second.acquire("job", ttl=60)
+
+
+def test_busy_database_does_not_block(tmp_path):
+    path = tmp_path / "leases.db"
+    leases = LeaseStore(path, owner="a")
+    cache = IdempotencyCache(path, window=60)
+    fingerprint = cache.fingerprint({"ticker": "BTCUSDT"})
+    cache.claim(fingerprint)
+    lock = _lock(path)
+    try:
+        assert not leases.acquire("job", ttl=60)
+        # Алерт обрабатывается, ответ и освобождение только логируются
+        assert cache.claim(cache.fingerprint({"ticker": "ETHUSDT"})) == (False, None)
+        cache.complete(fingerprint, {"status": "success"})
+        cache.release(fingerprint)
+    finally:
+        lock.rollback()
+        lock.close()
+    assert leases.acquire("job", ttl=60)
+    cache.close()
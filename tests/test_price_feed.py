@@ -0,0 +1,159 @@
+import asyncio
+import json
+import time
+
+from app.services.price_feed import LocalFeedSource, MexcFeedSource, PriceFeed
+
+
+async def _wait_for(condition, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        await asyncio.sleep(0.01)
+
+
+def test_tick_reaches_price_table():
+    async def scenario():
+        source = LocalFeedSource()
+        feed = PriceFeed(source)
+        feed.subscribe("btc")
+        await feed.start()
+        try:
+            await _wait_for(lambda: feed.connected and "BTC" in source.subscribed)
+            source.push("BTC", 65000.5)
+            await _wait_for(lambda: feed.get("BTC") is not None)
+            assert feed.get("BTC", max_age=60) == 65000.5
+            assert feed.stats()["ticks"] == 1
+        finally:
+            await feed.stop()
+
+    asyncio.run(scenario())
+
+
+def test_stale_tick_falls_back():
+    async def scenario():
+        source = LocalFeedSource()
+        feed = PriceFeed(source)
+        feed.subscribe("ETH")
+        await feed.start()
+        try:
+            await _wait_for(lambda: "ETH" in source.subscribed)
+            source.push("ETH", 3000.0, ts=time.time() - 120)
+            await _wait_for(lambda: feed.get("ETH") is not None)
+            # Устаревший тик не отдается - проверка берет цену через REST
+            assert feed.get("ETH", max_age=60) is None
+            # Тик старше уже записанного не перетирает его
+            source.push("ETH", 3100.0)
+            await _wait_for(lambda: feed.get("ETH", max_age=60) is not None)
+            source.push("ETH", 2900.0, ts=time.time() - 30)
+            await asyncio.sleep(0.05)
+            assert feed.get("ETH", max_age=60) == 3100.0
+        finally:
+            await feed.stop()
+
+    asyncio.run(scenario())
+
+
+def test_unsubscribed_symbol_has_no_price():
+    async def scenario():
+        source = LocalFeedSource()
+        feed = PriceFeed(source)
+        feed.subscribe("SOL")
+        await feed.start()
+        try:
+            await _wait_for(lambda: "SOL" in source.subscribed)
+            feed.unsubscribe("SOL")
+            await _wait_for(lambda: "SOL" not in source.subscribed)
+            source.push("SOL", 150.0)
+            await asyncio.sleep(0.05)
+            assert feed.get("SOL") is None
+        finally:
+            await feed.stop()
+
+    asyncio.run(scenario())
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        out.append(byte | (0x80 if value else 0))
+        if not value:
+            return bytes(out)
+
+
+def _field(number: int, value) -> bytes:
+    if isinstance(value, int):
+        return _varint(number << 3) + _varint(value)
+    if isinstance(value, str):
+        value = value.encode()
+    return _varint(number << 3 | 2) + _varint(len(value)) + value
+
+
+def _aggre_deals(pair: str, deals) -> bytes:
+    body = b"".join(
+        _field(1, _field(1, price) + _field(2, "0.5") + _field(3, 1) + _field(4, ts_ms)) for price, ts_ms in deals
+    )
+    return (
+        _field(1, f"spot@public.aggre.deals.v3.api.pb@100ms@{pair}")
+        + _field(3, pair)
+        + _field(5, 1700000000000)
+        + _field(314, body + _field(2, "spot@public.aggre.deals.v3.api.pb@100ms"))
+    )
+
+
+def test_mexc_parse_protobuf_deals():
+    raw = _aggre_deals("BTCUSDT", [("65000.1", 1700000000100), ("65001.2", 1700000000200)])
+    assert MexcFeedSource.parse(raw) == ("BTC", 65001.2, 1700000000.2)
+    # Служебные JSON-ответы на подписку и пары к другим котировкам пропускаются
+    assert MexcFeedSource.parse('{"id":0,"code":0,"msg":"spot@public.aggre.deals.v3.api.pb@100ms@BTCUSDT"}') is None
+    assert MexcFeedSource.parse(_aggre_deals("ETHBTC", [("0.05", 1700000000100)])) is None
+    assert MexcFeedSource.parse(b"\xff\xff") is None
+
+
+class _FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message: str):
+        self.sent.append(json.loads(message))
+
+    async def close(self):
+        pass
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await asyncio.sleep(3600)
+
+
+def test_mexc_subscriptions_split_by_connection():
+    async def scenario():
+        source = MexcFeedSource("wss://example")
+        sockets = []
+
+        async def fake_open():
+            sockets.append(_FakeSocket())
+            source._sockets.append(sockets[-1])
+            source._symbols.append(set())
+            return len(source._sockets) - 1
+
+        source._open = fake_open
+        await source.connect()
+        await source.subscribe([f"C{i}" for i in range(45)])
+        await source.subscribe(["C0", "C45"])
+        assert [len(symbols) for symbols in source._symbols] == [30, 16]
+        assert all(len(message["params"]) <= 30 for socket in sockets for message in socket.sent)
+
+        await source.unsubscribe(["C1", "C40"])
+        assert sockets[0].sent[-1] == {
+            "method": "UNSUBSCRIPTION", "params": ["spot@public.aggre.deals.v3.api.pb@100ms@C1USDT"],
+        }
+        # Освободившееся место в первом соединении занимается раньше, чем открывается новое
+        await source.subscribe(["C46"])
+        assert len(sockets) == 2 and "C46" in source._symbols[0]
+        await source.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,71 @@
+import sqlite3
+
+from app.services.scheduler import INTERVALS, IntervalScheduler
+
+ENTRY_TS = 1_700_000_000.0
+
+
+async def _noop(batch):
+    pass
+
+
+def _scheduler(path, owner, **kwargs):
+    return IntervalScheduler(path / "scheduler.db", _noop, owner=owner, **kwargs)
+
+
+def test_sync_loads_job_after_last_row_deleted(tmp_path):
+    first = _scheduler(tmp_path, "a")
+    second = _scheduler(tmp_path, "b")
+    first.schedule(2, "BTC", 100.0, "buy", ENTRY_TS)
+    last = first.schedule(3, "ETH", 10.0, "buy", ENTRY_TS)
+    second.load()
+
+    # Последняя запись завершена и удалена - ее id не должен достаться новой проверке
+    first._db.execute("DELETE FROM interval_jobs WHERE id = ?", (last.job_id,))
+    new = first.schedule(4, "SOL", 1.0, "sell", ENTRY_TS)
+    assert new.job_id > last.job_id
+
+    second._sync()
+    assert new.job_id in second._known
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    first = _scheduler(tmp_path, "a", lease_ttl=60)
+    second = _scheduler(tmp_path, "b", lease_ttl=60)
+    job = first.schedule(2, "BTC", 100.0, "buy", ENTRY_TS)
+    second.load()
+    now = job.due_at + 1
+
+    assert first._claim([job], now) == [job]
+    # Аренда первого действует - второй откладывает проверку до ее окончания
+    assert second._pop_due(now + 30) == [job]
+    assert second._claim([job], now + 30) == []
+    assert second._heap[0].due_at == now + 60
+
+    assert second._pop_due(now + 61)[0].job_id == job.job_id
+    assert second._claim([job], now + 61) == [job]
+    assert second.taken_over == 1
+    # Первый воркер больше не владеет строкой - его продвижение ничего не меняет
+    first._advance([job])
+    second._advance([job])
+    due_at, interval, owner = second._db.execute(
+        "SELECT due_at, interval, owner FROM interval_jobs WHERE id = ?", (job.job_id,)
+    ).fetchone()
+    assert (due_at, interval, owner) == (ENTRY_TS + INTERVALS[1][1], 1, None)
+
+
+def test_existing_database_is_migrated(tmp_path):
+    db = sqlite3.connect(str(tmp_path / "scheduler.db"))
+    db.execute(
+        "CREATE TABLE interval_jobs (id INTEGER PRIMARY KEY, due_at REAL NOT NULL, row INTEGER NOT NULL,"
+        " symbol TEXT NOT NULL, interval INTEGER NOT NULL, entry_price REAL NOT NULL, action TEXT NOT NULL,"
+        " entry_ts REAL NOT NULL)"
+    )
+    db.execute("INSERT INTO interval_jobs VALUES (7, 1, 2, 'BTC', 0, 100.0, 'buy', 0)")
+    db.commit()
+    db.close()
+
+    scheduler = _scheduler(tmp_path, "a")
+    assert scheduler.load() == 1
+    scheduler._db.execute("DELETE FROM interval_jobs WHERE id = 7")
+    assert scheduler.schedule(3, "ETH", 10.0, "buy", ENTRY_TS).job_id == 8
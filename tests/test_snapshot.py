@@ -0,0 +1,32 @@
+from app.services.coin_map import Coin, CoinMap
+from app.services.symbols import SymbolIndex
+
+
+def test_coin_map_snapshot_round_trip(tmp_path):
+    coins = CoinMap("key", tmp_path / "cmc_map.json.gz")
+    coins._rebuild([Coin(1, "BTC", "bitcoin", 1), Coin(2, "BTC", "fake-bitcoin", None)])
+    coins.fetched_at = 123.0
+    coins.save()
+
+    loaded = CoinMap("key", tmp_path / "cmc_map.json.gz")
+    assert loaded.load()
+    assert (len(loaded), loaded.fetched_at) == (2, 123.0)
+    assert loaded.by_symbol("btc").slug == "bitcoin"
+
+
+def test_symbol_index_snapshot_round_trip(tmp_path):
+    index = SymbolIndex(tmp_path / "mexc_symbols.json.gz")
+    index._rebuild({"BTCUSDT": "BTC", "ETHBTC": "ETH"}, {"BTCUSDT": "USDT", "ETHBTC": "BTC"})
+    index.save()
+
+    loaded = SymbolIndex(tmp_path / "mexc_symbols.json.gz")
+    assert loaded.load()
+    assert loaded.resolve("BINANCE:BTCUSDT.P").pair == "BTCUSDT"
+    assert loaded.resolve("ETHBTC") is None
+
+
+def test_broken_snapshot_is_ignored(tmp_path):
+    path = tmp_path / "mexc_symbols.json.gz"
+    path.write_bytes(b"not gzip")
+    assert not SymbolIndex(path).load()
+    assert not SymbolIndex(tmp_path / "missing.json.gz").load()
@@ -0,0 +1,53 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.models import Signal
+from app.services.stats import SignalStats, fetch_results
+from app.services.trading import record_interval_results
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'signals.db'}")
+    Base.metadata.create_all(bind=engine)
+    with Session(engine) as session:
+        session.add_all([
+            Signal(symbol="BTC", action="buy", entry_price=100.0, signal_time=datetime(2026, 1, 1), sheet_row=2),
+            Signal(symbol="ETH", action="sell", entry_price=10.0, signal_time=datetime(2026, 1, 1), sheet_row=3),
+        ])
+        session.commit()
+        yield session
+    engine.dispose()
+
+
+def _sync(stats: SignalStats, db) -> int:
+    rows = fetch_results(db, stats.last_seq)
+    stats.add_rows(rows)
+    return len(rows)
+
+
+def test_sync_picks_up_rewritten_results(db):
+    stats = SignalStats()
+    record_interval_results(db, [(2, '15m', 101.0, 1.0), (3, '15m', 9.0, -10.0)])
+    assert _sync(stats, db) == 2
+
+    # Повторная запись интервала обновляет строку на месте - статистика видит новое значение
+    record_interval_results(db, [(2, '15m', 103.0, 3.0), (2, '1h', 104.0, 4.0)])
+    assert _sync(stats, db) == 2
+    assert _sync(stats, db) == 0
+    assert len(stats) == 3
+    assert stats.query('15m')['15m']['mean'] == pytest.approx(-3.5)
+    assert stats.query('1h')['1h']['count'] == 1
+
+
+def test_insert_and_rewrite_in_one_chunk(db):
+    stats = SignalStats()
+    record_interval_results(db, [(2, '15m', 101.0, 1.0)])
+    record_interval_results(db, [(2, '15m', 102.0, 2.0)])
+    _sync(stats, db)
+    assert len(stats) == 1
+    assert stats.query('15m')['15m']['mean'] == pytest.approx(2.0)
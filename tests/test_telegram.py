@@ -0,0 +1,66 @@
+import asyncio
+
+import httpx
+
+from app.services import telegram
+from app.services.ingest import Outbox
+from app.services.telegram import MERGE_SEPARATOR, TelegramBot, TelegramQueue
+
+CHAT_ID = "1"
+
+
+def _queue():
+    return TelegramQueue(global_rate=1000, chat_rate=1000, group_rate=1000, merge=True, merge_max=10, workers=1)
+
+
+def _run(tmp_path, monkeypatch, reply, texts):
+    """Отправляет texts одной пачкой (они склеиваются) и возвращает отправленные тексты и outbox"""
+    sent = []
+
+    async def send_once(chat_id, text):
+        sent.append(text)
+        return reply(text)
+
+    monkeypatch.setattr(TelegramBot, "send_once", staticmethod(send_once))
+    monkeypatch.setattr(telegram.http_client, "backoff_delay", lambda attempt: 0)
+    outbox = Outbox(tmp_path / "ingest.db")
+
+    async def scenario():
+        queue = _queue()
+        await queue.start([CHAT_ID], outbox=outbox)
+        for text in texts:
+            queue.enqueue(CHAT_ID, text)
+        await asyncio.wait_for(queue._lanes[CHAT_ID].queue.join(), 5)
+        lane = queue._lanes[CHAT_ID].stats()
+        await queue.stop()
+        return lane
+
+    return sent, asyncio.run(scenario()), outbox
+
+
+def _response(status: int) -> httpx.Response:
+    return httpx.Response(status, json={}, request=httpx.Request("POST", "https://api.telegram.org"))
+
+
+def test_rejected_merge_is_resent_one_by_one(tmp_path, monkeypatch):
+    def reply(text):
+        return _response(400 if MERGE_SEPARATOR in text or text == "bad" else 200)
+
+    sent, lane, outbox = _run(tmp_path, monkeypatch, reply, ["a", "bad", "c"])
+    assert sent == [MERGE_SEPARATOR.join(["a", "bad", "c"]), "a", "bad", "c"]
+    assert (lane["sent"], lane["failed"]) == (2, 1)
+    # Доставленные и отклоненный по отдельности сигналы удалены из outbox
+    assert outbox.pending() == 0
+    outbox.close()
+
+
+def test_failed_merge_stays_in_outbox(tmp_path, monkeypatch):
+    def reply(text):
+        raise httpx.ConnectError("down")
+
+    sent, lane, outbox = _run(tmp_path, monkeypatch, reply, ["a", "b"])
+    assert len(sent) == 3  # max_attempts для одного объединенного сообщения
+    assert lane["failed"] == 2
+    # Ни один сигнал не был ни доставлен, ни отклонен - они ждут повторной отправки
+    assert sorted(text for _, _, text in outbox.claim()) == ["a", "b"]
+    outbox.close()